@@ -0,0 +1,175 @@
+"""
+Microbenchmark de los transforms que codifican JSON (process_document,
+process_stock, process_orders y process_insight) sobre un corpus sintético,
+con cada backend de common/fast_json.py. Muestra filas por segundo por
+transform y el costo de decodificar una página de la API.
+
+Uso: python bench/bench_json.py
+(BENCH_ROWS y BENCH_REPEAT ajustan el tamaño del corpus y las repeticiones)
+"""
+import os
+import sys
+import time
+import logging
+import importlib.util
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+from common import fast_json
+from common.bsale_documents import process_document, JSON_FORMAT, NESTED_FORMAT
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+ROWS = int(os.getenv("BENCH_ROWS", "2000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "5"))
+LINES_PER_DOCUMENT = 8
+
+
+def load_transform(relative_path, name):
+    """Importa `name` desde un script del repo; None si faltan sus dependencias."""
+    path = os.path.join(ROOT, relative_path)
+    try:
+        spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return getattr(module, name)
+    except ImportError as e:
+        logger.warning(f"Se omite {name} ({relative_path}): {e}")
+        return None
+
+
+def synthetic_document(i):
+    details = [
+        {
+            "id": i * 100 + n,
+            "lineNumber": n + 1,
+            "quantity": 2.0,
+            "netUnitValue": 12605.04,
+            "totalUnitValue": 15000.0,
+            "netAmount": 25210.08,
+            "taxAmount": 4789.92,
+            "totalAmount": 30000.0,
+            "netDiscount": 0.0,
+            "totalDiscount": 0.0,
+            "variant": {"id": 5000 + n, "description": f"Polera algodón talla {n}", "code": f"SKU-{i}-{n}"},
+            "note": "Línea con descripción en español: ñandú, acción, canción",
+        }
+        for n in range(LINES_PER_DOCUMENT)
+    ]
+    return {
+        "id": i,
+        "number": 100000 + i,
+        "emissionDate": 1700000000 + i * 60,
+        "expirationDate": 1700000000 + i * 60,
+        "generationDate": 1700000000 + i * 60,
+        "totalAmount": 240000.0,
+        "netAmount": 201680.67,
+        "taxAmount": 38319.33,
+        "exemptAmount": 0.0,
+        "state": 0,
+        "urlPdf": f"https://app.bsale.cl/view/{i}.pdf",
+        "document_type": {"id": 1, "name": "BOLETA ELECTRÓNICA", "code": "39"},
+        "client": {"id": 700 + i % 50, "firstName": "José", "lastName": "Muñoz", "email": "jose@example.cl"},
+        "office": {"id": 3, "name": "Tienda Ñuñoa", "address": "Av. Irarrázaval 1234"},
+        "user": {"id": 9, "firstName": "Vendedor", "lastName": "Peñalolén"},
+        "references": {"count": 1, "items": [{"id": i, "number": str(i), "reason": "Devolución"}]},
+        "document_taxes": {"count": 1, "items": [{"id": i, "totalAmount": 38319.33, "tax": {"id": 1}}]},
+        "details": {"count": LINES_PER_DOCUMENT, "items": details},
+        "sellers": {"count": 1, "items": [{"id": 9, "firstName": "Vendedor"}]},
+        "payments": [{"id": i, "amount": 240000.0, "payment_type": {"id": 1, "name": "Débito"}}],
+    }
+
+
+def synthetic_stock(i):
+    return {
+        "id": i,
+        "quantity": 10.0,
+        "quantityReserved": 1.0,
+        "quantityAvailable": 9.0,
+        "variant": {"id": 5000 + i, "description": "Polera algodón", "code": f"SKU-{i}", "barCode": str(780000 + i)},
+        "office": {"id": 3, "name": "Tienda Ñuñoa"},
+    }
+
+
+def synthetic_order(i):
+    return {
+        "id": i,
+        "name": f"#{1000 + i}",
+        "created_at": "2024-01-01T10:00:00-03:00",
+        "total_price": "29990.00",
+        "discount_codes": [{"code": "VERANO", "amount": "3000.00"}],
+        "payment_gateway_names": ["mercado_pago"],
+        "total_shipping_price_set": {"shop_money": {"amount": "3990.00", "currency_code": "CLP"}},
+        "billing_address": {"city": "Concepción", "address1": "Calle Ñuble 123"},
+        "customer": {"id": 900 + i, "first_name": "María", "last_name": "Núñez"},
+        "shipping_address": {"city": "Concepción", "address1": "Calle Ñuble 123"},
+        "line_items": [{"id": i * 10 + n, "title": "Polera algodón", "quantity": 1, "price": "9990.00"} for n in range(3)],
+    }
+
+
+def synthetic_insight(i):
+    return {
+        "ad_id": str(i),
+        "adset_id": str(i // 10),
+        "campaign_id": str(i // 100),
+        "date_start": "2024-01-01",
+        "ad_name": "Campaña verano — Polera",
+        "impressions": "1200",
+        "spend": "5300.5",
+        "actions": [{"action_type": t, "value": "3"} for t in ("link_click", "purchase", "omni_purchase", "view_content")],
+        "action_values": [{"action_type": t, "value": "29990"} for t in ("purchase", "omni_purchase")],
+    }
+
+
+def best_time(func, rows):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        for row in rows:
+            func(row)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def fast_json_loads(data):
+    # Se resuelve en cada llamada para medir el backend activo
+    return fast_json.loads(data)
+
+
+def main():
+    process_stock = load_transform("bsale/components/stock/stock_masivo_actual.py", "process_stock")
+    process_orders = load_transform("shopify/ordenes_diarias.py", "process_orders")
+    process_insight = load_transform("meta/carga_diaria_meta.py", "process_insight")
+
+    documents = [synthetic_document(i) for i in range(ROWS)]
+    cases = [
+        ("process_document (json)", lambda d: process_document(d, JSON_FORMAT), documents),
+        ("process_document (nested)", lambda d: process_document(d, NESTED_FORMAT), documents),
+    ]
+    if process_stock:
+        cases.append(("process_stock", process_stock, [synthetic_stock(i) for i in range(ROWS)]))
+    if process_orders:
+        # process_orders recibe la lista completa; se mide de a una orden para comparar por fila
+        cases.append(("process_orders", lambda o: process_orders([o]), [synthetic_order(i) for i in range(ROWS)]))
+    if process_insight:
+        cases.append(("process_insight", lambda r: process_insight(r, {}, {}, {}), [synthetic_insight(i) for i in range(ROWS)]))
+
+    # Decodificación: páginas de 50 documentos como las que entrega la API
+    pages = [fast_json.dumps({"count": ROWS, "items": documents[i:i + 50]}).encode("utf-8")
+             for i in range(0, ROWS, 50)]
+
+    print(f"Corpus: {ROWS} filas por transform, mejor de {REPEAT} repeticiones.")
+    print(f"{'transform':<28}" + "".join(f"{backend:>16}" for backend in fast_json.available_backends()))
+    for label, func, rows in cases + [("loads (página de 50 docs)", fast_json_loads, pages)]:
+        results = []
+        for backend in fast_json.available_backends():
+            fast_json.use_backend(backend)
+            elapsed = best_time(func, rows)
+            results.append(f"{len(rows) / elapsed:>12,.0f}/s  ")
+        print(f"{label:<28}" + "".join(f"{result:>16}" for result in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 import os
+import sys
 import requests
 import pandas as pd
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common import bigquery_sink
+from common.touched_variants import record_touched_variants, is_recent
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -82,21 +86,21 @@ def cargar_a_bigquery(df):
     """
     Carga los datos a BigQuery en la tabla especificada.
     """
-    client = bigquery.Client(project=BQ_PROJECT_ID)
-    table_id = f"{BQ_PROJECT_ID}.{BQ_DATASET}.{BQ_TABLE}"
-
-    job_config = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND  # Añade datos sin borrar lo anterior
-    )
+    table_id = bigquery_sink.table_ref(BQ_TABLE, dataset=BQ_DATASET)
 
-    job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-    job.result()
+    # Añade datos sin borrar lo anterior
+    bigquery_sink.append(df, table_id)
     print(f"Datos cargados en {table_id} con {len(df)} registros.")
 
 # Ejecutar extracción y carga a BigQuery
 consumos_data = obtener_consumos()
 
 if consumos_data:
+    # Las variantes consumidas cambiaron de stock: quedan para el refresco dirigido
+    record_touched_variants(
+        "consumo_stock",
+        [registro["variant_id"] for registro in consumos_data if is_recent(registro["consumption_date"])]
+    )
     df_consumo = transformar_a_dataframe(consumos_data)
     cargar_a_bigquery(df_consumo)
 else:
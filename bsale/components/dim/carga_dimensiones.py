@@ -1,10 +1,13 @@
 import os
+import sys
 import requests
 import json
 import logging
 import pandas as pd
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common import bigquery_sink
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -73,17 +76,13 @@ def load_to_bigquery(df, table_name):
         return
 
     try:
-        client = bigquery.Client.from_service_account_json(BIGQUERY_KEY_PATH, project=BIGQUERY_PROJECT_ID)
-        table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{table_name}"
-
-        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
         df.drop_duplicates(inplace=True)
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()
+        bigquery_sink.truncate_replace(df, table_name)
 
-        logger.info(f"✅ Cargados {len(df)} registros a {table_id}.")
+        logger.info(f"✅ Cargados {len(df)} registros a {table_name}.")
     except Exception as e:
         logger.error(f"❌ Error al cargar datos en BigQuery: {e}")
+        raise
 
 def extract_dimensions():
     """ Extrae y carga todas las dimensiones."""
@@ -1,11 +1,14 @@
 import os
+import sys
 import json
 import logging
 import requests
 import pandas as pd
-from google.cloud import bigquery
 from dotenv import load_dotenv
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common import bigquery_sink
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -27,9 +30,8 @@ DESTINATION_TABLE = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.dim_references"
 def fetch_document_ids():
     """ Obtiene los IDs de los documentos desde BigQuery. """
     try:
-        client = bigquery.Client.from_service_account_json(BIGQUERY_KEY_PATH, project=BIGQUERY_PROJECT_ID)
         query = f"SELECT id FROM `{SOURCE_TABLE}`"
-        df = client.query(query).to_dataframe()
+        df = bigquery_sink.query(query).to_dataframe()
         return df["id"].tolist()
     except Exception as e:
         logger.error(f"❌ Error al obtener documentos desde BigQuery: {e}")
@@ -75,15 +77,13 @@ def load_to_bigquery(df):
         return
     
     try:
-        client = bigquery.Client.from_service_account_json(BIGQUERY_KEY_PATH, project=BIGQUERY_PROJECT_ID)
-        job_config = bigquery.LoadJobConfig(write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
         df.drop_duplicates(inplace=True)
-        load_job = client.load_table_from_dataframe(df, DESTINATION_TABLE, job_config=job_config)
-        load_job.result()
+        bigquery_sink.truncate_replace(df, DESTINATION_TABLE)
         
         logger.info(f"✅ Cargados {len(df)} registros a {DESTINATION_TABLE}.")
     except Exception as e:
         logger.error(f"❌ Error al cargar datos en BigQuery: {e}")
+        raise
 
 if __name__ == "__main__":
     process_references()
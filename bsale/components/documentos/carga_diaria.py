@@ -1,14 +1,26 @@
 import os
 import requests
-import json
 import sys
 import time
 import logging
 import pandas as pd
 from dotenv import load_dotenv
-from google.cloud import bigquery
 from datetime import datetime, timedelta
 import pytz  # 📌 Para manejar la zona horaria de Chile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common import bigquery_sink, schemas
+from common.bsale_documents import (
+    JSON_FORMAT, FULL_PROFILE, FINGERPRINT_FIELDS, document_schema, document_table, process_document,
+    document_lines, document_references, document_fingerprint, document_variant_ids, intern_document,
+    profile_expand, profile_columns,
+)
+from common.fingerprint_store import FingerprintStore
+from common.touched_variants import record_touched_variants
+from common.dimension_interner import INTERN_DIMENSIONS, DimensionInterner
+from common.load_pipeline import BackgroundLoader
+from common.bsale_api import RateLimiter, bsale_headers, build_session, get_json, id_ranges
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -29,128 +41,202 @@ ACCESS_TOKEN = os.getenv("BSALE_ACCESS_TOKEN")
 # Configuración de BigQuery
 BIGQUERY_PROJECT_ID = os.getenv("BIGQUERY_PROJECT_ID")
 BIGQUERY_DATASET = os.getenv("BIGQUERY_DATASET")
-BIGQUERY_TABLE = os.getenv("BIGQUERY_TABLE")
 BIGQUERY_KEY_PATH = os.getenv("BIGQUERY_KEY_PATH")
 
+# Formato de ingesta: "json" guarda los objetos anidados como texto, "nested" como STRUCT/ARRAY
+DOCUMENT_FORMAT = os.getenv("BSALE_DOCUMENT_FORMAT", JSON_FORMAT)
+DOCUMENT_SCHEMA = document_schema(DOCUMENT_FORMAT)
+BIGQUERY_TABLE = document_table(DOCUMENT_FORMAT)
+
+# Tablas planas de líneas de detalle y de referencias, escritas junto con los documentos
+LINES_TABLE = os.getenv("BIGQUERY_TABLE_LINES", "bsale_document_lines")
+REFERENCES_TABLE = os.getenv("BIGQUERY_TABLE_REFERENCES", "bsale_document_references")
+
 # Tamaño del batch para enviar datos a BigQuery
 BATCH_SIZE = 500  
 
-# 📌 Zona horaria de Chile
-CHILE_TZ = pytz.timezone("America/Santiago")
+# Bsale impone un límite máximo de 50 documentos por página
+PAGE_LIMIT = 50
 
-def fetch_existing_ids_from_bigquery():
-    """
-    Obtiene los IDs de los documentos ya existentes en BigQuery para evitar duplicados.
-    """
-    try:
-        client = bigquery.Client.from_service_account_json(BIGQUERY_KEY_PATH, project=BIGQUERY_PROJECT_ID)
-        table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
+# Páginas que se descargan en paralelo (comparten el limitador de tasa de Bsale)
+MAX_WORKERS = int(os.getenv("BSALE_DIARIA_WORKERS", "4"))
 
-        query = f"SELECT id FROM `{table_id}`"
-        result = client.query(query).result()
+# Días por ventana de emissiondaterange; 0 consulta el rango completo en una sola ventana
+SHARD_DAYS = float(os.getenv("BSALE_DIARIA_SHARD_DAYS", "1"))
 
-        existing_ids = {row.id for row in result}  # Convierte la consulta en un conjunto de IDs
-        logger.info(f" Se encontraron {len(existing_ids)} documentos ya existentes en BigQuery.")
-        return existing_ids
-    except Exception as e:
-        logger.error(f" Error al consultar BigQuery para verificar duplicados: {e}")
-        return set()
+# Perfil de expand (common/bsale_documents.py): "full" pide todos los objetos,
+# "sales-lines" solo los que usan los modelos de venta
+EXPAND_PROFILE = os.getenv("BSALE_EXPAND_PROFILE", FULL_PROFILE)
 
-def load_to_bigquery(df):
-    """
-    Carga un DataFrame a BigQuery en lotes para evitar duplicados.
-    """
-    if df.empty:
-        logger.info(" No hay datos nuevos para cargar en BigQuery.")
-        return
+# Objetos que se expanden en cada documento
+DOCUMENT_EXPAND = profile_expand(EXPAND_PROFILE)
 
-    try:
-        client = bigquery.Client.from_service_account_json(BIGQUERY_KEY_PATH, project=BIGQUERY_PROJECT_ID)
-        table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
+# Modo de ejecución: "window" carga los últimos días, "reconcile" solo recarga documentos modificados
+DIARIA_MODE = os.getenv("BSALE_DIARIA_MODE", "window")
 
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Anexar datos
-            autodetect=True  # Inferir esquema automáticamente
-        )
+# Días que carga el modo "window" (y que quedan con fingerprint en el almacén)
+WINDOW_DAYS = 3
 
-        # Eliminar duplicados antes de cargar
-        df.drop_duplicates(subset=["id"], inplace=True)
+# Días que revisa la reconciliación. Por defecto, la ventana diaria: es la que tiene
+# fingerprints. Con más días, los documentos sin fingerprint se siembran con el listado
+RECONCILE_DAYS = int(os.getenv("BSALE_RECONCILE_DAYS", str(WINDOW_DAYS)))
 
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()  # Espera a que termine la carga
+# Ids sin cambios que se aceptan entre dos documentos modificados para pedirlos en una
+# misma consulta por rango (firstid/lastid); los documentos de más se descartan
+RECONCILE_MAX_GAP = int(os.getenv("BSALE_RECONCILE_MAX_GAP", "20"))
 
-        logger.info(f" Cargados {len(df)} registros nuevos a BigQuery en la tabla {table_id}.")
-    except Exception as e:
-        logger.error(f" Error al cargar datos en BigQuery: {e}")
-
-def fetch_all_pages(base_url, headers):
-    """
-    Descarga datos paginados desde Bsale usando expand y offset en el endpoint de documents.
-    """
-    session = requests.Session()
-    all_items = []
-    offset = 0
-    limit = 50  # Bsale impone un límite máximo de 50
+# Documentos por página en las consultas por rango (el límite de 50 no aplica con target beta)
+RANGE_PAGE_LIMIT = 500
 
-    while True:
-        try:
-            url = f"{base_url}&offset={offset}&limit={limit}"
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            items = data.get('items', [])
-            all_items.extend(items)
-
-            logger.info(f" Procesado offset {offset}: {len(items)} documentos encontrados.")
+# Almacén local con el fingerprint de cada documento cargado
+FINGERPRINTS_PATH = os.getenv(
+    "BSALE_DOCUMENTS_FINGERPRINTS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprints_documentos.sqlite")
+)
 
-            if len(items) < limit:
-                break  # Si no hay más documentos, salimos del loop
+# 📌 Zona horaria de Chile
+CHILE_TZ = pytz.timezone("America/Santiago")
 
-            offset += limit  # Avanzar al siguiente conjunto de documentos
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error al obtener datos: {e}")
-            break
+# Tablas que se actualizan con staging + MERGE: (tabla final, esquema declarado, clave).
+# Las tablas planas van primero y los documentos al final.
+def merge_targets():
+    return (
+        (LINES_TABLE, "bsale_document_lines", ["document_id", "detail_id"]),
+        (REFERENCES_TABLE, "bsale_document_references", ["document_id", "reference_id"]),
+        (BIGQUERY_TABLE, DOCUMENT_SCHEMA, "id"),
+    )
 
-    return all_items
+def staging_table_name(table_name, run_id):
+    """Tabla de staging propia de la ejecución `run_id`."""
+    return f"{table_name}_staging_{run_id}"
 
-def process_document(document_data):
+def load_to_staging(df, lines, references, run_id):
     """
-    Procesa un documento de Bsale y lo estructura para BigQuery.
+    Anexa un lote de documentos, con sus líneas de detalle y referencias, a las
+    tablas de staging de la ejecución. Se ejecuta en segundo plano y lanza una
+    excepción si la carga falla.
     """
     try:
-        final_structure = {
-            "id": document_data.get("id"),
-            "emissionDate": document_data.get("emissionDate"),
-            "expirationDate": document_data.get("expirationDate"),
-            "generationDate": document_data.get("generationDate"),
-            "number": document_data.get("number"),
-            "totalAmount": document_data.get("totalAmount"),
-            "netAmount": document_data.get("netAmount"),
-            "taxAmount": document_data.get("taxAmount"),
-            "state": document_data.get("state"),
-            "document_type": json.dumps(document_data.get("document_type", {}), ensure_ascii=False),
-            "client": json.dumps(document_data.get("client", {}), ensure_ascii=False),
-            "office": json.dumps(document_data.get("office", {}), ensure_ascii=False),
-            "user": json.dumps(document_data.get("user", {}), ensure_ascii=False),
-            "references": json.dumps(document_data.get("references", []), ensure_ascii=False),
-            "document_taxes": json.dumps(document_data.get("document_taxes", []), ensure_ascii=False),
-            "details": json.dumps(document_data.get("details", []), ensure_ascii=False),
-            "sellers": json.dumps(document_data.get("sellers", []), ensure_ascii=False),
-            "payments": json.dumps(document_data.get("payments", []), ensure_ascii=False),
-        }
-        return final_structure
+        for rows, (table_name, schema_name, key) in zip((lines, references, df), merge_targets()):
+            if len(rows) == 0:
+                continue
+            batch_df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+            # Validar contra el esquema declarado y anexar sin inferencia
+            table = schemas.to_arrow_table(schema_name, batch_df.drop_duplicates(subset=key))
+            staging_table = staging_table_name(table_name, run_id)
+            bigquery_sink.append(table, staging_table, schema=schemas.bigquery_schema(schema_name))
+            logger.info(f" Cargados {table.num_rows} registros en el staging {staging_table}.")
     except Exception as e:
-        logger.error(f"❌ Error al procesar el documento ID {document_data.get('id')}: {e}")
-        return None
+        logger.error(f" Error al cargar datos en BigQuery: {e}")
+        raise
 
-def extract_data(days_back=3):
+def merge_staged(run_id, staged_tables, emission_dates):
     """
-    Extrae documentos desde Bsale en un rango de fechas determinado usando expand.
+    Ejecuta el MERGE de cada staging de la ejecución sobre su tabla final y borra
+    los staging. El MERGE se restringe al rango de emissionDate de la ventana
+    cargada, así que solo lee esa porción de la tabla final y no todo el historial.
+    En las líneas y referencias, las filas de un documento recargado que ya no
+    vienen en él (por ejemplo una línea eliminada al editarlo) se borran.
+    """
+    target_filter = None
+    if emission_dates:
+        target_filter = f"T.emissionDate BETWEEN {int(min(emission_dates))} AND {int(max(emission_dates))}"
+    document_staging = bigquery_sink.table_ref(staging_table_name(BIGQUERY_TABLE, run_id))
+    try:
+        for table_name, schema_name, key in merge_targets():
+            if table_name not in staged_tables:
+                continue
+            # Alcance del borrado: los documentos del staging, también los que quedaron sin líneas.
+            # Lleva el mismo rango de emissionDate que el ON: la rama NOT MATCHED BY SOURCE
+            # no hereda el filtro del ON y sin él recorrería toda la tabla
+            delete_filter = None
+            if schema_name != DOCUMENT_SCHEMA and BIGQUERY_TABLE in staged_tables:
+                delete_filter = f"T.document_id IN (SELECT id FROM `{document_staging}`)"
+                if target_filter:
+                    delete_filter = f"{target_filter} AND {delete_filter}"
+            # En documentos solo se actualizan las columnas del perfil de expand, para que
+            # una carga con un perfil reducido no borre los objetos de una carga "full"
+            update_columns = profile_columns(EXPAND_PROFILE) if schema_name == DOCUMENT_SCHEMA else None
+            bigquery_sink.merge(
+                staging_table_name(table_name, run_id), table_name,
+                schemas.column_names(schema_name), key=key, target_filter=target_filter,
+                update_columns=update_columns, delete_filter=delete_filter,
+                **schemas.table_layout(schema_name)
+            )
+    finally:
+        for table_name in staged_tables:
+            bigquery_sink.drop_table(staging_table_name(table_name, run_id))
+
+def date_shards(start_utc, end_utc, shard_days=SHARD_DAYS):
+    """
+    Divide el rango [start_utc, end_utc] en ventanas contiguas de `shard_days`
+    días (0 = una sola ventana) para consultarlas en paralelo.
+    """
+    if shard_days <= 0:
+        return [(start_utc, end_utc)]
+    step = int(shard_days * 24 * 60 * 60)
+    return [(t, min(t + step - 1, end_utc)) for t in range(start_utc, end_utc + 1, step)]
+
+def fetch_page(base_url, offset, headers, session, limiter):
+    """Descarga una página de documentos; lanza la excepción si falla tras los reintentos."""
+    url = f"{base_url}&offset={offset}&limit={PAGE_LIMIT}"
+    return get_json(session, url, headers, limiter)
+
+def fetch_all_pages(base_urls, headers, max_workers=MAX_WORKERS):
+    """
+    Descarga todas las páginas de cada URL base (una por ventana de fechas).
+    La primera página de cada ventana entrega el `count` total; con él se piden
+    en paralelo los offsets restantes. Todas las llamadas comparten un mismo
+    limitador de tasa y pool de conexiones. Los documentos se devuelven en el
+    orden de ventana y offset.
+
+    Si alguna página falla tras los reintentos se lanza RuntimeError con las
+    páginas fallidas después de esperar a las demás, antes de cargar nada: una
+    ventana incompleta no debe terminar como una ejecución exitosa.
     """
+    limiter = RateLimiter()
+    pages = []  # (base_url, offset, future) en orden
+
+    with build_session(pool_size=max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        first_pages = [
+            (base_url, executor.submit(fetch_page, base_url, 0, headers, session, limiter))
+            for base_url in base_urls
+        ]
+        for base_url, future in first_pages:
+            pages.append((base_url, 0, future))
+            try:
+                count = future.result().get("count", 0)
+            except requests.exceptions.RequestException:
+                continue  # El error se registra al recorrer las páginas
+            offsets = range(PAGE_LIMIT, count, PAGE_LIMIT)
+            logger.info(f" Ventana con {count} documentos: se piden {len(offsets)} páginas adicionales.")
+            for offset in offsets:
+                pages.append((base_url, offset, executor.submit(fetch_page, base_url, offset, headers, session, limiter)))
+
+        all_items = []
+        failed_pages = []
+        for base_url, offset, future in pages:
+            try:
+                items = future.result().get('items', [])
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al obtener datos (offset {offset}) de {base_url}: {e}")
+                failed_pages.append((base_url, offset))
+                continue
+            all_items.extend(items)
+            logger.info(f" Procesado offset {offset}: {len(items)} documentos encontrados.")
+
+    if failed_pages:
+        raise RuntimeError(
+            f"Fallaron {len(failed_pages)} de {len(pages)} páginas de documentos; no se carga una ventana "
+            f"incompleta: {failed_pages}"
+        )
+    return all_items
+
+def window_bounds(days_back):
+    """Rango [inicio, fin] en timestamps UTC de los últimos `days_back` días (hora de Chile)."""
     # 📌 Obtener la fecha actual en Chile
     now_chile = datetime.now(CHILE_TZ)
-    
+
     # 📌 Calcular el rango de fechas en la zona horaria de Chile
     start_date_chile = now_chile - timedelta(days=days_back + 1)
     end_date_chile = now_chile
@@ -161,45 +247,232 @@ def extract_data(days_back=3):
 
     logger.info(f" Iniciando extracción de documentos desde {start_date_chile} hasta {end_date_chile} (Hora Chile)")
     logger.info(f" Convertido a timestamps UTC: {start_date_utc} - {end_date_utc}")
+    return start_date_utc, end_date_utc
 
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': ACCESS_TOKEN
-    }
+def document_urls(start_utc, end_utc, query):
+    """Una URL de documents.json por ventana de fechas; todas se descargan en paralelo."""
+    return [
+        "https://api.bsale.cl/v1/documents.json"
+        f"?emissiondaterange=[{shard_start},{shard_end}]"
+        f"&{query}"
+        for shard_start, shard_end in date_shards(start_utc, end_utc)
+    ]
 
-    base_url = (
+def fetch_documents_by_id(document_ids, headers, max_workers=MAX_WORKERS):
+    """
+    Descarga individualmente (con expand) los documentos indicados, en paralelo
+    y bajo el mismo limitador de tasa. Los que fallan se registran y se omiten.
+    """
+    limiter = RateLimiter()
+    documents = []
+    with build_session(pool_size=max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            (doc_id, executor.submit(
+                get_json, session,
+                f"https://api.bsale.cl/v1/documents/{doc_id}.json?expand={DOCUMENT_EXPAND}",
+                headers, limiter
+            ))
+            for doc_id in document_ids
+        ]
+        for doc_id, future in futures:
+            try:
+                documents.append(future.result())
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al obtener el documento {doc_id}: {e}")
+    return documents
+
+def fetch_range(firstid, lastid, headers, session, limiter):
+    """Descarga con expand todos los documentos del rango de ids [firstid, lastid], siguiendo `next`."""
+    url = (
         "https://api.bsale.cl/v1/documents.json"
-        f"?emissiondaterange=[{start_date_utc},{end_date_utc}]"
-        "&expand=document_type,client,office,user,details,references,document_taxes,sellers,payments"
+        f"?firstid={firstid}&lastid={lastid}&order=none&limit={RANGE_PAGE_LIMIT}"
+        f"&expand={DOCUMENT_EXPAND}"
     )
+    documents = []
+    while url:
+        data = get_json(session, url, headers, limiter)
+        documents.extend(data.get("items", []))
+        url = data.get("next")
+    return documents
+
+def fetch_documents_by_range(document_ids, max_workers=MAX_WORKERS):
+    """
+    Descarga con expand los documentos indicados agrupándolos en rangos de ids
+    (common/bsale_api.id_ranges) en vez de un GET por documento. Los rangos se
+    piden en paralelo bajo el mismo limitador de tasa; los documentos que no se
+    pidieron se descartan y los que falten al final se piden individualmente.
+    """
+    wanted = set(document_ids)
+    ranges = id_ranges(wanted, max_gap=RECONCILE_MAX_GAP, max_span=RANGE_PAGE_LIMIT)
+    # Las consultas por firstid/lastid requieren `target: beta`
+    headers = bsale_headers(ACCESS_TOKEN)
+    limiter = RateLimiter()
+    documents = {}
+    with build_session(pool_size=max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            ((firstid, lastid), executor.submit(fetch_range, firstid, lastid, headers, session, limiter))
+            for firstid, lastid in ranges
+        ]
+        for (firstid, lastid), future in futures:
+            try:
+                for doc in future.result():
+                    if doc.get("id") in wanted:
+                        documents[doc["id"]] = doc
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error al obtener el rango de documentos {firstid}-{lastid}: {e}")
+
+    missing = [doc_id for doc_id in document_ids if doc_id not in documents]
+    logger.info(
+        f" {len(documents)}/{len(wanted)} documentos obtenidos con {len(ranges)} consultas por rango; "
+        f"{len(missing)} se piden individualmente."
+    )
+    recovered = fetch_documents_by_id(missing, bsale_headers(ACCESS_TOKEN, beta=False)) if missing else []
+    return list(documents.values()) + recovered
 
-    # 🔍 Obtener IDs existentes en BigQuery antes de cargar
-    existing_ids = fetch_existing_ids_from_bigquery()
+def load_documents(all_documents):
+    """
+    Carga los documentos (con sus líneas y referencias) en el staging de la
+    ejecución y hace el MERGE final. Con BSALE_INTERN_DIMENSIONS los documentos
+    guardan solo las referencias de sus objetos, que se cargan antes del MERGE
+    en las tablas de dimensión. Devuelve los documentos efectivamente cargados.
+    """
+    # Staging propio de esta ejecución; al final se hace MERGE por id, así que los
+    # documentos ya cargados se actualizan (p. ej. anulaciones) en vez de saltarse
+    run_id = datetime.now(pytz.utc).strftime("%Y%m%d%H%M%S")
+    staged_tables = set()
+    seen_ids = set()
+    emission_dates = []
+    loaded_documents = []
 
-    all_documents = fetch_all_pages(base_url, headers)
-    
     buffer = []
-    new_documents = 0
+    line_buffer = []
+    reference_buffer = []
+    interner = DimensionInterner("bsale_documents") if INTERN_DIMENSIONS else None
+
+    # Los lotes se cargan en segundo plano mientras se siguen procesando documentos
+    loader = BackgroundLoader(name="bsale_documents")
+
+    def submit_batch():
+        for rows, (table_name, _, _) in zip((line_buffer, reference_buffer, buffer), merge_targets()):
+            if rows:
+                staged_tables.add(table_name)
+        loader.submit(
+            load_to_staging, pd.DataFrame(buffer), line_buffer, reference_buffer, run_id,
+            description=f"{len(buffer)} documentos"
+        )
 
     for doc in all_documents:
-        if doc.get("id") in existing_ids:
-            continue  # Si el documento ya existe en BigQuery, lo saltamos
+        # La paginación por offset puede repetir documentos; el MERGE exige ids únicos
+        if doc.get("id") in seen_ids:
+            continue
+        seen_ids.add(doc.get("id"))
 
-        processed_doc = process_document(doc)
+        row_document = intern_document(doc, interner.objects, EXPAND_PROFILE) if interner is not None else doc
+        processed_doc = process_document(row_document, DOCUMENT_FORMAT, EXPAND_PROFILE)
         if processed_doc:
             buffer.append(processed_doc)
-            new_documents += 1
+            line_buffer.extend(document_lines(doc))
+            reference_buffer.extend(document_references(doc))
+            if doc.get("emissionDate") is not None:
+                emission_dates.append(doc["emissionDate"])
+            loaded_documents.append(doc)
 
         if len(buffer) >= BATCH_SIZE:
-            df = pd.DataFrame(buffer)
-            load_to_bigquery(df)
+            submit_batch()
             buffer = []
+            line_buffer = []
+            reference_buffer = []
 
     if buffer:
-        df = pd.DataFrame(buffer)
-        load_to_bigquery(df)
+        submit_batch()
+
+    # Esperar y verificar todas las cargas al staging, y cargar las dimensiones, antes del MERGE
+    try:
+        loader.wait_all()
+        if interner is not None:
+            interner.load()
+    except Exception:
+        for table_name in staged_tables:
+            bigquery_sink.drop_table(staging_table_name(table_name, run_id))
+        raise
+
+    if staged_tables:
+        merge_staged(run_id, staged_tables, emission_dates)
+    return loaded_documents
+
+def record_fingerprints(documents):
+    """Guarda el fingerprint de los documentos cargados, para la reconciliación."""
+    store = FingerprintStore(FINGERPRINTS_PATH)
+    try:
+        store.update({doc["id"]: document_fingerprint(doc) for doc in documents})
+    finally:
+        store.close()
+
+def record_variants(documents):
+    """Registra las variantes de los documentos cargados para el refresco dirigido de stock."""
+    record_touched_variants(
+        "carga_diaria", [variant_id for doc in documents for variant_id in document_variant_ids(doc)]
+    )
+
+def extract_data(days_back=WINDOW_DAYS):
+    """
+    Extrae documentos desde Bsale en un rango de fechas determinado usando expand.
+    """
+    start_date_utc, end_date_utc = window_bounds(days_back)
+    headers = bsale_headers(ACCESS_TOKEN, beta=False)
+
+    all_documents = fetch_all_pages(document_urls(start_date_utc, end_date_utc, f"expand={DOCUMENT_EXPAND}"), headers)
+    loaded_documents = load_documents(all_documents)
+    record_fingerprints(loaded_documents)
+    record_variants(loaded_documents)
+
+    logger.info(f" Extracción y carga completada. Total documentos procesados: {len(loaded_documents)}")
+
+def reconcile_documents(days_back=RECONCILE_DAYS):
+    """
+    Pasada liviana de reconciliación: lista solo los campos de cabecera de los
+    documentos de los últimos `days_back` días (sin expand), compara su
+    fingerprint con el almacén local y vuelve a descargar completos, por rangos
+    de ids, y a cargar con MERGE solo los documentos que cambiaron (anulaciones,
+    cambios de estado, etc.).
+
+    Los documentos que no tienen fingerprint (cargados por carga_masiva o fuera
+    de la ventana diaria) no se pueden comparar: se siembran con el fingerprint
+    del listado y se revisan desde la próxima pasada, en vez de recargarlos todos.
+    """
+    start_date_utc, end_date_utc = window_bounds(days_back)
+    headers = bsale_headers(ACCESS_TOKEN, beta=False)
+
+    fields = ",".join(FINGERPRINT_FIELDS)
+    headers_only = fetch_all_pages(document_urls(start_date_utc, end_date_utc, f"fields=[{fields}]"), headers)
+    fingerprints = {doc["id"]: document_fingerprint(doc) for doc in headers_only if doc.get("id") is not None}
+
+    store = FingerprintStore(FINGERPRINTS_PATH)
+    try:
+        stored = store.stored(fingerprints)
+        unseen = {doc_id: value for doc_id, value in fingerprints.items() if doc_id not in stored}
+        if unseen:
+            store.update(unseen)
+        changed_ids = [doc_id for doc_id, value in stored.items() if value != fingerprints[doc_id]]
+    finally:
+        store.close()
+    logger.info(
+        f" Reconciliación: {len(changed_ids)} de {len(fingerprints)} documentos cambiaron desde la última carga "
+        f"({len(unseen)} sin fingerprint previo se sembraron con el listado)."
+    )
+
+    if not changed_ids:
+        return
+
+    changed_documents = fetch_documents_by_range(changed_ids)
+    loaded_documents = load_documents(changed_documents)
+    record_fingerprints(loaded_documents)
+    record_variants(loaded_documents)
 
-    logger.info(f" Extracción y carga completada. Total documentos procesados: {new_documents}")
+    logger.info(f" Reconciliación completada. Documentos recargados: {len(loaded_documents)}")
 
 if __name__ == "__main__":
-    extract_data(days_back=3)
+    if DIARIA_MODE == "reconcile":
+        reconcile_documents()
+    else:
+        extract_data()
@@ -1,14 +1,29 @@
 import os
+import sys
 import requests
-import json
 import time
 import logging
-import pandas as pd
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from dotenv import load_dotenv
-from google.cloud import bigquery
 import random
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common.bsale_api import RateLimiter, bsale_headers, build_session, get_json, iter_json_items, id_ranges
+from common import bigquery_sink, schemas
+from common.bsale_documents import (
+    JSON_FORMAT, NESTED_FORMAT, FULL_PROFILE, document_schema, document_table, document_batches,
+    profile_expand,
+)
+from common.arrow_buffer import ArrowBatchBuilder
+from common.dimension_interner import INTERN_DIMENSIONS, DimensionInterner
+from common.transform_pool import TransformPool, resolve_processes
+from common.load_pipeline import MAX_LOADS_IN_FLIGHT
+from common.pipeline import Pipeline
+from common.interval_manifest import IntervalManifest, FETCHED, LOADED, FAILED
+from common.interval_stats import IntervalObservation, IntervalStats, adapt_ranges
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -19,19 +34,72 @@ logger = logging.getLogger(__name__)
 # Token de acceso
 ACCESS_TOKEN = os.getenv("BSALE_ACCESS_TOKEN")
 
-# Función para cargar masivamente el DataFrame a BigQuery
-def load_to_bigquery_masivo(df):
+# Número de intervalos que se descargan en paralelo
+MAX_WORKERS = int(os.getenv("BSALE_MAX_WORKERS", "4"))
+
+# Concurrencia máxima al pedir individualmente documentos que siguen faltando
+RECOVERY_WORKERS = int(os.getenv("BSALE_RECOVERY_WORKERS", "4"))
+
+# Páginas de detalle que se piden en paralelo dentro de cada intervalo
+DETAIL_WORKERS = int(os.getenv("BSALE_DETAIL_WORKERS", "4"))
+
+# Perfil de expand (common/bsale_documents.py): "full" pide todos los objetos,
+# "sales-lines" solo los que usan los modelos de venta
+EXPAND_PROFILE = os.getenv("BSALE_EXPAND_PROFILE", FULL_PROFILE)
+
+# Objetos que se expanden en cada documento
+DOCUMENT_EXPAND = profile_expand(EXPAND_PROFILE)
+
+# Modo de carga: "full" recorre todos los intervalos, "tail" solo los posteriores al mayor id cargado
+CARGA_MODE = os.getenv("BSALE_CARGA_MODE", "full")
+
+# Tamaño (en bytes, sin comprimir) a partir del cual se envía el Parquet acumulado a BigQuery
+FLUSH_BYTES = int(os.getenv("BSALE_FLUSH_MB", "256")) * 1024 * 1024
+
+# Formato de ingesta: "json" guarda los objetos anidados como texto, "nested" como STRUCT/ARRAY
+DOCUMENT_FORMAT = os.getenv("BSALE_DOCUMENT_FORMAT", JSON_FORMAT)
+DOCUMENT_SCHEMA = document_schema(DOCUMENT_FORMAT)
+
+# Esquema columnar de cada fila de `process_document` (declarado en common/schemas.py)
+DOCUMENT_ARROW_SCHEMA = schemas.arrow_schema(DOCUMENT_SCHEMA)
+
+# Procesos que arman las filas y los batches columnares ("auto": núcleos - 1; "0": en el hilo de descarga)
+TRANSFORM_PROCESSES = resolve_processes(os.getenv("BSALE_TRANSFORM_PROCESSES", "auto"))
+
+# Documentos por tarea del pool de transformación
+TRANSFORM_CHUNK = int(os.getenv("BSALE_TRANSFORM_CHUNK", "250"))
+
+# Tablas planas de líneas de detalle y de referencias, escritas junto con los documentos
+LINES_TABLE = os.getenv("BIGQUERY_TABLE_LINES", "bsale_document_lines")
+REFERENCES_TABLE = os.getenv("BIGQUERY_TABLE_REFERENCES", "bsale_document_references")
+
+# Último id cargado sin huecos (opcional, para revisión manual; el manifiesto es la fuente de verdad)
+LAST_ID_PATH = "last_id.txt"
+
+# Manifiesto local con el estado de cada intervalo (permite reanudar la carga).
+# Cada formato escribe en su propia tabla, así que lleva su propio manifiesto.
+MANIFEST_PATH = os.getenv(
+    "BSALE_DOCUMENTS_MANIFEST",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "manifest_documentos_nested.sqlite" if DOCUMENT_FORMAT == NESTED_FORMAT else "manifest_documentos.sqlite"
+    )
+)
+
+# Función para cargar masivamente un archivo Parquet a BigQuery
+def load_to_bigquery_masivo(parquet_path, num_rows):
     """
-    Carga el DataFrame `df` en una tabla de BigQuery.
+    Carga el archivo Parquet `parquet_path` en una tabla de BigQuery.
     Ajusta el project, dataset y table_name según tu configuración.
     Si la tabla no existe, se crea automáticamente.
+    Se ejecuta en segundo plano y lanza una excepción si la carga falla.
     """
     try:
         # Obtener variables de entorno
         key_path = os.getenv("BIGQUERY_KEY_PATH")
         project_id = os.getenv("BIGQUERY_PROJECT_ID")
         dataset_id = os.getenv("BIGQUERY_DATASET")
-        table_name = os.getenv("BIGQUERY_TABLE")
+        table_name = document_table(DOCUMENT_FORMAT)
 
         # Verificar que las variables están cargadas
         if not key_path:
@@ -41,29 +109,105 @@ def load_to_bigquery_masivo(df):
         if not dataset_id:
             logger.error("BIGQUERY_DATASET no está definido en las variables de entorno.")
         if not table_name:
-            logger.error("BIGQUERY_TABLE no está definido en las variables de entorno.")
+            logger.error("La tabla de documentos (BIGQUERY_TABLE) no está definida en las variables de entorno.")
 
         if not all([key_path, project_id, dataset_id, table_name]):
-            logger.error("Faltan variables de entorno para BigQuery. Verifica tu archivo .env.")
-            return
-
-        # Crear el cliente de BigQuery usando el archivo de credenciales
-        client = bigquery.Client.from_service_account_json(key_path, project=project_id)
-        table_id = f"{project_id}.{dataset_id}.{table_name}"
-
-        # Configurar el job de carga: WRITE_APPEND y crear la tabla si no existe
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-            autodetect=True,
-            create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED
-        )
-
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()  # Espera a que termine la carga
+            raise RuntimeError("Faltan variables de entorno para BigQuery. Verifica tu archivo .env.")
 
-        logger.info(f"Se cargaron {len(df)} registros a BigQuery en la tabla {table_id}.")
+        # WRITE_APPEND con el esquema declarado; la tabla se crea si no existe
+        bigquery_sink.append(parquet_path, table_name, schema=schemas.bigquery_schema(DOCUMENT_SCHEMA))
+        logger.info(f"Se cargaron {num_rows} registros a BigQuery en la tabla {table_name}.")
     except Exception as e:
         logger.error(f"Error al cargar datos en BigQuery: {e}")
+        raise
+    finally:
+        os.remove(parquet_path)
+
+def load_parquet_table(parquet_path, num_rows, table_name, schema_name):
+    """
+    Anexa un archivo Parquet a `table_name` con el esquema declarado `schema_name`.
+    """
+    try:
+        bigquery_sink.append(parquet_path, table_name, schema=schemas.bigquery_schema(schema_name))
+        logger.info(f"Se cargaron {num_rows} registros a BigQuery en la tabla {table_name}.")
+    finally:
+        os.remove(parquet_path)
+
+def ensure_document_tables():
+    """
+    Crea las tablas finales con su partición y clustering por emissionDate
+    (common/schemas.py) si todavía no existen; las cargas WRITE_APPEND las
+    crearían sin partición.
+    """
+    tables = (
+        (LINES_TABLE, "bsale_document_lines"),
+        (REFERENCES_TABLE, "bsale_document_references"),
+        (document_table(DOCUMENT_FORMAT), DOCUMENT_SCHEMA),
+    )
+    for table_name, schema_name in tables:
+        bigquery_sink.ensure_table(
+            table_name, schemas.bigquery_schema(schema_name), **schemas.table_layout(schema_name)
+        )
+
+def load_batch_files(document_file, line_file, reference_file):
+    """
+    Carga los Parquet de un lote. Las líneas y referencias van primero y los
+    documentos al final, de modo que un lote solo cuenta como cargado cuando
+    las tres tablas lo tienen. Cada argumento es (ruta, filas) o None.
+    """
+    try:
+        if line_file:
+            load_parquet_table(*line_file, LINES_TABLE, "bsale_document_lines")
+        if reference_file:
+            load_parquet_table(*reference_file, REFERENCES_TABLE, "bsale_document_references")
+        if document_file:
+            load_to_bigquery_masivo(*document_file)
+    finally:
+        # Si una carga falla, los archivos que no alcanzaron a cargarse se descartan
+        for finished in (document_file, line_file, reference_file):
+            if finished and os.path.exists(finished[0]):
+                os.remove(finished[0])
+
+def load_interval_batch(job, manifest, last_id_lock, last_id_path=LAST_ID_PATH):
+    """
+    Carga los Parquet de un lote (intervalos, documentos, líneas, referencias),
+    confirma sus intervalos en el manifiesto y actualiza `last_id_path`.
+
+    Varias cargas corren en paralelo y terminan en cualquier orden, así que no
+    hay un único escritor ordenado: el orden lo garantiza el manifiesto.
+    `last_id_path` guarda `manifest.loaded_through()`, el último id del prefijo
+    contiguo de intervalos cargados, y no avanza más allá de un lote que falló
+    o sigue en vuelo aunque lotes posteriores ya estén en BigQuery. Si la carga
+    falla, los intervalos quedan como 'fetched' y se reprocesan en la próxima
+    ejecución.
+    """
+    intervals_in_file, document_file, line_file, reference_file = job
+    if document_file or line_file or reference_file:
+        num_rows = document_file[1] if document_file else 0
+        logger.info(f"Cargando {num_rows} documentos (IDs {intervals_in_file[0]} en adelante).")
+        load_batch_files(document_file, line_file, reference_file)
+    manifest.mark_many(intervals_in_file, LOADED)
+    logger.info(f"Confirmados {len(intervals_in_file)} intervalos en BigQuery.")
+
+    with last_id_lock:
+        loaded_through = manifest.loaded_through()
+        if loaded_through is not None:
+            with open(last_id_path, 'w') as f:
+                f.write(str(loaded_through))
+
+def fetch_max_loaded_id():
+    """
+    Obtiene el mayor `id` de documento ya cargado en la tabla de BigQuery.
+    """
+    try:
+        table_id = bigquery_sink.table_ref(document_table(DOCUMENT_FORMAT))
+        result = bigquery_sink.query(f"SELECT MAX(id) AS max_id FROM `{table_id}`")
+        max_id = next(iter(result)).max_id
+        logger.info(f"Mayor id de documento en {table_id}: {max_id}")
+        return max_id
+    except Exception as e:
+        logger.error(f"Error al consultar el mayor id cargado en BigQuery: {e}")
+        return None
 
 def get_document_intervals(cursorlength=500):
     """
@@ -102,196 +246,428 @@ def get_document_intervals(cursorlength=500):
     logger.error(f"No se pudo obtener los intervalos después de {max_retries} intentos.")
     return []
 
-def process_document(document_data):
+def fetch_all_pages(url, headers, session, limiter, observation=None):
+    """Entrega uno a uno los items de todas las páginas, decodificándolos en streaming."""
+    while url:
+        meta = {}
+        yield from iter_json_items(session, url, headers, limiter, observation=observation, meta=meta)
+        url = meta.get('next')
+
+def detail_page_urls(details_field):
     """
-    Procesa un documento ya expandido, listo para cargar en BigQuery.
+    URLs de las páginas de detalle que faltan de un documento. Con `count` y
+    `limit` se generan todos los offsets de una vez a partir del enlace `next`;
+    si no vienen, se devuelve solo `next` y se sigue la paginación en serie.
     """
-    try:
-        final_structure = {
-            "id": document_data.get("id"),
-            "emissionDate": document_data.get("emissionDate"),
-            "expirationDate": document_data.get("expirationDate"),
-            "generationDate": document_data.get("generationDate"),
-            "number": document_data.get("number"),
-            "totalAmount": document_data.get("totalAmount"),
-            "netAmount": document_data.get("netAmount"),
-            "taxAmount": document_data.get("taxAmount"),
-            "state": document_data.get("state"),
-            "document_type": json.dumps(document_data.get("document_type", {}), ensure_ascii=False),
-            "client": json.dumps(document_data.get("client", {}), ensure_ascii=False),
-            "office": json.dumps(document_data.get("office", {}), ensure_ascii=False),
-            "user": json.dumps(document_data.get("user", {}), ensure_ascii=False),
-            "references": json.dumps(document_data.get("references", []), ensure_ascii=False),
-            "document_taxes": json.dumps(document_data.get("document_taxes", []), ensure_ascii=False),
-            "details": json.dumps(document_data.get("details", []), ensure_ascii=False),
-            "sellers": json.dumps(document_data.get("sellers", []), ensure_ascii=False),
-            "payments": json.dumps(document_data.get("payments", []), ensure_ascii=False),
-        }
-        return final_structure
-    except Exception as e:
-        logger.error(f"Error al procesar el documento ID {document_data.get('id')}: {e}")
-        return None
+    next_url = details_field.get('next')
+    if not next_url:
+        return []
+    count = details_field.get('count')
+    limit = details_field.get('limit') or len(details_field.get('items', []))
+    parts = urlsplit(next_url)
+    query = dict(parse_qsl(parts.query))
+    if not count or not limit or 'offset' not in query:
+        return [next_url]
+    urls = []
+    for offset in range(int(query['offset']), count, limit):
+        query.update(offset=str(offset), limit=str(limit))
+        urls.append(urlunsplit(parts._replace(query=urlencode(query))))
+    return urls
+
+def fetch_detail_page(url, headers, session, limiter, observation=None, follow_next=False):
+    """Una página de detalles; si `follow_next`, sigue también los `next` siguientes."""
+    if follow_next:
+        return list(fetch_all_pages(url, headers, session, limiter, observation))
+    return get_json(session, url, headers, limiter, observation=observation).get('items', [])
+
+def expand_interval_details(documents, headers, session, limiter, observation=None):
+    """
+    Completa los detalles paginados de todos los documentos de un intervalo.
+    Las páginas pendientes de todos los documentos se piden en paralelo
+    (DETAIL_WORKERS) por el pool de conexiones compartido y luego se vuelven a
+    unir a cada documento en orden de offset, así el documento más largo no
+    marca la duración del intervalo.
+    """
+    pages = []  # (índice del documento, url, seguir next)
+    for idx, doc in enumerate(documents):
+        details = doc.get("details")
+        if isinstance(details, dict):
+            urls = detail_page_urls(details)
+            # La última página sigue `next` por si el documento creció mientras se descargaba
+            pages.extend((idx, url, position == len(urls) - 1) for position, url in enumerate(urls))
+    if not pages:
+        return documents
+
+    with ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as executor:
+        futures = [
+            (idx, executor.submit(fetch_detail_page, url, headers, session, limiter, observation, follow_next))
+            for idx, url, follow_next in pages
+        ]
+        extra_items = {}
+        for idx, future in futures:
+            extra_items.setdefault(idx, []).extend(future.result())
+
+    # Se conserva la forma {"count", "items", ...} que espera raw_document ('$.items')
+    for idx, items in extra_items.items():
+        details = documents[idx]["details"]
+        details["items"] = details.get('items', []) + items
+        details.pop('next', None)
+    if observation:
+        observation.record_detail_pages(len(pages))
+    logger.info(f"Se completaron {len(pages)} páginas de detalle de {len(extra_items)} documentos en paralelo.")
+    return documents
+
+def group_contiguous_ids(ids):
+    """
+    Agrupa ids en rangos contiguos: {1, 2, 3, 7, 9, 10} -> [(1, 3), (7, 7), (9, 10)].
+    """
+    return id_ranges(ids)
 
-def fetch_all_pages(url, headers, session):
-    all_items = []
-    while url:
-        response = session.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        all_items.extend(data.get('items', []))
-        url = data.get('next')
-    return all_items
-
-def fetch_all_detail_pages(url, headers, session):
-    # Similar a fetch_all_pages, pero específico para detalles
-    return fetch_all_pages(url, headers, session)
-
-def expand_document_details(document, headers, session):
+def fetch_single_document(doc_id, headers, session, limiter):
+    url_single = f'https://api.bsale.cl/v1/documents/{doc_id}.json?expand={DOCUMENT_EXPAND}'
+    return get_json(session, url_single, headers, limiter)
+
+def recover_missing_documents(missing_ids, headers, session, limiter):
     """
-    Asegura que el campo 'details' contenga todos los items, 
-    expandiendo la paginación si es necesario.
+    Recupera documentos faltantes de un intervalo. Primero se consultan los ids
+    agrupados en sub-rangos contiguos con firstid/lastid; los que sigan faltando
+    se piden uno a uno con concurrencia acotada (RECOVERY_WORKERS).
+    Registra cuántas peticiones se ahorraron frente a un GET por id.
     """
-    details_field = document.get("details", [])
-    if isinstance(details_field, dict):
-        all_details = details_field.get('items', [])
-        next_url = details_field.get('next')
-        if next_url:
-            more_details = fetch_all_pages(next_url, headers, session)
-            all_details.extend(more_details)
-        document['details'] = all_details
-    return document
-
-def extract_data_with_expand(start_interval=0):
-    headers_documents = {
-        'Content-Type': 'application/json',
-        'access_token': ACCESS_TOKEN,
-        'target': 'beta'
-    }
+    recovered = []
+    requests_made = 0
+
+    for firstid, lastid in group_contiguous_ids(missing_ids):
+        url = (
+            f'https://api.bsale.cl/v1/documents.json'
+            f'?firstid={firstid}&lastid={lastid}&order=none&limit=500'
+            f'&expand={DOCUMENT_EXPAND}'
+        )
+        try:
+            while url:
+                data = get_json(session, url, headers, limiter)
+                requests_made += 1
+                recovered.extend(data.get('items', []))
+                url = data.get('next')
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error al recuperar el rango {firstid}-{lastid}: {e}")
+
+    still_missing = set(missing_ids) - {doc.get("id") for doc in recovered}
+    if still_missing:
+        logger.warning(f"Siguen faltando {len(still_missing)} documentos tras la consulta por rangos: {sorted(still_missing)}. Se pedirán individualmente.")
+        with ThreadPoolExecutor(max_workers=RECOVERY_WORKERS) as executor:
+            futures = {
+                executor.submit(fetch_single_document, doc_id, headers, session, limiter): doc_id
+                for doc_id in still_missing
+            }
+            for future in as_completed(futures):
+                requests_made += 1
+                try:
+                    recovered.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error al obtener el documento con id {futures[future]} individualmente: {e}")
+
+    saved = len(missing_ids) - requests_made
+    logger.info(
+        f"Recuperados {len(recovered)}/{len(missing_ids)} documentos faltantes con {requests_made} peticiones "
+        f"({saved} peticiones ahorradas frente a un GET por id)."
+    )
+    return recovered
+
+def fetch_interval_documents(firstid, lastid, headers, session, limiter, transform_pool, open_ended=False):
+    """
+    Descarga todos los documentos de un intervalo, recupera los faltantes y
+    expande los detalles paginados. Se ejecuta dentro de un worker del pool.
+    Si `open_ended`, el intervalo es el último del modo tail: se pide sin
+    `lastid` y se pagina hasta agotar la API, ya que el cursor cuenta registros
+    y no ids; los ids posteriores al mayor obtenido aún no existen, por lo que
+    no se consideran faltantes.
+
+    Las páginas se decodifican en streaming y los documentos completos se
+    envían de a TRANSFORM_CHUNK a `transform_pool`, así el worker no guarda ni
+    el texto de la respuesta ni los documentos decodificados; solo retiene los
+    que esperan páginas de detalle. Devuelve (futures de batches columnares
+    (documentos, líneas, referencias, objetos internados), mayor id obtenido,
+    observación del intervalo).
+    """
+    observation = IntervalObservation(firstid, lastid)
+    id_range = f'firstid={firstid}' if open_ended else f'firstid={firstid}&lastid={lastid}'
+    url = (
+        f'https://api.bsale.cl/v1/documents.json'
+        f'?{id_range}&order=none&limit=500'
+        f'&expand={DOCUMENT_EXPAND}'
+    )
+
+    batches = []
+    chunk = []
+    pending_details = []  # Documentos con detalles paginados por completar
+    fetched_ids = set()
+
+    def transform(document):
+        nonlocal chunk
+        if document is not None:
+            chunk.append(document)
+        if chunk and (document is None or len(chunk) >= TRANSFORM_CHUNK):
+            batches.append(transform_pool.submit(
+                document_batches, chunk, DOCUMENT_FORMAT, EXPAND_PROFILE, INTERN_DIMENSIONS
+            ))
+            chunk = []
+
+    def collect(documents):
+        for document in documents:
+            fetched_ids.add(document.get("id"))
+            details = document.get("details")
+            if isinstance(details, dict) and details.get('next'):
+                pending_details.append(document)
+                continue
+            transform(document)
+
+    # Descargar todos los documentos del intervalo
+    collect(fetch_all_pages(url, headers, session, limiter, observation))
+
+    # Verificar que se hayan obtenido todos los IDs esperados en el intervalo
+    known_ids = {doc_id for doc_id in fetched_ids if doc_id is not None}
+    if open_ended:
+        lastid = max(known_ids, default=firstid - 1)
+        observation.lastid = max(lastid, firstid)
+    expected_ids = set(range(firstid, lastid + 1))
+    missing_ids = expected_ids - fetched_ids
+    if missing_ids:
+        logger.warning(f"Intervalo {firstid}-{lastid}: faltan {len(missing_ids)} documentos. Se intentará recuperarlos por rangos.")
+        collect(recover_missing_documents(missing_ids, headers, session, limiter))
+
+    # Completar en paralelo los detalles paginados de todos los documentos del intervalo
+    for document in expand_interval_details(pending_details, headers, session, limiter, observation):
+        transform(document)
+    transform(None)
+
+    max_doc_id = max((doc_id for doc_id in fetched_ids if doc_id is not None), default=None)
+    return batches, max_doc_id, observation.finish(len(fetched_ids))
+
+def tail_intervals(intervals, max_id, cursorlength=500):
+    """
+    Intervalos con documentos posteriores a `max_id`. El primero se recorta para
+    empezar en `max_id + 1` y siempre termina con un intervalo abierto desde el
+    último cursor (o desde `max_id + 1`, si ya se cargó más allá), que se
+    descarga sin `lastid` (ver `fetch_interval_documents`). `cursorlength` cuenta
+    registros, no ids, así que su `lastid` es solo nominal.
+    """
+    boundaries = [interval['id'] for interval in intervals]
+    ranges = [(boundaries[i], boundaries[i + 1] - 1) for i in range(len(boundaries) - 1)]
+    ranges = [(max(firstid, max_id + 1), lastid) for firstid, lastid in ranges if lastid > max_id]
+    open_firstid = max(boundaries[-1], max_id + 1)
+    ranges.append((open_firstid, open_firstid + cursorlength - 1))
+    return ranges
+
+def plan_intervals(manifest, start_interval=0, only_failed=False, mode="full", stats=None):
+    """
+    Decide qué intervalos procesar. Si el manifiesto tiene trabajo sin terminar
+    se reanuda desde ahí (o solo los fallidos si `only_failed`); si no, se
+    consulta la lista de intervalos a Bsale. En modo "full" se reinicia el
+    manifiesto; en modo "tail" solo se agregan los intervalos posteriores al
+    mayor id ya cargado (según el manifiesto o, si está vacío, BigQuery).
+    Los intervalos nuevos se redimensionan con las estadísticas de corridas
+    anteriores (`stats`), salvo el intervalo abierto final del modo tail.
+    """
+    if only_failed:
+        ranges = manifest.ranges(states=(FAILED,))
+        logger.info(f"Reintentando {len(ranges)} intervalos fallidos según el manifiesto.")
+        return ranges
+
+    unfinished = manifest.unfinished()
+    if unfinished:
+        logger.info(f"Reanudando carga desde el manifiesto: {len(unfinished)} intervalos pendientes. Estado: {manifest.summary()}")
+        return unfinished
+
+    if mode == "tail":
+        max_id = manifest.max_loaded_id()
+        if max_id is None:
+            max_id = fetch_max_loaded_id()
+        if max_id is None:
+            logger.error("No se pudo determinar el mayor id cargado; no se ejecuta la carga incremental.")
+            return []
 
     intervals = get_document_intervals(cursorlength=500)
     if not intervals:
         logger.error("No se pudieron obtener los intervalos de documentos.")
-        return
+        return []
+
+    if mode == "tail":
+        ranges = tail_intervals(intervals, max_id, cursorlength=500)
+        if stats is not None and ranges:
+            ranges = adapt_ranges(ranges[:-1], stats.observations()) + ranges[-1:]
+        logger.info(f"Modo tail: {len(ranges)} intervalos con documentos posteriores al id {max_id}.")
+        manifest.add(ranges, open_last=True)
+        return ranges
 
     if start_interval >= len(intervals) - 1:
         logger.error(f"El intervalo de inicio {start_interval} es mayor o igual al número total de intervalos {len(intervals) - 1}.")
-        return
+        return []
 
-    total_intervals = len(intervals) - 1
-    interval_counter = start_interval
-    buffer = []
-    batch_size = 20000
+    # Verifica si el cálculo de lastid es correcto según la documentación
+    ranges = [(intervals[i]['id'], intervals[i + 1]['id'] - 1) for i in range(start_interval, len(intervals) - 1)]
+    if stats is not None:
+        ranges = adapt_ranges(ranges, stats.observations())
+    manifest.reset(ranges)
+    return ranges
+
+def extract_data_with_expand(start_interval=0, max_workers=MAX_WORKERS, only_failed=False, mode=CARGA_MODE):
+    """
+    Descarga, transforma y carga los intervalos de documentos en un pipeline
+    (common/pipeline.py) de tres etapas unidas por colas acotadas:
+
+    - fetch: `max_workers` hilos que descargan intervalos compartiendo un mismo
+      presupuesto de llamadas y envían los documentos al pool de transformación.
+    - transform: un hilo que reúne los batches columnares en los Parquet del
+      lote y, al superar FLUSH_BYTES, entrega el lote a la etapa de carga.
+    - load: hasta MAX_LOADS_IN_FLIGHT cargas a BigQuery en paralelo; al
+      confirmar un lote marca sus intervalos como cargados en el manifiesto
+      (ver `load_interval_batch`).
+
+    Con varias cargas en vuelo los lotes se confirman fuera de orden: no hay un
+    único escritor ordenado y el orden lo garantiza el manifiesto, que es la
+    fuente de verdad para reanudar y para last_id.txt (`manifest.loaded_through()`).
+    Un intervalo que falla al descargarse queda como 'failed' y una carga que
+    falla deja sus intervalos como 'fetched'; en ambos casos se reprocesan en
+    la próxima ejecución y la corrida termina con error si alguna carga falló.
+    """
+    headers_documents = bsale_headers(ACCESS_TOKEN)
+
+    manifest = IntervalManifest(MANIFEST_PATH)
+    # Las estadísticas viven en el mismo archivo que el manifiesto, pero no se reinician con él
+    stats = IntervalStats(MANIFEST_PATH)
+    ranges = plan_intervals(manifest, start_interval=start_interval, only_failed=only_failed, mode=mode, stats=stats)
+    if not ranges:
+        manifest.close()
+        stats.close()
+        return
+    ensure_document_tables()
+
+    total_intervals = len(ranges)
+    # Intervalo abierto del modo tail, según el manifiesto (también al reanudar)
+    open_intervals = manifest.open_ended()
+    interval_counter = 0
+    buffer = ArrowBatchBuilder(DOCUMENT_ARROW_SCHEMA, prefix="bsale_documents_")
+    line_buffer = ArrowBatchBuilder(schemas.arrow_schema("bsale_document_lines"), prefix="bsale_document_lines_")
+    reference_buffer = ArrowBatchBuilder(schemas.arrow_schema("bsale_document_references"), prefix="bsale_document_references_")
+    buffered_intervals = []  # firstid de los intervalos cuyo contenido está en el buffer
     start_time = time.time()
     failed_intervals = []  # Para almacenar intervalos que fallaron
+    job_files = []  # Parquet entregados a la etapa load; la carga los elimina al terminar
+    last_id_lock = threading.Lock()  # Las cargas en vuelo escriben last_id.txt de a una
+    # Objetos repetidos de los documentos (BSALE_INTERN_DIMENSIONS), uno por id
+    interner = DimensionInterner("bsale_documents") if INTERN_DIMENSIONS else None
+
+    limiter = RateLimiter()
+    logger.info(f"Descargando intervalos con {max_workers} workers en paralelo.")
+
+    def fetch(interval):
+        """Etapa fetch: descarga un intervalo; los errores de Bsale se entregan como resultado."""
+        firstid, lastid = interval
+        # El último intervalo del modo tail queda abierto: sus ids finales todavía no existen
+        open_ended = firstid in open_intervals
+        try:
+            batches, max_doc_id, observation = fetch_interval_documents(
+                firstid, lastid, headers_documents, session, limiter, transform_pool, open_ended
+            )
+            return firstid, lastid, batches, max_doc_id, observation, None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError: respuesta JSON inválida o cortada
+            return firstid, lastid, None, None, None, e
+
+    def batch_job():
+        """Cierra los Parquet del lote actual y arma el trabajo de carga, o None si está vacío."""
+        nonlocal buffered_intervals
+        intervals_in_file = buffered_intervals
+        buffered_intervals = []
+        if not intervals_in_file:
+            return None
+        files = (buffer.finish(), line_buffer.finish(), reference_buffer.finish())
+        job_files.extend(finished[0] for finished in files if finished)
+        return (intervals_in_file,) + files
+
+    def transform(result):
+        """Etapa transform: agrega los batches del intervalo al lote y decide cuándo cargarlo."""
+        nonlocal interval_counter
+        firstid, lastid, batches, max_doc_id, observation, error = result
+        interval_counter += 1
+        logger.info(f"Procesando intervalo {interval_counter}/{total_intervals}: IDs del {firstid} al {lastid}.")
+
+        if error is None:
+            stats.record(observation)
+            try:
+                # Esperar los batches columnares que arma el pool de transformación
+                batches = [batch.result() for batch in batches]
+            except ValueError as e:
+                error = e
+        if error is not None:
+            logger.error(f"Error al obtener documentos del intervalo {firstid}-{lastid}: {error}")
+            failed_intervals.append((firstid, lastid))
+            manifest.mark(firstid, FAILED, error=str(error))
+            return None
+
+        # Agregar al buffer los batches ya transformados, en el orden del intervalo
+        row_count = 0
+        for document_batch, line_batch, reference_batch, objects in batches:
+            buffer.append_batch(document_batch)
+            line_buffer.append_batch(line_batch)
+            reference_buffer.append_batch(reference_batch)
+            if interner is not None:
+                interner.update(objects)
+            row_count += document_batch.num_rows
+        logger.info(f"Procesados {row_count} documentos del intervalo.")
+
+        manifest.mark(firstid, FETCHED, row_count=row_count, max_doc_id=max_doc_id)
+        buffered_intervals.append(firstid)
+
+        elapsed_time = time.time() - start_time
+        estimated_total_time = (elapsed_time / interval_counter) * total_intervals
+        estimated_time_left = estimated_total_time - elapsed_time
+        logger.info(f"Tiempo transcurrido: {elapsed_time:.2f}s, tiempo estimado restante: {estimated_time_left:.2f}s.")
+        logger.info(f"Documentos en el buffer después del intervalo {interval_counter}: {buffer.num_rows}")
+
+        # Solo se carga en límites de intervalo para que ninguno quede a medias en BigQuery
+        if buffer.nbytes + line_buffer.nbytes + reference_buffer.nbytes >= FLUSH_BYTES:
+            return batch_job()
+        return None
 
-    with requests.Session() as session:
-        for i in range(start_interval, len(intervals) - 1):
-            interval_counter += 1
-            firstid = intervals[i]['id']
-            lastid = intervals[i + 1]['id'] - 1  # Verifica si este cálculo es correcto según la documentación
-
-            logger.info(f"Procesando intervalo {interval_counter}/{total_intervals}: IDs del {firstid} al {lastid}.")
-
-            success = False
-            for attempt in range(5):
-                try:
-                    url = (
-                        f'https://api.bsale.cl/v1/documents.json'
-                        f'?firstid={firstid}&lastid={lastid}&order=none&limit=500'
-                        f'&expand=document_type,client,office,user,details,references,document_taxes,sellers,payments'
-                    )
-
-                    # Descargar todos los documentos del intervalo
-                    documents = fetch_all_pages(url, headers_documents, session)
-                    logger.info(f"Procesando {len(documents)} documentos del intervalo.")
-
-                    # Verificar que se hayan obtenido todos los IDs esperados en el intervalo
-                    fetched_ids = {doc.get("id") for doc in documents}
-                    expected_ids = set(range(firstid, lastid + 1))
-                    missing_ids = expected_ids - fetched_ids
-                    if missing_ids:
-                        logger.warning(f"Intervalo {firstid}-{lastid}: faltan documentos con IDs: {sorted(missing_ids)}. Se intentará obtenerlos individualmente.")
-                        for missing_id in missing_ids:
-                            try:
-                                url_single = (
-                                    f'https://api.bsale.cl/v1/documents/{missing_id}.json'
-                                    f'?expand=document_type,client,office,user,details,references,document_taxes,sellers,payments'
-                                )
-                                response_single = session.get(url_single, headers=headers_documents, timeout=30)
-                                response_single.raise_for_status()
-                                single_doc = response_single.json()
-
-                                # Asegurar que si tiene detalles paginados, los expandimos
-                                if isinstance(single_doc.get("details"), dict) and single_doc["details"].get("next"):
-                                    single_doc = expand_document_details(single_doc, headers_documents, session)
-
-                                documents.append(single_doc)
-                            except Exception as e:
-                                logger.error(f"Error al obtener el documento con id {missing_id} individualmente: {e}")
-
-                    # Actualizar directamente en la lista aquellos documentos que tengan detalles paginados
-                    for idx, doc in enumerate(documents):
-                        details = doc.get("details")
-                        if isinstance(details, dict) and details.get('next'):
-                            documents[idx] = expand_document_details(doc, headers_documents, session)
-
-                    # Procesar cada documento y agregar al buffer
-                    for document in documents:
-                        processed_document = process_document(document)
-                        if processed_document:
-                            buffer.append(processed_document)
-                            if len(buffer) >= batch_size:
-                                df = pd.DataFrame(buffer)
-                                load_to_bigquery_masivo(df)
-                                logger.info(f"Cargados {len(df)} registros a BigQuery.")
-                                buffer = []
-
-                    # Guardar el último ID procesado (opcional)
-                    with open('last_id.txt', 'w') as f:
-                        f.write(str(lastid))
-
-                    success = True
-                    break  # Salir del ciclo de reintentos si todo salió bien
-
-                except requests.exceptions.HTTPError as e:
-                    if hasattr(e, 'response') and e.response and e.response.status_code == 429:
-                        retry_after = int(e.response.headers.get('Retry-After', 60))
-                        retry_delay = retry_after * (2 ** attempt)
-                        logger.warning(f"Límite de tasa alcanzado, esperando {retry_delay} segundos...")
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        logger.error(f"Error HTTP al obtener documentos del intervalo {firstid}-{lastid}: {e}")
-                        break
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Error al obtener documentos del intervalo {firstid}-{lastid}: {e}")
-                    break
-
-            if not success:
-                logger.error(f"No se pudo obtener documentos del intervalo {firstid}-{lastid} después de 5 intentos.")
-                failed_intervals.append((firstid, lastid))
-
-            elapsed_time = time.time() - start_time
-            if interval_counter - start_interval > 0:
-                estimated_total_time = (elapsed_time / (interval_counter - start_interval)) * (total_intervals - start_interval)
-                estimated_time_left = estimated_total_time - elapsed_time
-            else:
-                estimated_time_left = 0
-            logger.info(f"Tiempo transcurrido: {elapsed_time:.2f}s, tiempo estimado restante: {estimated_time_left:.2f}s.")
-            logger.info(f"Documentos en el buffer después del intervalo {interval_counter}: {len(buffer)}")
-
-        # Al finalizar todos los intervalos, si quedan documentos en el buffer, se cargan
-        if buffer:
-            df = pd.DataFrame(buffer)
-            load_to_bigquery_masivo(df)
-            logger.info(f"Cargados {len(df)} registros restantes a BigQuery.")
-            buffer = []
-
-    total_elapsed_time = time.time() - start_time
-    logger.info(f"Proceso completado en {total_elapsed_time:.2f} segundos.")
-    if failed_intervals:
-        logger.error(f"Los siguientes intervalos fallaron: {failed_intervals}")
+    def load(job):
+        """Etapa load: ver `load_interval_batch`."""
+        load_interval_batch(job, manifest, last_id_lock)
+
+    # Cada intervalo abre además su propio pool de páginas de detalle sobre la misma sesión.
+    # El pool de transformación se crea antes que los hilos de descarga.
+    with TransformPool(TRANSFORM_PROCESSES, name="bsale_documents") as transform_pool, \
+            build_session(pool_size=max_workers * (1 + DETAIL_WORKERS)) as session:
+        pipeline = (
+            Pipeline("bsale_documents")
+            # Ventana acotada de intervalos en vuelo para no acumular memoria
+            .add_stage("fetch", fetch, workers=max_workers, queue_size=max_workers * 2)
+            # Al terminar se carga lo que quede en el buffer
+            .add_stage("transform", transform, workers=1, queue_size=max_workers * 2, flush=batch_job)
+            .add_stage("load", load, workers=MAX_LOADS_IN_FLIGHT, queue_size=1, stop_on_error=False)
+        )
+        try:
+            pipeline.run(ranges)
+        finally:
+            total_elapsed_time = time.time() - start_time
+            logger.info(f"Proceso completado en {total_elapsed_time:.2f} segundos. Estado del manifiesto: {manifest.summary()}")
+            if failed_intervals:
+                logger.error(f"Los siguientes intervalos fallaron: {failed_intervals}")
+            manifest.close()
+            stats.close()
+            # Si el pipeline se detuvo, se descartan los Parquet a medio escribir y los
+            # lotes que quedaron en la cola sin cargarse
+            for pending in (buffer, line_buffer, reference_buffer):
+                pending.discard()
+            for path in job_files:
+                if os.path.exists(path):
+                    os.remove(path)
+            # Las dimensiones de lo que se alcanzó a procesar se cargan aunque el pipeline falle
+            if interner is not None:
+                interner.load()
 
 if __name__ == "__main__":
-    # Comenzar desde el intervalo 0
+    # Reanuda desde el manifiesto si hay trabajo pendiente; si no, comienza desde el intervalo 0
+    # (o, con BSALE_CARGA_MODE=tail, desde el mayor id ya cargado)
     extract_data_with_expand(start_interval=0)
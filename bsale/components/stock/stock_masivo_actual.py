@@ -1,11 +1,22 @@
 import os
+import sys
 import requests
-import json
 import time
 import logging
 import pandas as pd
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")))
+from common import bigquery_sink, schemas, fast_json
+from common.bsale_api import RateLimiter, bsale_headers, build_session, get_json
+from common.pipeline import Pipeline
+from common.arrow_buffer import ArrowBatchBuilder
+from common.fingerprint_store import FingerprintStore, fingerprint
+from common.touched_variants import TouchedVariants
+from common.dimension_interner import INTERN_DIMENSIONS, DimensionInterner
+from common.interval_stats import IntervalObservation, IntervalStats, adapt_ranges
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -17,94 +28,256 @@ logger = logging.getLogger(__name__)
 # Token de acceso
 ACCESS_TOKEN = os.getenv("BSALE_ACCESS_TOKEN")
 
+# Estadísticas locales de cada intervalo (latencia, bytes) para redimensionar los siguientes
+STATS_PATH = os.getenv(
+    "BSALE_STOCK_STATS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "interval_stats_stock.sqlite")
+)
+
+# Intervalos que se descargan en paralelo (comparten sesión y presupuesto de llamadas)
+MAX_WORKERS = int(os.getenv("BSALE_STOCK_WORKERS", "4"))
+
+# Intentos por intervalo ante errores de red o de Bsale (los 429 se esperan aparte, en get_json)
+INTERVAL_RETRIES = int(os.getenv("BSALE_STOCK_INTERVAL_RETRIES", "3"))
+
+# Espera base (segundos) entre intentos de un intervalo; se duplica en cada intento
+RETRY_BACKOFF = float(os.getenv("BSALE_STOCK_RETRY_BACKOFF", "5"))
+
+# Registros por intervalo del cursor de Bsale
+CURSOR_LENGTH = 500
+
+# La foto completa se escribe en un Parquet local por grupos de filas, en vez de
+# acumular todos los registros en memoria: filas por grupo y compresión del archivo
+SNAPSHOT_CHUNK_ROWS = int(os.getenv("BSALE_STOCK_CHUNK_ROWS", "5000"))
+SNAPSHOT_COMPRESSION = os.getenv("BSALE_STOCK_COMPRESSION", "zstd")
+
+# Modo de carga: "snapshot" reemplaza bsale_stock_actual completa (WRITE_TRUNCATE);
+# "history" solo escribe los stocks que cambiaron en el historial bsale_stock_history
+STOCK_MODE = os.getenv("BSALE_STOCK_MODE", "snapshot")
+
+# Alcance: "full" descarga la foto completa; "targeted" solo el stock de las variantes
+# que registraron carga_diaria, recibos_stock y consumo_stock (common/touched_variants.py)
+# y actualiza la tabla vigente sin reemplazarla
+STOCK_SCOPE = os.getenv("BSALE_STOCK_SCOPE", "full")
+
+# Historial de stock (modo "history") y su staging
+HISTORY_TABLE = os.getenv("BIGQUERY_TABLE_STOCK_HISTORY", "bsale_stock_history")
+HISTORY_STAGING_TABLE = f"{HISTORY_TABLE}_staging"
+
+# Fingerprints locales de las cantidades de cada stock ya escrito en el historial
+FINGERPRINTS_PATH = os.getenv(
+    "BSALE_STOCK_FINGERPRINTS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fingerprints_stock.sqlite")
+)
+
+# Campos que definen una nueva versión del stock
+FINGERPRINT_FIELDS = ("quantity", "quantityReserved", "quantityAvailable")
+
 # Función para cargar datos a BigQuery con WRITE_TRUNCATE (se borra y se recarga la tabla completa)
-def load_to_bigquery(df):
+# Se ejecuta en segundo plano y lanza una excepción si la carga falla.
+def load_to_bigquery(parquet_path, num_rows):
     try:
-        key_path = os.getenv("BIGQUERY_KEY_PATH")
-        project_id = os.getenv("BIGQUERY_PROJECT_ID")
-        dataset_id = os.getenv("BIGQUERY_DATASET")
         table_name = "bsale_stock_actual"  # Nombre de la tabla para stock
 
-        if not all([key_path, project_id, dataset_id, table_name]):
-            logger.error("Faltan variables de entorno para BigQuery. Verifica tu archivo .env.")
+        # El Parquet ya se escribió con el esquema declarado en common/schemas.py
+        bigquery_sink.truncate_replace(parquet_path, table_name, schema=schemas.bigquery_schema(table_name))
+
+        logger.info(f"Se cargaron {num_rows} registros a BigQuery en la tabla {table_name} sin duplicados.")
+    except Exception as e:
+        logger.error(f"Error al cargar datos en BigQuery: {e}")
+        raise
+
+def load_snapshot(snapshot, interner=None):
+    """
+    Carga la foto completa `snapshot` = (ruta del Parquet, filas): un único
+    WRITE_TRUNCATE en modo "snapshot", o la comparación con el historial en
+    modo "history". Las dimensiones de `interner`, si hay, se cargan antes.
+    El archivo se elimina al terminar, aunque la carga falle.
+    """
+    parquet_path, num_rows = snapshot
+    try:
+        if interner is not None:
+            interner.load()
+        if STOCK_MODE == "history":
+            # Se recorre el Parquet por lotes, sin volver a armar la foto completa en memoria
+            batches = pq.ParquetFile(parquet_path).iter_batches(batch_size=SNAPSHOT_CHUNK_ROWS)
+            load_stock_history(batch.to_pylist() for batch in batches)
+        else:
+            load_to_bigquery(parquet_path, num_rows)
+    finally:
+        os.remove(parquet_path)
+
+def stock_fingerprint(stock_row):
+    """Fingerprint de las cantidades de un stock procesado (ver FINGERPRINT_FIELDS)."""
+    return fingerprint([stock_row.get(field) for field in FINGERPRINT_FIELDS])
+
+# Función para escribir en el historial solo los stocks que cambiaron (modo "history")
+def load_stock_history(row_batches, detect_removed=True):
+    """
+    Compara cada stock de la foto con el fingerprint de sus cantidades en la
+    corrida anterior y escribe en HISTORY_TABLE solo los que cambiaron o son
+    nuevos, con vigencia desde ahora; las versiones anteriores de esos stocks,
+    y las de los que ya no vienen en la foto, se cierran con la misma marca de
+    tiempo. Los fingerprints se actualizan solo si la escritura fue exitosa.
+    Con una foto parcial (refresco dirigido) `detect_removed` debe ser False.
+
+    `row_batches` es un iterable de listas de filas (dicts de `process_stock`):
+    cada lote se compara y sus filas cambiadas se escriben en un Parquet local
+    que se sube al staging en una sola carga, así en memoria solo quedan un
+    lote, los ids vistos y los fingerprints de lo que cambió.
+    """
+    valid_from = datetime.now(timezone.utc)
+    store = FingerprintStore(FINGERPRINTS_PATH)
+    changed_rows = ArrowBatchBuilder(
+        schemas.arrow_schema("bsale_stock_history"), chunk_rows=SNAPSHOT_CHUNK_ROWS,
+        compression=SNAPSHOT_COMPRESSION, prefix="bsale_stock_history_"
+    )
+    try:
+        seen_ids = set()
+        changed_fingerprints = {}
+        for rows in row_batches:
+            fingerprints = {row["id"]: stock_fingerprint(row) for row in rows}
+            seen_ids.update(fingerprints)
+            changed = set(store.changed(fingerprints))
+            for row in rows:
+                if row["id"] in changed:
+                    changed_rows.append(dict(row, valid_from=valid_from, valid_to=None))
+            changed_fingerprints.update({key: fingerprints[key] for key in changed})
+
+        removed = sorted(set(store.keys()) - seen_ids) if detect_removed else []
+        logger.info(
+            f"Stock: {len(changed_fingerprints)} de {len(seen_ids)} registros cambiaron "
+            f"y {len(removed)} ya no existen."
+        )
+        if not changed_fingerprints and not removed:
             return
 
-        client = bigquery.Client.from_service_account_json(key_path, project=project_id)
-        table_id = f"{project_id}.{dataset_id}.{table_name}"
-
-        # Definir esquema de la tabla
-        schema = [
-            bigquery.SchemaField("id", "INTEGER"),
-            bigquery.SchemaField("quantity", "FLOAT"),
-            bigquery.SchemaField("quantityReserved", "FLOAT"),
-            bigquery.SchemaField("quantityAvailable", "FLOAT"),
-            bigquery.SchemaField("variant", "STRING"),
-            bigquery.SchemaField("office", "STRING"),
-        ]
-
-        job_config = bigquery.LoadJobConfig(
-            schema=schema,
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
+        # El staging se reemplaza aunque no haya filas cambiadas, para no cerrar con datos viejos
+        finished = changed_rows.finish()
+        staging_source = finished[0] if finished else schemas.to_arrow_table(
+            "bsale_stock_history", pd.DataFrame(columns=schemas.column_names("bsale_stock_history"))
+        )
+        try:
+            bigquery_sink.truncate_replace(
+                staging_source, HISTORY_STAGING_TABLE, schema=schemas.bigquery_schema("bsale_stock_history")
+            )
+        finally:
+            if finished:
+                os.remove(finished[0])
+        bigquery_sink.close_and_append(
+            HISTORY_STAGING_TABLE, HISTORY_TABLE, schemas.column_names("bsale_stock_history"),
+            valid_from, key="id", closed_keys=removed
         )
 
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()
+        store.update(changed_fingerprints)
+        store.delete(removed)
+        logger.info(f"Se escribieron {len(changed_fingerprints)} versiones de stock en {HISTORY_TABLE}.")
+    except Exception as e:
+        logger.error(f"Error al escribir el historial de stock en BigQuery: {e}")
+        raise
+    finally:
+        changed_rows.discard()
+        store.close()
 
-        logger.info(f"Se cargaron {len(df)} registros a BigQuery en la tabla {table_id} sin duplicados.")
+# Función para actualizar solo algunos stocks en la tabla vigente (refresco dirigido)
+def load_stock_patch(df):
+    """
+    Aplica un conjunto parcial de stocks sobre la tabla vigente: MERGE por id en
+    bsale_stock_actual (modo "snapshot") o nuevas versiones en el historial
+    (modo "history"), sin cerrar los stocks que no vinieron.
+    """
+    if STOCK_MODE == "history":
+        load_stock_history([df.to_dict("records")], detect_removed=False)
+        return
+    try:
+        table_name = "bsale_stock_actual"
+        table = schemas.to_arrow_table(table_name, df)
+        bigquery_sink.upsert(
+            table, table_name, key="id", staging_table=f"{table_name}_staging",
+            schema=schemas.bigquery_schema(table_name)
+        )
     except Exception as e:
-        logger.error(f"Error al cargar datos en BigQuery: {e}")
+        logger.error(f"Error al actualizar el stock en BigQuery: {e}")
+        raise
 
 # Función para obtener los intervalos de stock desde BSALE
-def get_stock_intervals(cursorlength=500):
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': ACCESS_TOKEN,
-        'target': 'beta'
-    }
+def get_stock_intervals(session, limiter, headers, cursorlength=CURSOR_LENGTH):
     url = f'https://api.bsale.cl/v1/stocks_interval.json?cursorlength={cursorlength}'
+    data = get_json(session, url, headers, limiter, timeout=10)
+    intervals = data.get('items', [])
+    logger.info(f"Se obtuvieron {len(intervals)} intervalos de stock.")
+    return intervals
 
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        intervals = data.get('items', [])
-        logger.info(f"Se obtuvieron {len(intervals)} intervalos de stock.")
-        return intervals
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error al obtener intervalos de stock: {e}")
-        return []
-
-# Función para obtener detalles del stock en un rango de IDs
-def fetch_all_stocks(firstid, lastid):
-    headers = {
-        'Content-Type': 'application/json',
-        'access_token': ACCESS_TOKEN,
-        'target': 'beta'
-    }
-    url = (f'https://api.bsale.cl/v1/stocks.json?firstid={firstid}&lastid={lastid}&order=none&limit=500&'
+# Función para obtener detalles del stock en un rango de IDs; con `lastid` None el rango
+# queda abierto y se pagina hasta agotar la API
+def fetch_all_stocks(firstid, lastid, session, limiter, headers, observation=None):
+    id_range = f'firstid={firstid}' if lastid is None else f'firstid={firstid}&lastid={lastid}'
+    url = (f'https://api.bsale.cl/v1/stocks.json?{id_range}&order=none&limit=500&'
            f'expand=variant,office')
 
     all_items = []
-    with requests.Session() as session:
-        while url:
-            response = session.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            all_items.extend(data.get('items', []))
-            url = data.get('next')
+    while url:
+        data = get_json(session, url, headers, limiter, observation=observation)
+        all_items.extend(data.get('items', []))
+        url = data.get('next')
 
     return all_items
 
-# Función para procesar cada registro de stock
-def process_stock(stock_data):
+def fetch_interval_with_retries(firstid, lastid, session, limiter, headers):
+    """
+    Descarga un intervalo completo, reintentándolo entero hasta INTERVAL_RETRIES
+    veces con espera exponencial. Devuelve (stocks, observación); si se agotan
+    los intentos lanza RuntimeError, porque la foto quedaría incompleta.
+    """
+    for attempt in range(1, INTERVAL_RETRIES + 1):
+        observation = IntervalObservation(firstid, lastid)
+        try:
+            stocks = fetch_all_stocks(firstid, lastid, session, limiter, headers, observation)
+            if lastid is None:
+                # Rango abierto: las estadísticas cubren hasta el mayor id obtenido
+                observation.lastid = max((stock.get("id") or firstid for stock in stocks), default=firstid)
+            return stocks, observation.finish(len(stocks))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # ValueError: respuesta JSON inválida o cortada
+            if attempt == INTERVAL_RETRIES:
+                raise RuntimeError(
+                    f"No se pudo descargar el intervalo de stock {firstid}-{lastid} tras {attempt} intentos: {e}"
+                ) from e
+            delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            logger.warning(
+                f"Error en el intervalo {firstid}-{lastid} (intento {attempt}/{INTERVAL_RETRIES}): {e}. "
+                f"Reintentando en {delay:.0f} segundos..."
+            )
+            time.sleep(delay)
+
+# Función para obtener el stock de una variante en todas las sucursales
+def fetch_variant_stocks(variant_id, session, limiter, headers):
+    url = f'https://api.bsale.cl/v1/stocks.json?variantid={variant_id}&limit=50&expand=variant,office'
+
+    items = []
+    while url:
+        data = get_json(session, url, headers, limiter)
+        items.extend(data.get('items', []))
+        url = data.get('next')
+
+    return items
+
+# Función para procesar cada registro de stock. Con `interner` (BSALE_INTERN_DIMENSIONS)
+# la variante y la sucursal se guardan como {"id": ...} y el objeto completo va a su dimensión
+def process_stock(stock_data, interner=None):
     try:
+        variant = stock_data.get("variant", {})
+        office = stock_data.get("office", {})
+        if interner is not None:
+            variant = interner.intern("variant", variant)
+            office = interner.intern("office", office)
         processed_stock = {
             "id": stock_data.get("id"),
             "quantity": stock_data.get("quantity"),
             "quantityReserved": stock_data.get("quantityReserved"),
             "quantityAvailable": stock_data.get("quantityAvailable"),
-            "variant": json.dumps(stock_data.get("variant", {}), ensure_ascii=False),
-            "office": json.dumps(stock_data.get("office", {}), ensure_ascii=False)
+            "variant": fast_json.dumps(variant),
+            "office": fast_json.dumps(office)
         }
         return processed_stock
     except Exception as e:
@@ -112,41 +285,163 @@ def process_stock(stock_data):
         return None
 
 # Extraer datos de stock y cargarlos en una única operación
-def extract_stock_data(start_interval=0):
-    intervals = get_stock_intervals(cursorlength=500)
-    if not intervals:
-        logger.error("No se pudieron obtener intervalos de stock.")
-        return
+def extract_stock_data(start_interval=0, max_workers=MAX_WORKERS):
+    """
+    Descarga la foto completa del stock y reemplaza la tabla con un único
+    WRITE_TRUNCATE. Los registros se escriben a medida que llegan en un Parquet
+    local (SNAPSHOT_COMPRESSION, con diccionario), así la memoria no crece con
+    el catálogo, y el archivo se sube en una sola carga. Los intervalos se descargan en paralelo (`max_workers`)
+    sobre una sesión y un limitador compartidos; si alguno no se pudo
+    descargar tras sus reintentos, la ejecución falla antes de tocar la tabla.
+    """
+    headers = bsale_headers(ACCESS_TOKEN)
+    limiter = RateLimiter()
 
-    total_intervals = len(intervals) - 1
-    all_stock_buffer = []  # Buffer para acumular todos los registros de stock
+    with build_session(pool_size=max_workers) as session:
+        intervals = get_stock_intervals(session, limiter, headers)
+        if len(intervals) <= start_interval:
+            raise RuntimeError("No se pudieron obtener intervalos de stock.")
 
-    start_time = time.time()
+        # Rangos del cursor, redimensionados según lo observado en corridas anteriores.
+        # El último cursor no tiene un siguiente que lo cierre: queda como rango abierto
+        # (sin lastid, hasta agotar la API), fuera de la redimensión. CURSOR_LENGTH cuenta
+        # registros y no ids, así que no sirve como cota de ids.
+        stats = IntervalStats(STATS_PATH)
+        boundaries = [interval['id'] for interval in intervals[start_interval:]]
+        ranges = [(boundaries[i], boundaries[i + 1] - 1) for i in range(len(boundaries) - 1)]
+        ranges = adapt_ranges(ranges, stats.observations())
+        ranges.append((boundaries[-1], None))
 
-    for i in range(start_interval, total_intervals):
-        firstid = intervals[i]['id']
-        lastid = intervals[i + 1]['id'] - 1
+        total_intervals = len(ranges)
+        # Parquet local con todos los registros de stock, por grupos de SNAPSHOT_CHUNK_ROWS filas
+        stock_buffer = ArrowBatchBuilder(
+            schemas.arrow_schema("bsale_stock_actual"), chunk_rows=SNAPSHOT_CHUNK_ROWS,
+            compression=SNAPSHOT_COMPRESSION, prefix="bsale_stock_actual_"
+        )
+        interner = DimensionInterner("bsale_stock") if INTERN_DIMENSIONS else None
+        fetched_intervals = 0
 
-        logger.info(f"Procesando intervalo {i + 1}/{total_intervals}: IDs del {firstid} al {lastid}.")
-        try:
-            stocks = fetch_all_stocks(firstid, lastid)
-            logger.info(f"Procesando {len(stocks)} registros de stock.")
+        start_time = time.time()
+        logger.info(f"Descargando {total_intervals} intervalos de stock con {max_workers} workers en paralelo.")
 
+        # Etapa fetch: descarga un intervalo con reintentos; si se agotan, el pipeline se detiene
+        def fetch(item):
+            i, (firstid, lastid) = item
+            logger.info(
+                f"Procesando intervalo {i + 1}/{total_intervals}: IDs del {firstid} al "
+                f"{'final' if lastid is None else lastid}."
+            )
+            stocks, observation = fetch_interval_with_retries(firstid, lastid, session, limiter, headers)
+            stats.record(observation)
+            return stocks
+
+        # Etapa transform: procesa los registros mientras se descargan los intervalos siguientes
+        def transform(stocks):
+            nonlocal fetched_intervals
+            logger.info(f"Procesando {len(stocks)} registros de stock.")
             for stock in stocks:
-                processed_stock = process_stock(stock)
+                processed_stock = process_stock(stock, interner)
                 if processed_stock:
-                    all_stock_buffer.append(processed_stock)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error al obtener stocks del intervalo {firstid}-{lastid}: {e}")
-            continue
+                    stock_buffer.append(processed_stock)
+            fetched_intervals += 1
+
+        # La foto completa es una única carga WRITE_TRUNCATE al terminar la entrada,
+        # solo si llegaron todos los intervalos
+        def snapshot():
+            if fetched_intervals != total_intervals:
+                raise RuntimeError(
+                    f"Faltan {total_intervals - fetched_intervals} de {total_intervals} intervalos de stock; "
+                    f"no se reemplaza la tabla."
+                )
+            return stock_buffer.finish()
 
-    if all_stock_buffer:
-        df = pd.DataFrame(all_stock_buffer)
-        load_to_bigquery(df)
-        logger.info(f"Cargados {len(df)} registros totales a BigQuery.")
+        # Etapa load: dimensiones (si hay interning) y luego la foto completa
+        def load(snapshot_file):
+            load_snapshot(snapshot_file, interner)
+
+        pipeline = (
+            Pipeline("bsale_stock_actual")
+            .add_stage("fetch", fetch, workers=max_workers, queue_size=max_workers * 2)
+            .add_stage("transform", transform, workers=1, queue_size=max_workers * 2, flush=snapshot)
+            # Un fallo de la carga hace fallar la ejecución
+            .add_stage("load", load, workers=1, queue_size=1)
+        )
+        # La foto completa cubre también las variantes pendientes del refresco dirigido
+        # registradas hasta ahora; las que lleguen durante la descarga quedan en la cola
+        touched = TouchedVariants()
+        _, touched_mark = touched.pending()
+        try:
+            pipeline.run(enumerate(ranges))
+            touched.acknowledge(touched_mark)
+        finally:
+            # Si el pipeline se detuvo antes de cargar, el Parquet a medio escribir se descarta
+            stock_buffer.discard()
+            stats.close()
+            touched.close()
 
     total_elapsed_time = time.time() - start_time
     logger.info(f"Proceso completado en {total_elapsed_time:.2f} segundos.")
 
+# Refrescar solo el stock de las variantes tocadas por documentos, recepciones y consumos
+def refresh_touched_stock(max_workers=MAX_WORKERS):
+    """
+    Refresco dirigido: descarga con el filtro `variantid` de Bsale solo las
+    variantes pendientes en common/touched_variants.py y las aplica sobre la
+    tabla vigente (`load_stock_patch`). Las variantes se descartan de la cola
+    solo si todo el refresco terminó bien; si no, quedan para el siguiente.
+    """
+    touched = TouchedVariants()
+    try:
+        variant_ids, mark = touched.pending()
+        if not variant_ids:
+            logger.info("No hay variantes pendientes de refrescar.")
+            return
+
+        headers = bsale_headers(ACCESS_TOKEN)
+        limiter = RateLimiter()
+        stock_buffer = []
+        interner = DimensionInterner("bsale_stock") if INTERN_DIMENSIONS else None
+        start_time = time.time()
+        logger.info(f"Refrescando el stock de {len(variant_ids)} variantes con {max_workers} workers en paralelo.")
+
+        with build_session(pool_size=max_workers) as session:
+            def fetch(variant_id):
+                return fetch_variant_stocks(variant_id, session, limiter, headers)
+
+            def transform(stocks):
+                for stock in stocks:
+                    processed_stock = process_stock(stock, interner)
+                    if processed_stock:
+                        stock_buffer.append(processed_stock)
+
+            def patch():
+                if stock_buffer:
+                    return pd.DataFrame(stock_buffer)
+                return None
+
+            def load(df):
+                if interner is not None:
+                    interner.load()
+                load_stock_patch(df)
+
+            pipeline = (
+                Pipeline("bsale_stock_targeted")
+                .add_stage("fetch", fetch, workers=max_workers, queue_size=max_workers * 2)
+                .add_stage("transform", transform, workers=1, queue_size=max_workers * 2, flush=patch)
+                .add_stage("load", load, workers=1, queue_size=1)
+            )
+            pipeline.run(variant_ids)
+
+        touched.acknowledge(mark)
+        logger.info(
+            f"Refresco dirigido completado en {time.time() - start_time:.2f} segundos: "
+            f"{len(stock_buffer)} stocks de {len(variant_ids)} variantes."
+        )
+    finally:
+        touched.close()
+
 if __name__ == "__main__":
-    extract_stock_data(start_interval=0)
+    if STOCK_SCOPE == "targeted":
+        refresh_touched_stock()
+    else:
+        extract_stock_data(start_interval=0)
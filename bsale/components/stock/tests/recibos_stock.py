@@ -1,8 +1,12 @@
 import os
+import sys
 import requests
 import pandas as pd
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..")))
+from common import bigquery_sink
+from common.touched_variants import record_touched_variants, is_recent
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -82,15 +86,10 @@ def cargar_a_bigquery(df):
     """
     Carga los datos a BigQuery en la tabla especificada.
     """
-    client = bigquery.Client(project=BQ_PROJECT_ID)
-    table_id = f"{BQ_PROJECT_ID}.{BQ_DATASET}.{BQ_TABLE}"
-
-    job_config = bigquery.LoadJobConfig(
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND  # Añade datos sin borrar lo anterior
-    )
+    table_id = bigquery_sink.table_ref(BQ_TABLE, dataset=BQ_DATASET)
 
-    job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-    job.result()
+    # Añade datos sin borrar lo anterior
+    bigquery_sink.append(df, table_id)
     print(f"Datos cargados en {table_id} con {len(df)} registros.")
 
 
@@ -99,5 +98,14 @@ recepciones_data = obtener_todas_las_recepciones()
 
 if recepciones_data:
     df_recepcion = transformar_a_dataframe(recepciones_data)
+    # Las variantes recibidas cambiaron de stock: quedan para el refresco dirigido
+    record_touched_variants(
+        "recibos_stock",
+        [
+            detalle["variant"]["id"]
+            for recepcion in recepciones_data if is_recent(recepcion.get("admissionDate"))
+            for detalle in recepcion.get("details", {}).get("items", [])
+        ]
+    )
     print(df_recepcion.head())  # Mostrar una muestra antes de cargar
     cargar_a_bigquery(df_recepcion)
@@ -0,0 +1 @@
+"""Módulos compartidos por los extractores de Bsale, Meta y Shopify."""
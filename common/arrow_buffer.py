@@ -0,0 +1,117 @@
+import os
+import logging
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class ArrowBatchBuilder:
+    """
+    Buffer columnar para cargas a BigQuery. Las filas se acumulan columna a
+    columna y cada `chunk_rows` se convierten en un RecordBatch de pyarrow que se
+    escribe como row group en un archivo Parquet temporal, de modo que la memoria
+    se mantiene acotada sin pasar por pandas. `flush` entrega el archivo a una
+    función de carga y comienza uno nuevo.
+
+    `compression` y `use_dictionary` se pasan al escritor Parquet; el
+    diccionario reduce mucho las columnas de texto que se repiten entre filas
+    (por ejemplo el JSON de la sucursal en el stock).
+    """
+
+    def __init__(self, schema, chunk_rows=2000, compression="snappy", prefix="carga_", use_dictionary=True):
+        self.schema = schema
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.use_dictionary = use_dictionary
+        self.prefix = prefix
+        self._columns = {name: [] for name in schema.names}
+        self._pending_rows = 0
+        self._writer = None
+        self._path = None
+        self.num_rows = 0
+        self.nbytes = 0
+
+    def append(self, row):
+        """Agrega una fila (dict) al buffer."""
+        for name, values in self._columns.items():
+            values.append(row.get(name))
+        self._pending_rows += 1
+        self.num_rows += 1
+        if self._pending_rows >= self.chunk_rows:
+            self._write_chunk()
+
+    def append_batch(self, batch):
+        """
+        Agrega un RecordBatch ya armado con `schema` (por ejemplo, el que
+        devuelve un pool de transformación), sin pasar por filas.
+        """
+        if not batch.num_rows:
+            return
+        # Respetar el orden: primero las filas sueltas que estaban pendientes
+        self._write_chunk()
+        self._write_batch(batch)
+        self.num_rows += batch.num_rows
+
+    def _write_batch(self, batch):
+        if self._writer is None:
+            fd, self._path = tempfile.mkstemp(prefix=self.prefix, suffix=".parquet")
+            os.close(fd)
+            self._writer = pq.ParquetWriter(
+                self._path, self.schema, compression=self.compression, use_dictionary=self.use_dictionary
+            )
+        self._writer.write_batch(batch)
+        self.nbytes += batch.nbytes
+
+    def _write_chunk(self):
+        if not self._pending_rows:
+            return
+        self._write_batch(pa.RecordBatch.from_pydict(self._columns, schema=self.schema))
+        self._columns = {name: [] for name in self.schema.names}
+        self._pending_rows = 0
+
+    def finish(self):
+        """
+        Cierra el archivo Parquet actual y devuelve (path, num_rows), o None si
+        el buffer está vacío. El llamador queda a cargo de eliminar el archivo.
+        """
+        self._write_chunk()
+        if self._writer is None:
+            return None
+
+        self._writer.close()
+        finished = (self._path, self.num_rows)
+        self._writer = None
+        self._path = None
+        self.num_rows = 0
+        self.nbytes = 0
+        return finished
+
+    def discard(self):
+        """Descarta las filas pendientes y elimina el archivo en curso, si existe."""
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._path)
+        self._columns = {name: [] for name in self.schema.names}
+        self._pending_rows = 0
+        self._writer = None
+        self._path = None
+        self.num_rows = 0
+        self.nbytes = 0
+
+    def flush(self, load_file):
+        """
+        Cierra el archivo Parquet actual y lo entrega a `load_file(path, num_rows)`,
+        que debe devolver True si la carga fue exitosa. El archivo se elimina
+        después de la carga y el buffer queda vacío.
+        """
+        finished = self.finish()
+        if finished is None:
+            return True
+
+        path, num_rows = finished
+        try:
+            return load_file(path, num_rows)
+        finally:
+            os.remove(path)
@@ -0,0 +1,254 @@
+import io
+import os
+import logging
+import threading
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+from google.oauth2 import service_account
+
+logger = logging.getLogger(__name__)
+
+# Cliente y credenciales compartidos por todo el proceso (se crean al primer uso)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Devuelve un único cliente de BigQuery por proceso. Las credenciales del
+    archivo BIGQUERY_KEY_PATH se leen una sola vez; si no está definido se
+    usan las credenciales por defecto (GOOGLE_APPLICATION_CREDENTIALS).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                key_path = os.getenv("BIGQUERY_KEY_PATH")
+                project_id = os.getenv("BIGQUERY_PROJECT_ID")
+                if key_path:
+                    credentials = service_account.Credentials.from_service_account_file(
+                        key_path, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                    )
+                    _client = bigquery.Client(credentials=credentials, project=project_id or credentials.project_id)
+                else:
+                    _client = bigquery.Client(project=project_id)
+                logger.info(f"Cliente de BigQuery inicializado para el proyecto {_client.project}.")
+    return _client
+
+
+def table_ref(table_name, dataset=None):
+    """Identificador completo `proyecto.dataset.tabla` a partir del nombre de la tabla."""
+    if table_name.count(".") == 2:
+        return table_name
+    project_id = os.getenv("BIGQUERY_PROJECT_ID") or get_client().project
+    dataset = dataset or os.getenv("BIGQUERY_DATASET")
+    if not dataset:
+        raise RuntimeError("BIGQUERY_DATASET no está definido en las variables de entorno.")
+    return f"{project_id}.{dataset}.{table_name}"
+
+
+def query(sql):
+    """Ejecuta una consulta y devuelve el iterador de filas."""
+    return get_client().query(sql).result()
+
+
+def _load(source, table_name, job_config):
+    """
+    Carga `source` en `table_name`. `source` puede ser un DataFrame, una tabla
+    pyarrow o la ruta de un archivo Parquet. Espera el job y lanza una excepción si falla.
+    """
+    client = get_client()
+    table_id = table_ref(table_name)
+    if isinstance(source, (str, os.PathLike)):
+        job_config.source_format = bigquery.SourceFormat.PARQUET
+        with open(source, "rb") as source_file:
+            load_job = client.load_table_from_file(source_file, table_id, job_config=job_config)
+    elif isinstance(source, pa.Table):
+        job_config.source_format = bigquery.SourceFormat.PARQUET
+        buffer = io.BytesIO()
+        pq.write_table(source, buffer)
+        buffer.seek(0)
+        load_job = client.load_table_from_file(buffer, table_id, job_config=job_config)
+    else:
+        load_job = client.load_table_from_dataframe(source, table_id, job_config=job_config)
+    load_job.result()
+    logger.info(f"Se cargaron {load_job.output_rows} registros en {table_id}.")
+    return load_job
+
+
+def layout_ddl(partition_by=None, cluster_by=None):
+    """
+    Cláusulas PARTITION BY / CLUSTER BY de un CREATE TABLE. `partition_by` es una
+    partición por rango entero (columna, inicio, fin, intervalo) y `cluster_by`
+    una lista de columnas.
+    """
+    clauses = []
+    if partition_by:
+        column, start, end, interval = partition_by
+        clauses.append(f"PARTITION BY RANGE_BUCKET(`{column}`, GENERATE_ARRAY({start}, {end}, {interval}))")
+    if cluster_by:
+        clauses.append("CLUSTER BY " + ", ".join(f"`{c}`" for c in cluster_by))
+    return "\n        ".join(clauses)
+
+
+def ensure_table(table_name, schema, partition_by=None, cluster_by=None):
+    """
+    Crea la tabla vacía con `schema`, partición y clustering si todavía no existe.
+    Las cargas con CREATE_IF_NEEDED crean tablas sin partición, así que las que
+    declaran distribución se crean antes con esta función.
+    """
+    table = bigquery.Table(table_ref(table_name), schema=schema)
+    if partition_by:
+        column, start, end, interval = partition_by
+        table.range_partitioning = bigquery.RangePartitioning(
+            field=column, range_=bigquery.PartitionRange(start=start, end=end, interval=interval)
+        )
+    if cluster_by:
+        table.clustering_fields = list(cluster_by)
+    get_client().create_table(table, exists_ok=True)
+
+
+def append(source, table_name, schema=None, autodetect=None):
+    """
+    Agrega filas a la tabla (WRITE_APPEND), creándola si no existe. Con un
+    esquema explícito, las columnas nuevas del esquema se agregan a la tabla.
+    """
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
+    )
+    if schema is not None:
+        job_config.schema = schema
+        job_config.schema_update_options = [bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+    if autodetect is not None:
+        job_config.autodetect = autodetect
+    return _load(source, table_name, job_config)
+
+
+def truncate_replace(source, table_name, schema=None, autodetect=None):
+    """Reemplaza atómicamente el contenido de la tabla (WRITE_TRUNCATE)."""
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
+    )
+    if schema is not None:
+        job_config.schema = schema
+    if autodetect is not None:
+        job_config.autodetect = autodetect
+    return _load(source, table_name, job_config)
+
+
+def merge(staging_table, table_name, columns, key="id", target_filter=None, update_columns=None,
+          delete_filter=None, partition_by=None, cluster_by=None):
+    """
+    Ejecuta un MERGE de `staging_table` sobre `table_name` por la(s) columna(s)
+    `key`: actualiza las filas existentes e inserta las nuevas. La tabla final se
+    crea con el esquema del staging si no existe, con la partición y el
+    clustering de `partition_by` y `cluster_by` (ver `layout_ddl`).
+
+    `target_filter` es un predicado SQL opcional sobre la tabla final (alias T)
+    que se agrega a la condición del MERGE, para que BigQuery solo lea las
+    particiones o bloques afectados en vez de toda la tabla. Solo poda lectura
+    si la tabla está particionada o agrupada por las columnas del predicado. `update_columns`
+    limita las columnas que se actualizan en las filas existentes (por defecto, todas).
+
+    `delete_filter` es un predicado SQL opcional sobre la tabla final (alias T):
+    las filas que lo cumplen y no llegaron en el staging se borran. Sirve para
+    tablas hijas, donde un documento recargado reemplaza su conjunto de filas.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    destination_id = table_ref(table_name)
+    staging_id = table_ref(staging_table)
+    query(f"""
+        CREATE TABLE IF NOT EXISTS `{destination_id}`
+        {layout_ddl(partition_by, cluster_by)}
+        AS SELECT * FROM `{staging_id}`
+        WHERE 1=0
+    """)
+
+    on_clause = " AND ".join(f"T.`{k}` = S.`{k}`" for k in keys)
+    if target_filter:
+        on_clause = f"{on_clause} AND {target_filter}"
+    update_columns = columns if update_columns is None else update_columns
+    update_clause = ",\n            ".join(f"`{c}` = S.`{c}`" for c in update_columns if c not in keys)
+    insert_columns = ", ".join(f"`{c}`" for c in columns)
+    insert_values = ", ".join(f"S.`{c}`" for c in columns)
+    matched_clause = f"""
+        WHEN MATCHED THEN
+          UPDATE SET
+            {update_clause}""" if update_clause else ""
+    delete_clause = f"""
+        WHEN NOT MATCHED BY SOURCE AND {delete_filter} THEN
+          DELETE""" if delete_filter else ""
+    merge_query = f"""
+        MERGE `{destination_id}` T
+        USING `{staging_id}` S
+        ON {on_clause}{matched_clause}
+        WHEN NOT MATCHED THEN
+          INSERT ({insert_columns})
+          VALUES ({insert_values}){delete_clause}
+    """
+    merge_job = get_client().query(merge_query)
+    merge_job.result()
+    logger.info(f"MERGE completado en {destination_id}: {merge_job.num_dml_affected_rows} filas afectadas.")
+
+
+def close_and_append(staging_table, table_name, columns, valid_from, key="id",
+                     closed_keys=(), key_type="INT64", valid_to_column="valid_to"):
+    """
+    Versiona `table_name` como historial (una fila por versión, la vigente con
+    `valid_to_column` NULL) a partir de las filas nuevas de `staging_table`.
+    En una sola transacción cierra, con `valid_from`, las versiones vigentes de
+    las claves que llegan en el staging y de `closed_keys` (registros que ya no
+    existen) e inserta las filas del staging. Las filas anteriores no se
+    reescriben salvo para cerrar su vigencia. La tabla final se crea con el
+    esquema del staging si no existe.
+    """
+    destination_id = table_ref(table_name)
+    staging_id = table_ref(staging_table)
+    query(f"""
+        CREATE TABLE IF NOT EXISTS `{destination_id}`
+        AS SELECT * FROM `{staging_id}`
+        WHERE 1=0
+    """)
+
+    insert_columns = ", ".join(f"`{c}`" for c in columns)
+    script = f"""
+        BEGIN TRANSACTION;
+        UPDATE `{destination_id}`
+        SET `{valid_to_column}` = @valid_from
+        WHERE `{valid_to_column}` IS NULL
+          AND `{key}` IN (
+            SELECT `{key}` FROM `{staging_id}`
+            UNION ALL
+            SELECT closed_key FROM UNNEST(@closed_keys) AS closed_key
+          );
+        INSERT INTO `{destination_id}` ({insert_columns})
+        SELECT {insert_columns} FROM `{staging_id}`;
+        COMMIT TRANSACTION;
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("valid_from", "TIMESTAMP", valid_from),
+        bigquery.ArrayQueryParameter("closed_keys", key_type, list(closed_keys)),
+    ])
+    get_client().query(script, job_config=job_config).result()
+    logger.info(f"Historial actualizado en {destination_id} con vigencia desde {valid_from}.")
+
+
+def drop_table(table_name):
+    """Elimina una tabla (por ejemplo un staging temporal) si existe."""
+    get_client().delete_table(table_ref(table_name), not_found_ok=True)
+
+
+def upsert(df, table_name, key="id", staging_table=None, schema=None, autodetect=None, target_filter=None):
+    """
+    Carga `df` (DataFrame o tabla pyarrow) en una tabla de staging (WRITE_TRUNCATE)
+    y ejecuta `merge` sobre `table_name` por la(s) columna(s) `key`.
+    """
+    staging_table = staging_table or f"{table_name}_staging"
+    truncate_replace(df, staging_table, schema=schema, autodetect=autodetect)
+
+    columns = list(df.column_names) if isinstance(df, pa.Table) else list(df.columns)
+    merge(staging_table, table_name, columns, key=key, target_filter=target_filter)
+    logger.info(f"Upsert de {len(df)} registros completado en {table_ref(table_name)}.")
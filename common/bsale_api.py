@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+from common import fast_json
+from common.json_stream import JsonItemStream
+
+logger = logging.getLogger(__name__)
+
+# URL base de la API de Bsale
+BSALE_BASE_URL = "https://api.bsale.cl/v1"
+
+# Presupuesto de llamadas por segundo compartido por todos los workers de un proceso
+BSALE_MAX_CALLS_PER_SECOND = float(os.getenv("BSALE_MAX_CALLS_PER_SECOND", "8"))
+
+# Espera por defecto cuando Bsale responde 429 sin cabecera Retry-After
+DEFAULT_RETRY_AFTER = 60
+
+
+def bsale_headers(access_token, beta=True):
+    """
+    Cabeceras estándar para las llamadas a Bsale.
+    Los endpoints de intervalos y cursores requieren `target: beta`.
+    """
+    headers = {
+        'Content-Type': 'application/json',
+        'access_token': access_token,
+    }
+    if beta:
+        headers['target'] = 'beta'
+    return headers
+
+
+class RateLimiter:
+    """
+    Limitador de tasa thread-safe que reparte un único presupuesto de llamadas
+    entre todos los hilos que lo comparten. Cuando Bsale responde 429, `pause`
+    detiene a todos los workers hasta que se cumpla el Retry-After.
+    """
+
+    def __init__(self, calls_per_second=BSALE_MAX_CALLS_PER_SECOND):
+        self.interval = 1.0 / calls_per_second
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+
+    def acquire(self):
+        """Bloquea hasta que haya un turno disponible en el presupuesto compartido."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot, self._paused_until)
+                self._next_slot = slot + self.interval
+            wait = slot - now
+            if wait > 0:
+                time.sleep(wait)
+            # Si otro hilo recibió un 429 mientras esperábamos, volvemos a la cola
+            with self._lock:
+                if time.monotonic() >= self._paused_until:
+                    return
+
+    def pause(self, seconds):
+        """Pausa a todos los workers durante `seconds` segundos."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                logger.warning(f"Límite de tasa alcanzado en Bsale, pausando todos los workers {seconds} segundos...")
+
+
+def id_ranges(ids, max_gap=0, max_span=None):
+    """
+    Agrupa ids en rangos (firstid, lastid) para consultarlos por rango en vez de
+    uno a uno. Dos ids quedan en el mismo rango si entre ellos faltan a lo sumo
+    `max_gap` ids y el rango no supera `max_span` ids (sin límite si es None):
+    con max_gap=0, {1, 2, 3, 7, 9, 10} -> [(1, 3), (7, 7), (9, 10)].
+    """
+    ranges = []
+    for record_id in sorted(set(ids)):
+        if (ranges and record_id - ranges[-1][1] - 1 <= max_gap
+                and (max_span is None or record_id - ranges[-1][0] + 1 <= max_span)):
+            ranges[-1][1] = record_id
+        else:
+            ranges.append([record_id, record_id])
+    return [tuple(id_range) for id_range in ranges]
+
+
+def parse_retry_after(response):
+    """Lee la cabecera Retry-After (en segundos) de una respuesta 429."""
+    try:
+        return int(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+def build_session(pool_size=10):
+    """
+    Crea una sesión de requests con un pool de conexiones del tamaño indicado,
+    para que varios hilos puedan reutilizar conexiones keep-alive.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Tamaño de los trozos que se leen de una respuesta en streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _get(session, url, headers, limiter, timeout, max_retries, stream=False):
+    """
+    GET a Bsale respetando el limitador compartido. Un 429 pausa a todos los
+    workers según Retry-After y reintenta; otros errores HTTP se propagan.
+    """
+    response = None
+    for attempt in range(max_retries):
+        limiter.acquire()
+        response = session.get(url, headers=headers, timeout=timeout, stream=stream)
+        if response.status_code == 429:
+            response.close()
+            limiter.pause(max(parse_retry_after(response), 2 ** attempt))
+            continue
+        response.raise_for_status()
+        return response
+
+    logger.error(f"No se pudo obtener {url} después de {max_retries} intentos por límite de tasa.")
+    response.raise_for_status()
+
+
+def get_json(session, url, headers, limiter, timeout=30, max_retries=5, observation=None):
+    """
+    GET a Bsale decodificando la respuesta completa (ver `_get`).
+    Si se entrega `observation` (common.interval_stats.IntervalObservation),
+    se registran ahí los bytes de la respuesta.
+    """
+    response = _get(session, url, headers, limiter, timeout, max_retries)
+    if observation is not None:
+        observation.record_response(len(response.content))
+    return fast_json.loads(response.content)
+
+
+def iter_json_items(session, url, headers, limiter, timeout=30, max_retries=5, observation=None, meta=None):
+    """
+    Como `get_json`, pero lee la respuesta en streaming y entrega uno a uno los
+    elementos de `items` a medida que se decodifican. Al terminar de iterar,
+    los demás campos de la respuesta (`next`, `count`, ...) quedan en `meta`.
+    """
+    response = _get(session, url, headers, limiter, timeout, max_retries, stream=True)
+    with response:
+        stream = JsonItemStream(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        yield from stream
+    if meta is not None:
+        meta.update(stream.meta)
+    if observation is not None:
+        observation.record_response(stream.nbytes)
@@ -0,0 +1,286 @@
+"""Transformación de documentos de Bsale a filas de BigQuery."""
+import os
+import logging
+import pyarrow as pa
+
+from common import schemas, fast_json
+from common.fingerprint_store import fingerprint
+from common.dimension_interner import intern_object
+
+logger = logging.getLogger(__name__)
+
+# Formatos de ingesta de documentos (BSALE_DOCUMENT_FORMAT)
+JSON_FORMAT = "json"
+NESTED_FORMAT = "nested"
+
+# Esquema declarado (common/schemas.py) de cada formato
+DOCUMENT_SCHEMAS = {
+    JSON_FORMAT: "bsale_documents",
+    NESTED_FORMAT: "bsale_documents_nested",
+}
+
+# Objetos anidados del documento y su valor por defecto cuando no vienen expandidos
+NESTED_OBJECTS = {
+    "document_type": {},
+    "client": {},
+    "office": {},
+    "user": {},
+    "references": [],
+    "document_taxes": [],
+    "details": [],
+    "sellers": [],
+    "payments": [],
+}
+
+# Perfiles de expand por consumidor: objetos que se piden a Bsale y que se
+# guardan en la fila. Los objetos fuera del perfil quedan en NULL.
+FULL_PROFILE = "full"
+EXPAND_PROFILES = {
+    FULL_PROFILE: tuple(NESTED_OBJECTS),
+    # Lo que usan los modelos de venta en dbt: líneas, tipo de documento y sucursal
+    "sales-lines": ("document_type", "office", "details"),
+}
+
+# Objetos de cabecera que se reemplazan por su referencia {"id": ...} al hacer
+# interning (common/dimension_interner.py); la variante de cada línea también
+INTERNED_OBJECTS = ("document_type", "client", "office", "user")
+
+# Columnas de cabecera, presentes en todos los perfiles
+HEADER_COLUMNS = (
+    "id", "emissionDate", "expirationDate", "generationDate", "number",
+    "totalAmount", "netAmount", "taxAmount", "state",
+)
+
+
+# Campos de cabecera que cambian cuando un documento se modifica después de emitido
+# (anulación, cambio de estado, envío al SII). Vienen tanto en el listado liviano
+# (`fields=[...]`, sin expand) como en el documento expandido.
+FINGERPRINT_FIELDS = (
+    "id", "state", "number", "emissionDate", "expirationDate",
+    "totalAmount", "netAmount", "taxAmount", "exemptAmount",
+    "informedSii", "responseMsgSii",
+)
+
+
+def document_schema(document_format):
+    """Nombre del esquema declarado para el formato de ingesta."""
+    try:
+        return DOCUMENT_SCHEMAS[document_format]
+    except KeyError:
+        raise ValueError(
+            f"Formato de documentos desconocido: {document_format} "
+            f"(se esperaba uno de {sorted(DOCUMENT_SCHEMAS)})"
+        )
+
+
+def document_table(document_format):
+    """
+    Tabla de BigQuery destino del formato: BIGQUERY_TABLE para "json" y
+    BIGQUERY_TABLE_NESTED (por defecto bsale_documents_nested) para "nested",
+    ya que los tipos de las columnas anidadas no son compatibles entre sí.
+    """
+    if document_schema(document_format) == DOCUMENT_SCHEMAS[NESTED_FORMAT]:
+        return os.getenv("BIGQUERY_TABLE_NESTED", "bsale_documents_nested")
+    return os.getenv("BIGQUERY_TABLE")
+
+
+def profile_objects(profile):
+    """Objetos anidados que incluye el perfil de expand."""
+    try:
+        return EXPAND_PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f"Perfil de expand desconocido: {profile} (se esperaba uno de {sorted(EXPAND_PROFILES)})"
+        )
+
+
+def profile_expand(profile):
+    """Valor del parámetro `expand` de Bsale para el perfil."""
+    return ",".join(profile_objects(profile))
+
+
+def profile_columns(profile):
+    """Columnas de la fila que llena el perfil (las que debe actualizar un MERGE)."""
+    return list(HEADER_COLUMNS) + list(profile_objects(profile)) + ["expand_profile"]
+
+
+def _collection_items(value):
+    # Los expand de Bsale devuelven {"href", "count", "items"}; otros vienen como lista
+    if isinstance(value, dict):
+        return value.get("items", [])
+    return value or []
+
+
+def _nested_value(document_data, name, type_spec):
+    value = document_data.get(name)
+    if isinstance(type_spec, tuple) and type_spec[0] == "ARRAY":
+        value = _collection_items(value)
+    return schemas.conform(value, type_spec)
+
+
+def process_document(document_data, document_format=JSON_FORMAT, profile=FULL_PROFILE):
+    """
+    Procesa un documento ya expandido, listo para cargar en BigQuery.
+
+    En formato "json" los objetos anidados se guardan como texto JSON; en
+    formato "nested" se guardan como STRUCT/ARRAY tipados según
+    `schemas.BSALE_DOCUMENT_NESTED_FIELDS`. Solo se guardan los objetos del
+    perfil de expand `profile`; el resto queda en NULL y la columna
+    `expand_profile` registra con qué perfil se llenó la fila.
+    """
+    try:
+        included = profile_objects(profile)
+        final_structure = {column: document_data.get(column) for column in HEADER_COLUMNS}
+        if document_format == NESTED_FORMAT:
+            for name, type_spec in schemas.BSALE_DOCUMENT_NESTED_FIELDS:
+                final_structure[name] = _nested_value(document_data, name, type_spec) if name in included else None
+        else:
+            for name, default in NESTED_OBJECTS.items():
+                final_structure[name] = (
+                    fast_json.dumps(document_data.get(name, default)) if name in included else None
+                )
+        final_structure["expand_profile"] = profile
+        return final_structure
+    except Exception as e:
+        logger.error(f"Error al procesar el documento ID {document_data.get('id')}: {e}")
+        return None
+
+
+def _object_id(document_data, name):
+    value = document_data.get(name)
+    return value.get("id") if isinstance(value, dict) else None
+
+
+def _nested_items(document_data, name):
+    type_spec = dict(schemas.BSALE_DOCUMENT_NESTED_FIELDS)[name]
+    return _nested_value(document_data, name, type_spec)
+
+
+def document_lines(document_data):
+    """
+    Aplana los detalles de un documento: una fila por línea, con la variante y
+    los montos tipados y las claves del documento repetidas en cada fila
+    (esquema "bsale_document_lines"). Devuelve una lista vacía si falla.
+    """
+    try:
+        header = {
+            "document_id": document_data.get("id"),
+            "document_number": document_data.get("number"),
+            "emissionDate": document_data.get("emissionDate"),
+            "expirationDate": document_data.get("expirationDate"),
+            "generationDate": document_data.get("generationDate"),
+            "document_totalAmount": document_data.get("totalAmount"),
+            "document_netAmount": document_data.get("netAmount"),
+            "document_taxAmount": document_data.get("taxAmount"),
+            "state": document_data.get("state"),
+            "document_type_id": _object_id(document_data, "document_type"),
+            "client_id": _object_id(document_data, "client"),
+            "office_id": _object_id(document_data, "office"),
+            "user_id": _object_id(document_data, "user"),
+        }
+        lines = []
+        for detail in _nested_items(document_data, "details"):
+            variant = detail.pop("variant") or {}
+            line = dict(header)
+            line["detail_id"] = detail.pop("id")
+            line.update(detail)
+            line["variant_id"] = variant.get("id")
+            line["variant_code"] = variant.get("code")
+            line["variant_description"] = variant.get("description")
+            line["product_id"] = (variant.get("product") or {}).get("id")
+            lines.append(line)
+        return lines
+    except Exception as e:
+        logger.error(f"Error al extraer las líneas del documento ID {document_data.get('id')}: {e}")
+        return []
+
+
+def document_references(document_data):
+    """
+    Una fila por referencia del documento (esquema "bsale_document_references").
+    Devuelve una lista vacía si falla.
+    """
+    try:
+        references = []
+        for reference in _nested_items(document_data, "references"):
+            references.append({
+                "document_id": document_data.get("id"),
+                "emissionDate": document_data.get("emissionDate"),
+                "reference_id": reference["id"],
+                "number": reference["number"],
+                "referenceDate": reference["referenceDate"],
+                "reason": reference["reason"],
+                "codeSii": reference["codeSii"],
+            })
+        return references
+    except Exception as e:
+        logger.error(f"Error al extraer las referencias del documento ID {document_data.get('id')}: {e}")
+        return []
+
+
+def intern_document(document_data, objects, profile=FULL_PROFILE):
+    """
+    Copia del documento con el tipo de documento, cliente, sucursal, usuario y
+    la variante de cada línea reemplazados por su referencia {"id": ...}; los
+    objetos completos quedan en `objects` (ver `intern_object`). El documento
+    original no se modifica: las líneas planas se siguen armando con él.
+
+    Solo se internan los objetos que expande `profile`: los demás llegan como
+    {"href", "id"} y pisarían el objeto completo en su tabla de dimensión.
+    """
+    expanded = profile_objects(profile)
+    document = dict(document_data)
+    for name in INTERNED_OBJECTS:
+        if name in expanded and name in document_data:
+            document[name] = intern_object(objects, name, document_data[name])
+
+    details = document_data.get("details")
+    if "details" in expanded and details is not None:
+        items = [
+            dict(detail, variant=intern_object(objects, "variant", detail["variant"]))
+            if isinstance(detail, dict) and "variant" in detail else detail
+            for detail in _collection_items(details)
+        ]
+        document["details"] = dict(details, items=items) if isinstance(details, dict) else items
+    return document
+
+
+def document_batches(documents, document_format=JSON_FORMAT, profile=FULL_PROFILE, intern=False):
+    """
+    Transforma un grupo de documentos completos en RecordBatch de pyarrow con
+    los esquemas declarados: (documentos, líneas, referencias, objetos). Los
+    documentos que no se pueden procesar se omiten. Con `intern` la fila del
+    documento guarda solo las referencias de sus objetos y estos se devuelven
+    en `objects` ({dimensión: {id: objeto}}); si no, `objects` va vacío. Es una
+    función de módulo para poder ejecutarla en un pool de procesos
+    (common/transform_pool.py).
+    """
+    rows, lines, references = [], [], []
+    objects = {}
+    for document in documents:
+        row_document = intern_document(document, objects, profile) if intern else document
+        row = process_document(row_document, document_format, profile)
+        if not row:
+            continue
+        rows.append(row)
+        lines.extend(document_lines(document))
+        references.extend(document_references(document))
+    return (
+        pa.RecordBatch.from_pylist(rows, schema=schemas.arrow_schema(document_schema(document_format))),
+        pa.RecordBatch.from_pylist(lines, schema=schemas.arrow_schema("bsale_document_lines")),
+        pa.RecordBatch.from_pylist(references, schema=schemas.arrow_schema("bsale_document_references")),
+        objects,
+    )
+
+
+def document_variant_ids(document_data):
+    """Ids de las variantes de las líneas de detalle del documento."""
+    return [
+        (detail.get("variant") or {}).get("id")
+        for detail in _collection_items(document_data.get("details"))
+    ]
+
+
+def document_fingerprint(document_data):
+    """Fingerprint de la cabecera del documento (ver FINGERPRINT_FIELDS)."""
+    return fingerprint({field: document_data.get(field) for field in FINGERPRINT_FIELDS})
@@ -0,0 +1,82 @@
+"""
+Interning de los objetos de Bsale que se repiten en cada fila (variante,
+sucursal, cliente, usuario y tipo de documento). Con BSALE_INTERN_DIMENSIONS
+las filas de hechos guardan solo la referencia {"id": ...} y cada objeto
+distinto se carga una vez por ejecución en su tabla de dimensión.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+import pandas as pd
+
+from common import bigquery_sink, schemas, fast_json
+
+logger = logging.getLogger(__name__)
+
+# "true" activa el interning en stock_masivo_actual, carga_masiva y carga_diaria
+INTERN_DIMENSIONS = os.getenv("BSALE_INTERN_DIMENSIONS", "false").lower() == "true"
+
+# Tabla de BigQuery de cada dimensión (esquema "bsale_dimension")
+DIMENSION_TABLES = {
+    "variant": os.getenv("BIGQUERY_TABLE_DIM_VARIANT", "bsale_dim_variant"),
+    "office": os.getenv("BIGQUERY_TABLE_DIM_OFFICE", "bsale_dim_office"),
+    "client": os.getenv("BIGQUERY_TABLE_DIM_CLIENT", "bsale_dim_client"),
+    "user": os.getenv("BIGQUERY_TABLE_DIM_USER", "bsale_dim_user"),
+    "document_type": os.getenv("BIGQUERY_TABLE_DIM_DOCUMENT_TYPE", "bsale_dim_document_type"),
+}
+
+
+def intern_object(objects, dimension, value):
+    """
+    Guarda `value` en `objects[dimension]` por su id y devuelve la referencia
+    {"id": id} que queda en la fila. Los valores sin id (objeto no expandido o
+    vacío) se devuelven sin cambios. Es una función de módulo para poder usarla
+    en un pool de procesos; `objects` se junta después con `DimensionInterner.update`.
+    """
+    if not isinstance(value, dict) or value.get("id") is None:
+        return value
+    objects.setdefault(dimension, {})[value["id"]] = value
+    return {"id": value["id"]}
+
+
+class DimensionInterner:
+    """
+    Objetos distintos vistos durante una ejecución, por dimensión e id. Si un
+    mismo id llega más de una vez se conserva el último. `load` hace un upsert
+    por dimensión con clave (id, source): cada extractor (`source`) mantiene su
+    propia versión del objeto, ya que Bsale no expande igual la variante de un
+    stock que la de una línea de documento. No es seguro entre hilos: se usa
+    desde la etapa que arma las filas.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.objects = {dimension: {} for dimension in DIMENSION_TABLES}
+
+    def intern(self, dimension, value):
+        """Registra `value` y devuelve la referencia que se guarda en la fila (ver `intern_object`)."""
+        return intern_object(self.objects, dimension, value)
+
+    def update(self, objects):
+        """Agrega los objetos que devolvió un worker: {dimensión: {id: objeto}}."""
+        for dimension, values in objects.items():
+            self.objects[dimension].update(values)
+
+    def load(self):
+        """Upsert de los objetos vistos en las tablas de dimensión; las vacías se omiten."""
+        seen_at = datetime.now(timezone.utc)
+        for dimension, values in self.objects.items():
+            if not values:
+                continue
+            table_name = DIMENSION_TABLES[dimension]
+            df = pd.DataFrame([
+                {"id": object_id, "source": self.source, "data": fast_json.dumps(value), "seen_at": seen_at}
+                for object_id, value in values.items()
+            ])
+            # Staging propio del extractor, para que dos cargas simultáneas no se pisen
+            bigquery_sink.upsert(
+                schemas.to_arrow_table("bsale_dimension", df), table_name, key=["id", "source"],
+                staging_table=f"{table_name}_staging_{self.source}",
+                schema=schemas.bigquery_schema("bsale_dimension")
+            )
+            logger.info(f"{self.source}: {len(values)} objetos de {dimension} en {table_name}.")
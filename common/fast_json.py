@@ -0,0 +1,64 @@
+"""
+Codificación y decodificación JSON de los transforms (documentos, stock,
+órdenes e insights) con un backend intercambiable: orjson si está instalado y
+la librería estándar como respaldo.
+"""
+import os
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Backend a usar (FAST_JSON_BACKEND): "auto" (orjson si está disponible), "orjson" o "stdlib"
+BACKEND_SETTING = os.getenv("FAST_JSON_BACKEND", "auto").lower()
+
+BACKENDS = ("orjson", "stdlib")
+
+BACKEND = None
+
+
+def _stdlib_dumps(obj):
+    # Mismo texto compacto que orjson: UTF-8 sin escapar y sin espacios
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _orjson_dumps(obj):
+    try:
+        return orjson.dumps(obj).decode("utf-8")
+    except TypeError:
+        # orjson rechaza claves no str y enteros de más de 64 bits; stdlib los acepta
+        return _stdlib_dumps(obj)
+
+
+def available_backends():
+    """Backends que se pueden usar en este entorno."""
+    return [name for name in BACKENDS if name != "orjson" or orjson is not None]
+
+
+def use_backend(name):
+    """
+    Activa el backend `name` ("auto", "orjson" o "stdlib") para todo el proceso.
+    Si se pide orjson y no está instalado, se usa stdlib con una advertencia.
+    """
+    global BACKEND, dumps, loads
+    if name not in ("auto",) + BACKENDS:
+        raise ValueError(f"Backend JSON desconocido: {name!r}.")
+    if name in ("auto", "orjson") and orjson is not None:
+        BACKEND, dumps, loads = "orjson", _orjson_dumps, orjson.loads
+    else:
+        if name == "orjson":
+            logger.warning("orjson no está instalado; se usa el json de la librería estándar.")
+        BACKEND, dumps, loads = "stdlib", _stdlib_dumps, json.loads
+    logger.debug(f"Backend JSON: {BACKEND}.")
+    return BACKEND
+
+
+# `dumps(obj)` devuelve str y `loads(data)` acepta str o bytes
+dumps = _stdlib_dumps
+loads = json.loads
+use_backend(BACKEND_SETTING)
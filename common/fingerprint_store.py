@@ -0,0 +1,92 @@
+import json
+import sqlite3
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(values):
+    """
+    Hash estable de un conjunto de valores (dict, lista o escalar): el mismo
+    contenido produce siempre el mismo fingerprint, sin importar el orden de las claves.
+    """
+    payload = json.dumps(values, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    """
+    Almacén local en SQLite con el último fingerprint conocido de cada registro
+    (por ejemplo, un documento o un stock de Bsale). Permite detectar qué
+    registros cambiaron desde la última carga sin consultar BigQuery.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                key INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def stored(self, keys):
+        """Fingerprints guardados de `keys`: {key: fingerprint}, sin las claves desconocidas."""
+        keys = list(keys)
+        stored = {}
+        # SQLite limita la cantidad de parámetros por consulta
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, fingerprint FROM fingerprints WHERE key IN ({','.join('?' for _ in chunk)})",
+                chunk
+            )
+            stored.update(rows)
+        return stored
+
+    def changed(self, fingerprints):
+        """
+        Recibe {key: fingerprint} y devuelve, en el mismo orden, las claves cuyo
+        fingerprint es distinto del guardado o que todavía no están en el almacén.
+        """
+        stored = self.stored(fingerprints)
+        return [key for key in fingerprints if stored.get(key) != fingerprints[key]]
+
+    def update(self, fingerprints):
+        """Guarda los fingerprints {key: fingerprint} en una sola transacción."""
+        now = self._now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (key, fingerprint, updated_at) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in fingerprints.items()]
+            )
+        logger.info(f"Se actualizaron {len(fingerprints)} fingerprints en {self.path}.")
+
+    def keys(self):
+        """Todas las claves con fingerprint guardado."""
+        return [row[0] for row in self.conn.execute("SELECT key FROM fingerprints")]
+
+    def delete(self, keys):
+        """Elimina las claves `keys` (registros que dejaron de existir en el origen)."""
+        keys = list(keys)
+        with self.conn:
+            self.conn.executemany("DELETE FROM fingerprints WHERE key = ?", [(key,) for key in keys])
+        if keys:
+            logger.info(f"Se eliminaron {len(keys)} fingerprints de {self.path}.")
+
+    def count(self):
+        """Cantidad de registros con fingerprint guardado."""
+        return self.conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,147 @@
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Estados posibles de un intervalo
+PENDING = "pending"    # Registrado, aún no descargado
+FETCHED = "fetched"    # Descargado y en el buffer, todavía no está en BigQuery
+LOADED = "loaded"      # Confirmado en BigQuery
+FAILED = "failed"      # La descarga falló; se reintenta en la siguiente ejecución
+
+
+class IntervalManifest:
+    """
+    Manifiesto local en SQLite con el estado de cada intervalo de una carga masiva.
+    Permite reanudar una carga interrumpida sin volver a descargar lo que ya
+    llegó a BigQuery y reintentar solo los intervalos fallidos. Se puede usar
+    desde varios hilos (por ejemplo, las etapas de common/pipeline.py).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS intervals (
+                firstid INTEGER PRIMARY KEY,
+                lastid INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                row_count INTEGER,
+                max_doc_id INTEGER,
+                open_ended INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        # Manifiestos creados antes de registrar el mayor id por intervalo
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(intervals)")}
+        if "max_doc_id" not in columns:
+            self.conn.execute("ALTER TABLE intervals ADD COLUMN max_doc_id INTEGER")
+        # Manifiestos creados antes de marcar el intervalo abierto del modo tail
+        if "open_ended" not in columns:
+            self.conn.execute("ALTER TABLE intervals ADD COLUMN open_ended INTEGER NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+    def _now(self):
+        return datetime.now(timezone.utc).isoformat()
+
+    def reset(self, ranges):
+        """Reemplaza el contenido del manifiesto por una nueva lista de intervalos pendientes."""
+        with self.conn:
+            self.conn.execute("DELETE FROM intervals")
+            self.conn.executemany(
+                "INSERT INTO intervals (firstid, lastid, state, updated_at) VALUES (?, ?, ?, ?)",
+                [(firstid, lastid, PENDING, self._now()) for firstid, lastid in ranges]
+            )
+        logger.info(f"Manifiesto {self.path} inicializado con {len(ranges)} intervalos.")
+
+    def add(self, ranges, open_last=False):
+        """
+        Agrega intervalos pendientes conservando el historial de los ya cargados.
+        Con `open_last`, el último de `ranges` queda marcado como abierto: sus
+        ids finales todavía no existen (ver `open_ended`).
+        """
+        last_index = len(ranges) - 1
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO intervals (firstid, lastid, state, open_ended, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (firstid, lastid, PENDING, int(open_last and index == last_index), self._now())
+                    for index, (firstid, lastid) in enumerate(ranges)
+                ]
+            )
+        logger.info(f"Se agregaron {len(ranges)} intervalos al manifiesto {self.path}.")
+
+    def mark(self, firstid, state, row_count=None, max_doc_id=None, error=None):
+        """Actualiza el estado de un intervalo."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "UPDATE intervals SET state = ?, row_count = COALESCE(?, row_count), "
+                "max_doc_id = COALESCE(?, max_doc_id), error = ?, updated_at = ? "
+                "WHERE firstid = ?",
+                (state, row_count, max_doc_id, error, self._now(), firstid)
+            )
+
+    def mark_many(self, firstids, state):
+        """Actualiza el estado de varios intervalos en una sola transacción."""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE intervals SET state = ?, error = NULL, updated_at = ? WHERE firstid = ?",
+                [(state, self._now(), firstid) for firstid in firstids]
+            )
+
+    def ranges(self, states=None):
+        """Lista ordenada de (firstid, lastid), opcionalmente filtrada por estado."""
+        query = "SELECT firstid, lastid FROM intervals"
+        params = ()
+        if states:
+            query += f" WHERE state IN ({','.join('?' for _ in states)})"
+            params = tuple(states)
+        query += " ORDER BY firstid"
+        return [(row[0], row[1]) for row in self.conn.execute(query, params)]
+
+    def open_ended(self):
+        """firstid de los intervalos marcados como abiertos, que se reanudan igual de abiertos."""
+        return {row[0] for row in self.conn.execute("SELECT firstid FROM intervals WHERE open_ended = 1")}
+
+    def unfinished(self):
+        """Intervalos que todavía no están confirmados en BigQuery."""
+        return self.ranges(states=(PENDING, FETCHED, FAILED))
+
+    def loaded_through(self):
+        """
+        Último id cubierto por el prefijo contiguo de intervalos cargados (en
+        orden de firstid), o None. Las cargas pueden confirmar lotes fuera de
+        orden; por debajo de este id no queda ningún intervalo sin cargar.
+        En un intervalo abierto se usa el mayor id obtenido, no su lastid nominal.
+        """
+        through = None
+        rows = self.conn.execute("SELECT lastid, state, open_ended, max_doc_id FROM intervals ORDER BY firstid")
+        for lastid, state, open_ended, max_doc_id in rows:
+            if state != LOADED:
+                break
+            through = max_doc_id if open_ended else lastid
+        return through
+
+    def max_loaded_id(self):
+        """Mayor id de documento confirmado en BigQuery según el manifiesto, o None."""
+        row = self.conn.execute(
+            "SELECT MAX(max_doc_id) FROM intervals WHERE state = ?", (LOADED,)
+        ).fetchone()
+        return row[0]
+
+    def summary(self):
+        """Cantidad de intervalos y filas por estado."""
+        rows = self.conn.execute(
+            "SELECT state, COUNT(*), COALESCE(SUM(row_count), 0) FROM intervals GROUP BY state"
+        )
+        return {state: {"intervals": count, "rows": total} for state, count, total in rows}
+
+    def close(self):
+        self.conn.close()
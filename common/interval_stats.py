@@ -0,0 +1,184 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from statistics import median
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Duración objetivo (segundos) de cada intervalo; 0 usa la mediana estimada de la corrida
+TARGET_SECONDS = float(os.getenv("BSALE_INTERVAL_TARGET_SECONDS", "0"))
+
+# Tope de bytes de respuesta y de páginas de detalle por intervalo
+MAX_BYTES = int(float(os.getenv("BSALE_INTERVAL_MAX_MB", "64")) * 1024 * 1024)
+MAX_DETAIL_PAGES = int(os.getenv("BSALE_INTERVAL_MAX_DETAIL_PAGES", "20"))
+
+# Métricas que se registran por intervalo
+METRICS = ("latency", "nbytes", "detail_pages")
+
+
+class IntervalObservation:
+    """
+    Acumula lo observado al descargar un intervalo: duración, bytes recibidos,
+    peticiones y páginas de detalle. Es thread-safe porque la recuperación de
+    faltantes de un intervalo usa su propio pool de hilos.
+    """
+
+    def __init__(self, firstid, lastid):
+        self.firstid = firstid
+        self.lastid = lastid
+        self.requests = 0
+        self.nbytes = 0
+        self.detail_pages = 0
+        self.rows = 0
+        self.latency = 0.0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_response(self, nbytes):
+        with self._lock:
+            self.requests += 1
+            self.nbytes += nbytes
+
+    def record_detail_pages(self, pages):
+        with self._lock:
+            self.detail_pages += pages
+
+    def finish(self, rows):
+        self.rows = rows
+        self.latency = time.monotonic() - self._start
+        return self
+
+
+class IntervalStats:
+    """
+    Estadísticas persistentes (SQLite) de los intervalos descargados, para que
+    `adapt_ranges` planifique la siguiente corrida con unidades de trabajo parejas.
+    Una observación nueva reemplaza a las anteriores que se solapan con ella.
+    `record` se puede llamar desde cualquier hilo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS interval_stats (
+                firstid INTEGER PRIMARY KEY,
+                lastid INTEGER NOT NULL,
+                latency REAL NOT NULL,
+                nbytes INTEGER NOT NULL,
+                detail_pages INTEGER NOT NULL,
+                requests INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def record(self, observation):
+        """Guarda la observación de un intervalo."""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM interval_stats WHERE firstid <= ? AND lastid >= ?",
+                (observation.lastid, observation.firstid)
+            )
+            self.conn.execute(
+                "INSERT INTO interval_stats "
+                "(firstid, lastid, latency, nbytes, detail_pages, requests, row_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (observation.firstid, observation.lastid, observation.latency, observation.nbytes,
+                 observation.detail_pages, observation.requests, observation.rows,
+                 datetime.now(timezone.utc).isoformat())
+            )
+
+    def observations(self):
+        """Lista ordenada de (firstid, lastid, {métrica: valor})."""
+        rows = self.conn.execute(
+            "SELECT firstid, lastid, latency, nbytes, detail_pages FROM interval_stats ORDER BY firstid"
+        )
+        return [(row[0], row[1], dict(zip(METRICS, row[2:]))) for row in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+def _estimate(firstid, lastid, observations, default_density):
+    """Métricas estimadas de un rango, proporcionales a su solape con lo observado."""
+    estimate = dict.fromkeys(METRICS, 0.0)
+    covered = 0
+    for obs_first, obs_last, metrics in observations:
+        overlap = min(lastid, obs_last) - max(firstid, obs_first) + 1
+        if overlap <= 0:
+            continue
+        span = obs_last - obs_first + 1
+        covered += overlap
+        for metric in METRICS:
+            estimate[metric] += metrics[metric] * overlap / span
+    uncovered = (lastid - firstid + 1) - covered
+    for metric in METRICS:
+        estimate[metric] += default_density[metric] * uncovered
+    return estimate
+
+
+def adapt_ranges(ranges, observations, target_seconds=TARGET_SECONDS,
+                 max_bytes=MAX_BYTES, max_detail_pages=MAX_DETAIL_PAGES):
+    """
+    Reparte `ranges` (lista ordenada de (firstid, lastid)) en unidades de trabajo
+    de costo parecido según las observaciones de corridas anteriores: divide los
+    rangos cuya latencia, bytes o páginas de detalle estimadas superan el
+    objetivo y une rangos contiguos livianos. Sin observaciones devuelve los
+    rangos tal cual.
+    """
+    if not ranges or not observations:
+        return list(ranges)
+
+    observed_ids = sum(last - first + 1 for first, last, _ in observations)
+    default_density = {
+        metric: sum(metrics[metric] for _, _, metrics in observations) / observed_ids
+        for metric in METRICS
+    }
+    estimates = [_estimate(first, last, observations, default_density) for first, last in ranges]
+    target = target_seconds or median(estimate["latency"] for estimate in estimates)
+    if target <= 0:
+        return list(ranges)
+
+    # Dividir los rangos pesados en partes iguales de ids
+    pieces = []
+    for (firstid, lastid), estimate in zip(ranges, estimates):
+        parts = max(
+            math.ceil(estimate["latency"] / target),
+            math.ceil(estimate["nbytes"] / max_bytes),
+            math.ceil(estimate["detail_pages"] / max_detail_pages),
+            1,
+        )
+        parts = min(parts, lastid - firstid + 1)
+        step = math.ceil((lastid - firstid + 1) / parts)
+        for start in range(firstid, lastid + 1, step):
+            end = min(start + step - 1, lastid)
+            fraction = (end - start + 1) / (lastid - firstid + 1)
+            pieces.append([start, end, {metric: value * fraction for metric, value in estimate.items()}])
+
+    # Unir piezas contiguas mientras el total siga dentro de los topes
+    adapted = []
+    for start, end, estimate in pieces:
+        if adapted:
+            previous = adapted[-1]
+            combined = {metric: previous[2][metric] + estimate[metric] for metric in METRICS}
+            if (previous[1] + 1 == start and combined["latency"] <= target
+                    and combined["nbytes"] <= max_bytes and combined["detail_pages"] <= max_detail_pages):
+                previous[1] = end
+                previous[2] = combined
+                continue
+        adapted.append([start, end, estimate])
+
+    logger.info(
+        f"Intervalos adaptados: {len(ranges)} -> {len(adapted)} "
+        f"(objetivo {target:.2f}s, máx. {max_bytes // (1024 * 1024)} MB y {max_detail_pages} páginas de detalle por intervalo)."
+    )
+    return [(start, end) for start, end, _ in adapted]
@@ -0,0 +1,70 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Cargas a BigQuery simultáneas por defecto
+MAX_LOADS_IN_FLIGHT = int(os.getenv("BIGQUERY_MAX_LOADS_IN_FLIGHT", "2"))
+
+
+class BackgroundLoader:
+    """
+    Ejecuta las cargas a BigQuery en hilos de fondo para que la extracción siga
+    mientras BigQuery ingiere cada lote. `submit` bloquea cuando ya hay
+    `max_in_flight` cargas en curso (backpressure). Los callbacks `on_success`
+    se ejecutan en el hilo que llama a `poll` / `wait_all`, en orden de envío.
+    Las funciones de carga deben lanzar una excepción si fallan.
+    """
+
+    def __init__(self, max_in_flight=MAX_LOADS_IN_FLIGHT, name="BigQuery"):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"carga-{name}")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending = []
+        self.errors = []
+
+    def submit(self, fn, *args, description="", on_success=None, **kwargs):
+        """Encola una carga. Bloquea si se alcanzó el máximo de cargas en curso."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append((description, future, on_success))
+        logger.info(f"Carga encolada en segundo plano ({self.name}): {description}")
+        self.poll()
+
+    def _settle(self, description, future, on_success):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Falló la carga en segundo plano ({self.name}) {description}: {e}")
+            self.errors.append((description, e))
+            return
+        if on_success:
+            on_success(result)
+
+    def poll(self):
+        """Procesa, en orden de envío, las cargas que ya terminaron."""
+        while self._pending and self._pending[0][1].done():
+            self._settle(*self._pending.pop(0))
+
+    def wait_all(self, raise_on_error=True):
+        """
+        Espera todas las cargas pendientes. Si alguna falló y `raise_on_error`,
+        lanza RuntimeError para que el proceso termine con error.
+        """
+        while self._pending:
+            self._settle(*self._pending.pop(0))
+        self._executor.shutdown(wait=True)
+
+        if self.errors:
+            logger.error(f"{len(self.errors)} cargas fallaron ({self.name}): {[d for d, _ in self.errors]}")
+            if raise_on_error:
+                raise RuntimeError(f"Fallaron {len(self.errors)} cargas a BigQuery ({self.name}).")
+        else:
+            logger.info(f"Todas las cargas en segundo plano ({self.name}) finalizaron correctamente.")
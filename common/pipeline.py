@@ -0,0 +1,228 @@
+import os
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se informa el estado de las etapas y las colas
+REPORT_SECONDS = float(os.getenv("PIPELINE_REPORT_SECONDS", "30"))
+
+# Marca de fin de datos que recorre las colas
+_DONE = object()
+
+# Espera máxima de cada intento de put/get, para poder revisar si el pipeline se detuvo
+_POLL_SECONDS = 0.5
+
+
+class StageStats:
+    """Contadores de una etapa: elementos recibidos y emitidos, tiempo ocupado y errores."""
+
+    def __init__(self):
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.errors = 0
+        self.max_queue = 0
+        self._lock = threading.Lock()
+
+    def record(self, busy, items_out, error=False):
+        with self._lock:
+            self.items_in += 1
+            self.items_out += items_out
+            self.busy += busy
+            self.errors += int(error)
+
+
+class Stage:
+    """
+    Una etapa del pipeline: `workers` hilos que toman elementos de una cola
+    acotada a `queue_size` y llaman a `fn(elemento)`.
+
+    - `fn` devuelve el elemento para la etapa siguiente, o None si no emite nada;
+      con `fan_out=True` devuelve un iterable y se emite cada uno de sus elementos.
+    - `flush()` (opcional) se llama una vez, cuando la etapa terminó su entrada,
+      y su resultado se emite igual que el de `fn` (útil para etapas que acumulan).
+    - Si `fn` lanza una excepción y `stop_on_error`, el pipeline se detiene; si no,
+      el error se registra, el elemento se descarta y la etapa sigue.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None, flush=None, fan_out=False, stop_on_error=True):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size or workers * 2)
+        self.flush = flush
+        self.fan_out = fan_out
+        self.stop_on_error = stop_on_error
+        self.stats = StageStats()
+        self._running = workers
+        self._lock = threading.Lock()
+
+    def outputs(self, result):
+        if result is None:
+            return []
+        return result if self.fan_out else [result]
+
+
+class Pipeline:
+    """
+    Pipeline productor/consumidor en hilos: las etapas (por ejemplo descarga,
+    transformación y carga) se conectan con colas acotadas, así una etapa lenta
+    frena a las anteriores (backpressure) en vez de acumular memoria, y ninguna
+    espera a que las otras terminen un lote para seguir trabajando.
+
+    `run(source)` alimenta la primera etapa con los elementos de `source`,
+    espera a que todas terminen, informa periódicamente el throughput y la
+    profundidad de cada cola, y lanza RuntimeError si alguna etapa tuvo errores.
+    """
+
+    def __init__(self, name, report_seconds=REPORT_SECONDS):
+        self.name = name
+        self.report_seconds = report_seconds
+        self.stages = []
+        self.errors = []
+        self._stop = threading.Event()
+        self._errors_lock = threading.Lock()
+        self._start = None
+
+    def add_stage(self, name, fn, **options):
+        """Agrega una etapa al final del pipeline (ver `Stage`). Devuelve el pipeline."""
+        self.stages.append(Stage(name, fn, **options))
+        return self
+
+    def _put(self, stage, item):
+        """Encola en `stage`, bloqueando mientras la cola esté llena. False si el pipeline se detuvo."""
+        while not self._stop.is_set():
+            try:
+                stage.queue.put(item, timeout=_POLL_SECONDS)
+            except queue.Full:
+                continue
+            stage.stats.max_queue = max(stage.stats.max_queue, stage.queue.qsize())
+            return True
+        return False
+
+    def _emit(self, index, outputs):
+        """
+        Entrega `outputs` a la etapa siguiente. Devuelve (emitidos, segundos
+        esperando por cola llena), para no contar la espera como tiempo ocupado.
+        """
+        if index + 1 >= len(self.stages):
+            # La última etapa no tiene a quién entregar: sus resultados solo se cuentan
+            return sum(1 for _ in outputs), 0.0
+        emitted = 0
+        waited = 0.0
+        for output in outputs:
+            started = time.monotonic()
+            delivered = self._put(self.stages[index + 1], output)
+            waited += time.monotonic() - started
+            if not delivered:
+                break
+            emitted += 1
+        return emitted, waited
+
+    def _fail(self, stage, error):
+        with self._errors_lock:
+            self.errors.append((stage.name, error))
+        if stage.stop_on_error:
+            logger.error(f"Pipeline {self.name}: la etapa '{stage.name}' falló y se detiene el pipeline: {error}")
+            self._stop.set()
+        else:
+            logger.error(f"Pipeline {self.name}: error en la etapa '{stage.name}', se descarta el elemento: {error}")
+
+    def _feed(self, source):
+        first = self.stages[0]
+        try:
+            for item in source:
+                if not self._put(first, item):
+                    return
+        except Exception as e:
+            # Un origen que falla (por ejemplo, una paginación cortada) detiene el pipeline
+            self._fail(Stage("source", None), e)
+        finally:
+            for _ in range(first.workers):
+                self._put(first, _DONE)
+
+    def _work(self, index):
+        stage = self.stages[index]
+        while not self._stop.is_set():
+            try:
+                item = stage.queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            started = time.monotonic()
+            try:
+                # Con fan_out, `fn` puede ser un generador que trabaja mientras se emite
+                emitted, waited = self._emit(index, stage.outputs(stage.fn(item)))
+                stage.stats.record(time.monotonic() - started - waited, emitted)
+            except Exception as e:
+                stage.stats.record(time.monotonic() - started, 0, error=True)
+                self._fail(stage, e)
+
+        # El último hilo de la etapa hace el flush y avisa el fin a la siguiente
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if not last:
+            return
+        if stage.flush is not None and not self._stop.is_set():
+            try:
+                self._emit(index, stage.outputs(stage.flush()))
+            except Exception as e:
+                self._fail(stage, e)
+        if index + 1 < len(self.stages):
+            for _ in range(self.stages[index + 1].workers):
+                self._put(self.stages[index + 1], _DONE)
+
+    def report(self, final=False):
+        """Registra el estado de cada etapa: elementos, throughput, ocupación y cola."""
+        elapsed = max(time.monotonic() - self._start, 1e-9)
+        parts = []
+        for stage in self.stages:
+            stats = stage.stats
+            utilization = stats.busy / (elapsed * stage.workers)
+            parts.append(
+                f"{stage.name}: {stats.items_in} elementos ({stats.items_in / elapsed:.2f}/s, "
+                f"ocupación {utilization:.0%}, {stats.errors} errores), "
+                f"cola {stage.queue.qsize()}/{stage.queue.maxsize} (máx. {stats.max_queue})"
+            )
+        label = "resumen" if final else f"{elapsed:.0f}s"
+        logger.info(f"Pipeline {self.name} [{label}] " + " | ".join(parts))
+
+    def _report_periodically(self):
+        while not self._stop.wait(self.report_seconds):
+            self.report()
+
+    def run(self, source):
+        """Ejecuta el pipeline sobre `source` y espera a que termine."""
+        if not self.stages:
+            raise ValueError(f"El pipeline {self.name} no tiene etapas.")
+        self._start = time.monotonic()
+        threads = [threading.Thread(target=self._feed, args=(source,), name=f"{self.name}-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=self._work, args=(index,), name=f"{self.name}-{stage.name}-{n}", daemon=True)
+                for n in range(stage.workers)
+            )
+        reporter = threading.Thread(target=self._report_periodically, name=f"{self.name}-report", daemon=True)
+
+        for thread in threads:
+            thread.start()
+        reporter.start()
+        try:
+            for thread in threads:
+                thread.join()
+        finally:
+            # Detiene también el reporte periódico
+            self._stop.set()
+            reporter.join()
+            self.report(final=True)
+
+        if self.errors:
+            raise RuntimeError(
+                f"El pipeline {self.name} terminó con {len(self.errors)} errores: "
+                f"{[(name, str(error)) for name, error in self.errors]}"
+            )
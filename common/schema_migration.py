@@ -0,0 +1,118 @@
+"""
+Migración única de las tablas creadas con autodetect (o con columnas STRING) al
+esquema declarado en common/schemas.py. Recrea la tabla con SAFE_CAST en las
+columnas cuyo tipo no coincide; los valores que no se pueden convertir quedan
+en NULL. Las tablas de documentos, líneas y referencias se recrean además con
+la partición y el clustering por emissionDate de `schemas.TABLE_LAYOUTS`. Si la
+tabla ya está al día no hace nada, así que se puede correr más de una vez:
+
+    python common/schema_migration.py
+"""
+import os
+import sys
+import logging
+from dotenv import load_dotenv
+from google.api_core.exceptions import NotFound
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common import bigquery_sink, schemas
+
+logger = logging.getLogger(__name__)
+
+# Nombres estándar que devuelve la API para los tipos de columnas existentes
+_TYPE_ALIASES = {"INT64": "INTEGER", "FLOAT64": "FLOAT", "BOOL": "BOOLEAN"}
+
+
+def _cast_expression(name, current_type, type_name):
+    """Expresión SQL que convierte la columna `name` al tipo declarado."""
+    if type_name == "INT64" and current_type == "STRING":
+        # pandas guardaba los enteros con NaN como "123.0"
+        return f"COALESCE(SAFE_CAST(`{name}` AS INT64), SAFE_CAST(SAFE_CAST(`{name}` AS FLOAT64) AS INT64))"
+    return f"SAFE_CAST(`{name}` AS {type_name})"
+
+
+def mismatched_columns(table, schema_name):
+    """Columnas escalares de `table` cuyo tipo no es el declarado: {columna: (actual, declarado)}."""
+    current = {field.name: _TYPE_ALIASES.get(field.field_type, field.field_type) for field in table.schema}
+    mismatched = {}
+    for name, type_spec in schemas.TABLE_SCHEMAS[schema_name]:
+        if not isinstance(type_spec, str) or name not in current:
+            continue
+        if current[name] != schemas.TYPES[type_spec][1]:
+            mismatched[name] = (current[name], type_spec)
+    return mismatched
+
+
+def layout_matches(table, schema_name):
+    """True si la partición y el clustering de `table` son los declarados para `schema_name`."""
+    layout = schemas.table_layout(schema_name)
+    partition_by = layout.get("partition_by")
+    current_partition = None
+    if table.range_partitioning is not None:
+        partition_range = table.range_partitioning.range_
+        current_partition = (
+            table.range_partitioning.field, partition_range.start, partition_range.end, partition_range.interval
+        )
+    return current_partition == partition_by and (table.clustering_fields or None) == layout.get("cluster_by")
+
+
+def migrate_table(table_name, schema_name):
+    """
+    Recrea `table_name` con los tipos, la partición y el clustering del esquema
+    `schema_name`. Devuelve True si la tabla se recreó y False si no existe o ya
+    estaba al día.
+    """
+    table_id = bigquery_sink.table_ref(table_name)
+    try:
+        table = bigquery_sink.get_client().get_table(table_id)
+    except NotFound:
+        logger.info(f"{table_id} no existe; se creará con el esquema declarado en la primera carga.")
+        return False
+
+    mismatched = mismatched_columns(table, schema_name)
+    if not mismatched and layout_matches(table, schema_name):
+        logger.info(f"{table_id} ya tiene los tipos y la distribución declarados.")
+        return False
+
+    select_list = ",\n            ".join(
+        f"{_cast_expression(field.name, *mismatched[field.name])} AS `{field.name}`"
+        if field.name in mismatched else f"`{field.name}`"
+        for field in table.schema
+    )
+    bigquery_sink.query(f"""
+        CREATE OR REPLACE TABLE `{table_id}`
+        {bigquery_sink.layout_ddl(**schemas.table_layout(schema_name))}
+        AS SELECT
+            {select_list}
+        FROM `{table_id}`
+    """)
+    for name, (current_type, type_name) in mismatched.items():
+        logger.info(f"{table_id}.{name}: {current_type} -> {type_name}")
+    logger.info(f"{table_id} recreada con el esquema declarado {schema_name}.")
+    return True
+
+
+def declared_tables():
+    """Tablas de las cargas que usan esquema declarado: [(tabla, esquema)]."""
+    tables = [
+        ("meta_insights", "meta_insights"),
+        ("meta_dim_creative", "meta_dim_creative"),
+        ("bsale_stock_actual", "bsale_stock_actual"),
+    ]
+    if os.getenv("BIGQUERY_TABLE"):
+        tables.append((os.getenv("BIGQUERY_TABLE"), "bsale_documents"))
+    tables += [
+        (os.getenv("BIGQUERY_TABLE_NESTED", "bsale_documents_nested"), "bsale_documents_nested"),
+        (os.getenv("BIGQUERY_TABLE_LINES", "bsale_document_lines"), "bsale_document_lines"),
+        (os.getenv("BIGQUERY_TABLE_REFERENCES", "bsale_document_references"), "bsale_document_references"),
+    ]
+    if os.getenv("BIGQUERY_TABLE_ORDERS_SHOPIFY"):
+        tables.append((os.getenv("BIGQUERY_TABLE_ORDERS_SHOPIFY"), "shopify_orders"))
+    return tables
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    for table_name, schema_name in declared_tables():
+        migrate_table(table_name, schema_name)
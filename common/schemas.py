@@ -0,0 +1,440 @@
+import logging
+import pandas as pd
+import pyarrow as pa
+from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+# Tipos soportados: (tipo pyarrow, tipo BigQuery)
+TYPES = {
+    "INT64": (pa.int64(), "INTEGER"),
+    "FLOAT64": (pa.float64(), "FLOAT"),
+    "STRING": (pa.string(), "STRING"),
+    "BOOL": (pa.bool_(), "BOOLEAN"),
+    "DATE": (pa.date32(), "DATE"),
+    "TIMESTAMP": (pa.timestamp("us", tz="UTC"), "TIMESTAMP"),
+}
+
+
+def STRUCT(*fields):
+    """Tipo anidado: lista ordenada de (campo, tipo)."""
+    return ("STRUCT", list(fields))
+
+
+def ARRAY(element_type):
+    """Tipo repetido; en BigQuery se declara como columna REPEATED."""
+    return ("ARRAY", element_type)
+
+
+# Objetos anidados de un documento de Bsale (modo de ingesta "nested")
+_BSALE_VARIANT = STRUCT(
+    ("id", "INT64"),
+    ("description", "STRING"),
+    ("code", "STRING"),
+    ("barCode", "STRING"),
+    ("product", STRUCT(("id", "INT64"))),
+)
+
+BSALE_DOCUMENT_NESTED_FIELDS = [
+    ("document_type", STRUCT(
+        ("id", "INT64"),
+        ("name", "STRING"),
+        ("code", "STRING"),
+        ("codeSii", "STRING"),
+        ("isElectronicDocument", "INT64"),
+        ("isCreditNote", "INT64"),
+    )),
+    ("client", STRUCT(
+        ("id", "INT64"),
+        ("code", "STRING"),
+        ("firstName", "STRING"),
+        ("lastName", "STRING"),
+        ("company", "STRING"),
+        ("email", "STRING"),
+        ("phone", "STRING"),
+        ("address", "STRING"),
+        ("city", "STRING"),
+        ("municipality", "STRING"),
+    )),
+    ("office", STRUCT(
+        ("id", "INT64"),
+        ("name", "STRING"),
+        ("address", "STRING"),
+        ("city", "STRING"),
+        ("municipality", "STRING"),
+        ("country", "STRING"),
+    )),
+    ("user", STRUCT(
+        ("id", "INT64"),
+        ("firstName", "STRING"),
+        ("lastName", "STRING"),
+        ("email", "STRING"),
+    )),
+    ("references", ARRAY(STRUCT(
+        ("id", "INT64"),
+        ("number", "STRING"),
+        ("referenceDate", "INT64"),
+        ("reason", "STRING"),
+        ("codeSii", "STRING"),
+    ))),
+    ("document_taxes", ARRAY(STRUCT(
+        ("id", "INT64"),
+        ("totalAmount", "FLOAT64"),
+        ("tax", STRUCT(("id", "INT64"))),
+    ))),
+    ("details", ARRAY(STRUCT(
+        ("id", "INT64"),
+        ("lineNumber", "INT64"),
+        ("quantity", "FLOAT64"),
+        ("netUnitValue", "FLOAT64"),
+        ("totalUnitValue", "FLOAT64"),
+        ("netAmount", "FLOAT64"),
+        ("taxAmount", "FLOAT64"),
+        ("totalAmount", "FLOAT64"),
+        ("netDiscount", "FLOAT64"),
+        ("totalDiscount", "FLOAT64"),
+        ("note", "STRING"),
+        ("relatedDetailId", "INT64"),
+        ("variant", _BSALE_VARIANT),
+    ))),
+    ("sellers", ARRAY(STRUCT(
+        ("id", "INT64"),
+        ("firstName", "STRING"),
+        ("lastName", "STRING"),
+    ))),
+    ("payments", ARRAY(STRUCT(
+        ("id", "INT64"),
+        ("amount", "FLOAT64"),
+        ("recordDate", "INT64"),
+        ("payment_type", STRUCT(("id", "INT64"), ("name", "STRING"))),
+    ))),
+]
+
+# Esquema declarado de cada tabla destino: lista ordenada de (columna, tipo)
+TABLE_SCHEMAS = {
+    "bsale_documents": [
+        ("id", "INT64"),
+        ("emissionDate", "INT64"),
+        ("expirationDate", "INT64"),
+        ("generationDate", "INT64"),
+        ("number", "INT64"),
+        ("totalAmount", "FLOAT64"),
+        ("netAmount", "FLOAT64"),
+        ("taxAmount", "FLOAT64"),
+        ("state", "INT64"),
+        ("document_type", "STRING"),
+        ("client", "STRING"),
+        ("office", "STRING"),
+        ("user", "STRING"),
+        ("references", "STRING"),
+        ("document_taxes", "STRING"),
+        ("details", "STRING"),
+        ("sellers", "STRING"),
+        ("payments", "STRING"),
+        ("expand_profile", "STRING"),
+    ],
+    # Mismo documento con los objetos anidados como STRUCT/ARRAY nativos
+    "bsale_documents_nested": [
+        ("id", "INT64"),
+        ("emissionDate", "INT64"),
+        ("expirationDate", "INT64"),
+        ("generationDate", "INT64"),
+        ("number", "INT64"),
+        ("totalAmount", "FLOAT64"),
+        ("netAmount", "FLOAT64"),
+        ("taxAmount", "FLOAT64"),
+        ("state", "INT64"),
+    ] + BSALE_DOCUMENT_NESTED_FIELDS + [
+        ("expand_profile", "STRING"),
+    ],
+    # Una fila por línea de detalle, con las claves del documento desnormalizadas
+    "bsale_document_lines": [
+        ("document_id", "INT64"),
+        ("document_number", "INT64"),
+        ("emissionDate", "INT64"),
+        ("expirationDate", "INT64"),
+        ("generationDate", "INT64"),
+        ("document_totalAmount", "FLOAT64"),
+        ("document_netAmount", "FLOAT64"),
+        ("document_taxAmount", "FLOAT64"),
+        ("state", "INT64"),
+        ("document_type_id", "INT64"),
+        ("client_id", "INT64"),
+        ("office_id", "INT64"),
+        ("user_id", "INT64"),
+        ("detail_id", "INT64"),
+        ("lineNumber", "INT64"),
+        ("quantity", "FLOAT64"),
+        ("netUnitValue", "FLOAT64"),
+        ("totalUnitValue", "FLOAT64"),
+        ("netAmount", "FLOAT64"),
+        ("taxAmount", "FLOAT64"),
+        ("totalAmount", "FLOAT64"),
+        ("netDiscount", "FLOAT64"),
+        ("totalDiscount", "FLOAT64"),
+        ("note", "STRING"),
+        ("relatedDetailId", "INT64"),
+        ("variant_id", "INT64"),
+        ("variant_code", "STRING"),
+        ("variant_description", "STRING"),
+        ("product_id", "INT64"),
+    ],
+    # Una fila por referencia de un documento
+    "bsale_document_references": [
+        ("document_id", "INT64"),
+        ("emissionDate", "INT64"),
+        ("reference_id", "INT64"),
+        ("number", "STRING"),
+        ("referenceDate", "INT64"),
+        ("reason", "STRING"),
+        ("codeSii", "STRING"),
+    ],
+    "bsale_stock_actual": [
+        ("id", "INT64"),
+        ("quantity", "FLOAT64"),
+        ("quantityReserved", "FLOAT64"),
+        ("quantityAvailable", "FLOAT64"),
+        ("variant", "STRING"),
+        ("office", "STRING"),
+    ],
+    # Historial de stock (BSALE_STOCK_MODE=history): una fila por versión de cada
+    # stock; la versión vigente tiene valid_to NULL
+    "bsale_stock_history": [
+        ("id", "INT64"),
+        ("quantity", "FLOAT64"),
+        ("quantityReserved", "FLOAT64"),
+        ("quantityAvailable", "FLOAT64"),
+        ("variant", "STRING"),
+        ("office", "STRING"),
+        ("valid_from", "TIMESTAMP"),
+        ("valid_to", "TIMESTAMP"),
+    ],
+    # Dimensiones de Bsale escritas en la ingesta (BSALE_INTERN_DIMENSIONS): una fila
+    # por objeto distinto y extractor, con el objeto completo como texto JSON
+    "bsale_dimension": [
+        ("id", "INT64"),
+        ("source", "STRING"),
+        ("data", "STRING"),
+        ("seen_at", "TIMESTAMP"),
+    ],
+    "meta_insights": [
+        ("id", "STRING"),
+        ("ad_id", "STRING"),
+        ("ad_name", "STRING"),
+        ("adset_id", "STRING"),
+        ("adset_name", "STRING"),
+        ("campaign_id", "STRING"),
+        ("campaign_name", "STRING"),
+        ("impressions", "INT64"),
+        ("clicks", "INT64"),
+        ("ctr", "FLOAT64"),
+        ("spend", "FLOAT64"),
+        ("date_start", "DATE"),
+        ("date_stop", "DATE"),
+        ("actions", "STRING"),
+        ("action_values", "STRING"),
+        ("purchases", "INT64"),
+        ("purchase_value", "FLOAT64"),
+        ("status", "STRING"),
+        ("effective_status", "STRING"),
+        ("daily_budget_adset", "INT64"),
+        ("lifetime_budget_adset", "INT64"),
+        ("budget_remaining_adset", "INT64"),
+        ("daily_budget_campaign", "INT64"),
+        ("lifetime_budget_campaign", "INT64"),
+        ("budget_remaining_campaign", "INT64"),
+    ],
+    "meta_dim_creative": [
+        ("ad_creative_id", "STRING"),
+        ("name", "STRING"),
+        ("body", "STRING"),
+        ("title", "STRING"),
+        ("image_url", "STRING"),
+        ("thumbnail_url", "STRING"),
+        ("video_id", "STRING"),
+        ("object_story_id", "STRING"),
+        ("status", "STRING"),
+        ("call_to_action_type", "STRING"),
+        ("object_type", "STRING"),
+        ("template_url", "STRING"),
+        ("object_story_spec", "STRING"),
+        ("ad_id", "STRING"),
+    ],
+    "shopify_orders": [
+        ("id", "INT64"),
+        ("admin_graphql_api_id", "STRING"),
+        ("app_id", "INT64"),
+        ("browser_ip", "STRING"),
+        ("cancel_reason", "STRING"),
+        ("cancelled_at", "TIMESTAMP"),
+        ("cart_token", "STRING"),
+        ("checkout_id", "INT64"),
+        ("closed_at", "TIMESTAMP"),
+        ("created_at", "TIMESTAMP"),
+        ("currency", "STRING"),
+        ("current_total_price", "FLOAT64"),
+        ("customer_locale", "STRING"),
+        ("device_id", "INT64"),
+        ("discount_codes", "STRING"),
+        ("email", "STRING"),
+        ("financial_status", "STRING"),
+        ("fulfillment_status", "STRING"),
+        ("gateway", "STRING"),
+        ("landing_site", "STRING"),
+        ("name", "STRING"),
+        ("note", "STRING"),
+        ("number", "INT64"),
+        ("order_number", "INT64"),
+        ("payment_gateway_names", "STRING"),
+        ("phone", "STRING"),
+        ("processed_at", "TIMESTAMP"),
+        ("referring_site", "STRING"),
+        ("subtotal_price", "FLOAT64"),
+        ("tags", "STRING"),
+        ("taxes_included", "BOOL"),
+        ("total_discounts", "FLOAT64"),
+        ("total_line_items_price", "FLOAT64"),
+        ("total_price", "FLOAT64"),
+        ("total_shipping_price_set", "STRING"),
+        ("total_tax", "FLOAT64"),
+        ("total_weight", "INT64"),
+        ("updated_at", "TIMESTAMP"),
+        ("user_id", "INT64"),
+        ("billing_address", "STRING"),
+        ("customer", "STRING"),
+        ("shipping_address", "STRING"),
+        ("line_items", "STRING"),
+    ],
+}
+
+# Partición de las tablas de documentos por emissionDate (segundos Unix, medianoche):
+# RANGE_BUCKET de 30 días desde 2015-01-01 hasta 2045-01-01, unas 365 particiones
+EMISSION_DATE_PARTITION = ("emissionDate", 1420070400, 2366841600, 30 * 24 * 60 * 60)
+
+# Distribución física de las tablas que se filtran por fecha de emisión:
+# {esquema: (partición por rango, columnas de clustering)}
+TABLE_LAYOUTS = {
+    "bsale_documents": (EMISSION_DATE_PARTITION, ["emissionDate", "id"]),
+    "bsale_documents_nested": (EMISSION_DATE_PARTITION, ["emissionDate", "id"]),
+    "bsale_document_lines": (EMISSION_DATE_PARTITION, ["emissionDate", "document_id"]),
+    "bsale_document_references": (EMISSION_DATE_PARTITION, ["emissionDate", "document_id"]),
+}
+
+
+def _fields(table_name):
+    try:
+        return TABLE_SCHEMAS[table_name]
+    except KeyError:
+        raise KeyError(f"La tabla {table_name} no tiene un esquema declarado en common/schemas.py.")
+
+
+def column_names(table_name):
+    """Columnas declaradas de la tabla, en orden."""
+    return [name for name, _ in _fields(table_name)]
+
+
+def _arrow_type(type_spec):
+    if isinstance(type_spec, str):
+        return TYPES[type_spec][0]
+    kind, inner = type_spec
+    if kind == "STRUCT":
+        return pa.struct([(name, _arrow_type(spec)) for name, spec in inner])
+    return pa.list_(_arrow_type(inner))
+
+
+def _bigquery_field(name, type_spec, mode="NULLABLE"):
+    if isinstance(type_spec, str):
+        return bigquery.SchemaField(name, TYPES[type_spec][1], mode=mode)
+    kind, inner = type_spec
+    if kind == "STRUCT":
+        subfields = [_bigquery_field(sub_name, spec) for sub_name, spec in inner]
+        return bigquery.SchemaField(name, "RECORD", mode=mode, fields=subfields)
+    return _bigquery_field(name, inner, mode="REPEATED")
+
+
+def arrow_schema(table_name):
+    """Esquema pyarrow de la tabla."""
+    return pa.schema([(name, _arrow_type(spec)) for name, spec in _fields(table_name)])
+
+
+def bigquery_schema(table_name):
+    """Esquema de BigQuery de la tabla (columnas NULLABLE; ARRAY como REPEATED)."""
+    return [_bigquery_field(name, spec) for name, spec in _fields(table_name)]
+
+
+def conform(value, type_spec):
+    """
+    Ajusta un valor JSON al tipo declarado: en los STRUCT conserva solo los
+    campos declarados, en los ARRAY descarta nulos y convierte los escalares.
+    Lanza ValueError si un valor no se puede convertir.
+    """
+    if value is None or value != value:  # None o NaN de pandas
+        return [] if isinstance(type_spec, tuple) and type_spec[0] == "ARRAY" else None
+    if isinstance(type_spec, tuple):
+        kind, inner = type_spec
+        if kind == "STRUCT":
+            if not isinstance(value, dict):
+                raise ValueError(f"Se esperaba un objeto y llegó {type(value).__name__}")
+            return {name: conform(value.get(name), spec) for name, spec in inner}
+        if not isinstance(value, list):
+            raise ValueError(f"Se esperaba una lista y llegó {type(value).__name__}")
+        return [conform(item, inner) for item in value if item is not None]
+    if type_spec == "INT64":
+        return int(value)
+    if type_spec == "FLOAT64":
+        return float(value)
+    if type_spec == "STRING":
+        return value if isinstance(value, str) else str(value)
+    if type_spec == "BOOL":
+        return bool(value)
+    return value
+
+
+def _coerce(series, type_name):
+    if isinstance(type_name, tuple):
+        return series.map(lambda value: conform(value, type_name))
+    if type_name == "INT64":
+        return pd.to_numeric(series, errors="raise").astype("Int64")
+    if type_name == "FLOAT64":
+        return pd.to_numeric(series, errors="raise").astype("float64")
+    if type_name == "BOOL":
+        return series.astype("boolean")
+    if type_name == "DATE":
+        return pd.to_datetime(series, errors="raise").dt.date
+    if type_name == "TIMESTAMP":
+        return pd.to_datetime(series, utc=True, errors="raise")
+    return series
+
+
+def to_arrow_table(table_name, df):
+    """
+    Valida un DataFrame contra el esquema declarado y lo convierte en una tabla
+    pyarrow lista para cargar sin autodetect. Las columnas declaradas que falten
+    se cargan como NULL; columnas no declaradas o valores que no se puedan
+    convertir al tipo declarado lanzan ValueError antes de enviar la carga.
+    """
+    fields = _fields(table_name)
+    names = [name for name, _ in fields]
+
+    extra = [column for column in df.columns if column not in names]
+    if extra:
+        raise ValueError(f"Columnas no declaradas en el esquema de {table_name}: {extra}")
+
+    df = df.reindex(columns=names)
+    try:
+        for name, type_name in fields:
+            df[name] = _coerce(df[name], type_name)
+        return pa.Table.from_pandas(df, schema=arrow_schema(table_name), preserve_index=False)
+    except (ValueError, TypeError, pa.ArrowException) as e:
+        raise ValueError(f"Los datos no cumplen el esquema de {table_name}: {e}") from e
+
+
+def table_layout(table_name):
+    """
+    Partición y clustering declarados de la tabla, como argumentos `partition_by`
+    y `cluster_by` de bigquery_sink; vacío si la tabla no declara distribución.
+    """
+    if table_name not in TABLE_LAYOUTS:
+        return {}
+    partition_by, cluster_by = TABLE_LAYOUTS[table_name]
+    return {"partition_by": partition_by, "cluster_by": cluster_by}
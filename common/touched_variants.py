@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Almacén compartido por las cargas que mueven stock (documentos, recepciones y
+# consumos) y el refresco dirigido de stock_masivo_actual (BSALE_STOCK_SCOPE=targeted)
+TOUCHED_VARIANTS_PATH = os.getenv(
+    "BSALE_TOUCHED_VARIANTS",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "bsale", "components", "stock", "touched_variants.sqlite"
+    )
+)
+
+# Recepciones y consumos se descargan completos en cada corrida; solo se registran
+# las variantes de los movimientos de los últimos días
+RECENT_DAYS = float(os.getenv("BSALE_TOUCHED_VARIANTS_DAYS", "2"))
+
+
+def is_recent(unix_timestamp, days=RECENT_DAYS):
+    """True si la fecha de Bsale (segundos Unix) cae dentro de los últimos `days` días."""
+    if unix_timestamp is None:
+        return False
+    return datetime.now(timezone.utc).timestamp() - float(unix_timestamp) <= days * 86400
+
+
+class TouchedVariants:
+    """
+    Cola local en SQLite de los variant_id que aparecieron en las últimas
+    cargas de documentos, recepciones y consumos, es decir, las variantes
+    cuyo stock pudo cambiar. El refresco dirigido lee lo pendiente con
+    `pending` y, cuando terminó bien, lo descarta con `acknowledge`; lo que
+    se registre mientras tanto queda para el refresco siguiente.
+    """
+
+    def __init__(self, path=TOUCHED_VARIANTS_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS touched_variants (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                variant_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                seen_at TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def record(self, source, variant_ids):
+        """Registra las variantes vistas por la carga `source` (por ejemplo "carga_diaria")."""
+        variant_ids = sorted({int(variant_id) for variant_id in variant_ids if variant_id is not None})
+        now = datetime.now(timezone.utc).isoformat()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO touched_variants (variant_id, source, seen_at) VALUES (?, ?, ?)",
+                [(variant_id, source, now) for variant_id in variant_ids]
+            )
+        logger.info(f"{source}: {len(variant_ids)} variantes registradas para el refresco de stock.")
+
+    def pending(self):
+        """
+        Variantes pendientes de refrescar: (lista ordenada de variant_id, marca).
+        La marca se entrega a `acknowledge` al terminar el refresco.
+        """
+        mark = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM touched_variants").fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT DISTINCT variant_id FROM touched_variants WHERE seq <= ? ORDER BY variant_id", (mark,)
+        )
+        return [row[0] for row in rows], mark
+
+    def acknowledge(self, mark):
+        """Descarta las variantes registradas hasta `mark` (ya refrescadas)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM touched_variants WHERE seq <= ?", (mark,))
+
+    def close(self):
+        self.conn.close()
+
+
+def record_touched_variants(source, variant_ids):
+    """
+    Atajo para las cargas: registra `variant_ids` en el almacén compartido.
+    Un error aquí no debe hacer fallar la carga, solo se pierde el refresco dirigido.
+    """
+    try:
+        store = TouchedVariants()
+        try:
+            store.record(source, variant_ids)
+        finally:
+            store.close()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(f"No se pudieron registrar las variantes de {source} para el refresco de stock: {e}")
@@ -0,0 +1,71 @@
+import os
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Procesos del pool de transformación: "auto" usa los núcleos disponibles
+# menos uno (el proceso principal sigue descargando); "0" transforma en línea
+TRANSFORM_PROCESSES = os.getenv("TRANSFORM_PROCESSES", "auto")
+
+
+def available_cpus():
+    """Núcleos que puede usar este proceso (respeta la afinidad del contenedor o VM)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def resolve_processes(setting=TRANSFORM_PROCESSES):
+    """Cantidad de procesos para `setting` ("auto" o un entero); 0 significa en línea."""
+    if str(setting).lower() == "auto":
+        return max(available_cpus() - 1, 0)
+    return max(int(setting), 0)
+
+
+class TransformPool:
+    """
+    Etapa de transformación para trabajo CPU (armar filas y batches columnares)
+    fuera del GIL del proceso que descarga. `submit(fn, *args)` devuelve un
+    Future con el resultado de `fn`, que debe ser una función de módulo y
+    recibir y devolver objetos serializables (por ejemplo RecordBatch de pyarrow).
+
+    Con 0 procesos (o un solo núcleo) la función se ejecuta en línea en el hilo
+    que llama, con el mismo contrato, así el llamador no distingue los modos.
+    Los procesos se crean con "spawn" porque `submit` se llama desde hilos y
+    hacer fork de un proceso con hilos puede heredar locks tomados.
+    """
+
+    def __init__(self, processes=None, name="transform"):
+        self.name = name
+        self.processes = resolve_processes() if processes is None else processes
+        self._executor = None
+        if self.processes > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Pool de transformación ({name}): {self.processes} procesos de {available_cpus()} núcleos.")
+        else:
+            logger.info(f"Pool de transformación ({name}): en línea, sin procesos adicionales.")
+
+    def submit(self, fn, *args, **kwargs):
+        if self._executor is not None:
+            return self._executor.submit(fn, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
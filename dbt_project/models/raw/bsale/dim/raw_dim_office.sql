@@ -0,0 +1,16 @@
+{{
+  config(
+    materialized = 'ephemeral',
+    enabled = var('bsale_interned_dimensions', false),
+    )
+}}
+
+-- Sucursales internadas en la ingesta (BSALE_INTERN_DIMENSIONS): un objeto por id y extractor
+SELECT
+  id AS office_id,
+  source,
+  JSON_VALUE(data, '$.name') AS office_name,
+  JSON_VALUE(data, '$.address') AS office_address,
+  JSON_VALUE(data, '$.city') AS office_city,
+  JSON_VALUE(data, '$.country') AS office_country
+FROM `moss-448416.dataset.bsale_dim_office`
@@ -0,0 +1,18 @@
+{{
+  config(
+    materialized = 'ephemeral',
+    enabled = var('bsale_interned_dimensions', false),
+    )
+}}
+
+-- Variantes internadas en la ingesta (BSALE_INTERN_DIMENSIONS): un objeto por id y
+-- extractor ('bsale_stock' o 'bsale_documents'). El JSON se lee una vez por variante
+-- en vez de una vez por fila de stock o línea de documento.
+SELECT
+  id AS variant_id,
+  source,
+  JSON_VALUE(data, '$.description') AS variant_description,
+  JSON_VALUE(data, '$.barCode') AS variant_barcode,
+  JSON_VALUE(data, '$.code') AS variant_code,
+  JSON_VALUE(data, '$.product.id') AS product_id
+FROM `moss-448416.dataset.bsale_dim_variant`
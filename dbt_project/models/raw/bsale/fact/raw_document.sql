@@ -4,6 +4,117 @@
     )
 }}
 
+{% if var('bsale_document_lines', false) %}
+----------------------------------------------------------------------------
+-- Tabla plana escrita en la ingesta: una fila por línea de detalle, ya tipada.
+-- No se repite el UNNEST ni se multiplica por las referencias; estas se
+-- consultan por separado en raw_document_references.
+SELECT
+  document_id AS doc_id,
+  document_number,
+  emissionDate,
+  expirationDate,
+  generationDate,
+  document_totalAmount AS totalAmount,
+  document_netAmount AS netAmount,
+  document_taxAmount AS taxAmount,
+  detail_id,
+  lineNumber AS detail_lineNumber,
+  quantity AS detail_quantity,
+  netUnitValue AS detail_netUnitValue,
+  totalUnitValue AS detail_totalUnitValue,
+  netAmount AS detail_netAmount,
+  taxAmount AS detail_taxAmount,
+  totalAmount AS detail_totalAmount,
+  netDiscount AS detail_netDiscount,
+  totalDiscount AS detail_totalDiscount,
+  note AS detail_note,
+  relatedDetailId AS detail_relatedDetailId,
+  variant_id,
+  variant_description,
+  variant_code,
+  document_type_id,
+  client_id,
+  office_id,
+  user_id
+FROM `moss-448416.dataset.bsale_document_lines`
+
+{% elif var('bsale_document_format', 'json') == 'nested' %}
+----------------------------------------------------------------------------
+-- Formato "nested": los objetos del documento son STRUCT/ARRAY nativos, así que
+-- se leen sin JSON_EXTRACT y BigQuery solo escanea los subcampos usados.
+WITH documents AS (
+  SELECT
+    id AS doc_id,
+    emissionDate,
+    expirationDate,
+    generationDate,
+    number AS document_number,
+    totalAmount,
+    netAmount,
+    taxAmount,
+    document_type.id AS document_type_id,
+    client.id AS client_id,
+    office.id AS office_id,
+    user.id AS user_id,
+    details,
+    references
+  FROM `moss-448416.dataset.bsale_documents_nested`
+)
+
+-- Igual que en formato JSON: una fila por detail × reference
+SELECT
+  d.doc_id,
+  d.document_number,
+  d.emissionDate,
+  d.expirationDate,
+  d.generationDate,
+  d.totalAmount,
+  d.netAmount,
+  d.taxAmount,
+  detail_item.id AS detail_id,
+  detail_item.lineNumber AS detail_lineNumber,
+  detail_item.quantity AS detail_quantity,
+  detail_item.netUnitValue AS detail_netUnitValue,
+  detail_item.totalUnitValue AS detail_totalUnitValue,
+  detail_item.netAmount AS detail_netAmount,
+  detail_item.taxAmount AS detail_taxAmount,
+  detail_item.totalAmount AS detail_totalAmount,
+  detail_item.netDiscount AS detail_netDiscount,
+  detail_item.totalDiscount AS detail_totalDiscount,
+  detail_item.note AS detail_note,
+  detail_item.relatedDetailId AS detail_relatedDetailId,
+
+  -- Subobjeto "variant" (con interning en la ingesta solo trae el id)
+  detail_item.variant.id AS variant_id,
+  {% if var('bsale_interned_dimensions', false) %}
+  v.variant_description,
+  v.variant_code,
+  {% else %}
+  detail_item.variant.description AS variant_description,
+  detail_item.variant.code AS variant_code,
+  {% endif %}
+
+  -- IDs top-level
+  d.document_type_id,
+  d.client_id,
+  d.office_id,
+  d.user_id,
+
+  reference_item.id AS reference_id,
+  reference_item.reason AS reference_reason
+
+FROM documents d
+CROSS JOIN UNNEST(d.details) AS detail_item
+LEFT JOIN UNNEST(d.references) AS reference_item ON TRUE
+{% if var('bsale_interned_dimensions', false) %}
+LEFT JOIN {{ ref('raw_dim_variant') }} v
+  ON v.variant_id = detail_item.variant.id AND v.source = 'bsale_documents'
+{% endif %}
+
+{% else %}
+----------------------------------------------------------------------------
+-- Formato "json" (por defecto): objetos anidados guardados como texto JSON
 WITH ----------------------------------------------------------------------------
 -- (1) CTE "documents": selecciona las columnas principales y extrae IDs top-level
 documents AS (
@@ -120,10 +231,15 @@ SELECT
   JSON_EXTRACT_SCALAR(fd.detail_item, '$.note') AS detail_note,
   SAFE_CAST(JSON_EXTRACT_SCALAR(fd.detail_item, '$.relatedDetailId') AS INT64) AS detail_relatedDetailId,
 
-  -- Subobjeto "variant"
+  -- Subobjeto "variant" (con interning en la ingesta solo trae el id)
   SAFE_CAST(JSON_EXTRACT_SCALAR(fd.detail_item, '$.variant.id') AS INT64) AS variant_id,
+  {% if var('bsale_interned_dimensions', false) %}
+  v.variant_description,
+  v.variant_code,
+  {% else %}
   JSON_EXTRACT_SCALAR(fd.detail_item, '$.variant.description') AS variant_description,
   JSON_EXTRACT_SCALAR(fd.detail_item, '$.variant.code') AS variant_code,
+  {% endif %}
 
 
   -- IDs top-level
@@ -145,3 +261,10 @@ FROM flattened_details fd
 -- aunque un doc no tenga references (o viceversa).
 LEFT JOIN flattened_references fr
   ON fd.doc_id = fr.doc_id
+{% if var('bsale_interned_dimensions', false) %}
+LEFT JOIN {{ ref('raw_dim_variant') }} v
+  ON v.variant_id = SAFE_CAST(JSON_EXTRACT_SCALAR(fd.detail_item, '$.variant.id') AS INT64)
+  AND v.source = 'bsale_documents'
+{% endif %}
+
+{% endif %}
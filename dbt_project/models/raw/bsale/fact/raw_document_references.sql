@@ -0,0 +1,16 @@
+{{
+  config(
+    materialized = 'ephemeral',
+    )
+}}
+
+-- Referencias de documentos escritas en la ingesta (una fila por referencia)
+SELECT
+  document_id AS doc_id,
+  emissionDate,
+  reference_id,
+  number AS reference_number,
+  referenceDate AS reference_date,
+  reason AS reference_reason,
+  codeSii AS reference_code_sii
+FROM `moss-448416.dataset.bsale_document_references`
@@ -0,0 +1,18 @@
+{{
+  config(
+    materialized = 'view',
+    enabled = var('bsale_stock_history', false),
+    )
+}}
+
+-- Foto vigente del stock derivada del historial (BSALE_STOCK_MODE=history en la
+-- ingesta): la última versión de cada stock, con las columnas de bsale_stock_actual
+SELECT
+  id,
+  quantity,
+  quantityReserved,
+  quantityAvailable,
+  variant,
+  office
+FROM `moss-448416.dataset.bsale_stock_history`
+WHERE valid_to IS NULL
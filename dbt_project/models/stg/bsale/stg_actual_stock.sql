@@ -5,11 +5,24 @@
 }}
 
 WITH stock AS (
-    SELECT 
+    SELECT
         id,
         CAST(quantity AS FLOAT64) AS quantity,
         CAST(quantityReserved AS FLOAT64) AS quantity_reserved,
         CAST(quantityAvailable AS FLOAT64) AS quantity_available,
+    {% if var('bsale_interned_dimensions', false) %}
+        -- Interning en la ingesta: la fila trae solo los ids y el resto sale de las dimensiones
+        JSON_VALUE(s.variant, '$.id') AS variant_id,
+        v.variant_description,
+        v.variant_barcode,
+        v.variant_code,
+        v.product_id,
+        JSON_VALUE(s.office, '$.id') AS office_id,
+        o.office_name,
+        o.office_address,
+        o.office_city,
+        o.office_country
+    {% else %}
         JSON_VALUE(variant, '$.id') AS variant_id,
         JSON_VALUE(variant, '$.description') AS variant_description,
         JSON_VALUE(variant, '$.barCode') AS variant_barcode,
@@ -20,7 +33,19 @@ WITH stock AS (
         JSON_VALUE(office, '$.address') AS office_address,
         JSON_VALUE(office, '$.city') AS office_city,
         JSON_VALUE(office, '$.country') AS office_country
-    FROM `moss-448416.dataset.bsale_stock_actual`
+    {% endif %}
+    {% if var('bsale_stock_history', false) %}
+    -- Foto vigente derivada del historial de versiones
+    FROM {{ ref('raw_stock_current') }} s
+    {% else %}
+    FROM `moss-448416.dataset.bsale_stock_actual` s
+    {% endif %}
+    {% if var('bsale_interned_dimensions', false) %}
+    LEFT JOIN {{ ref('raw_dim_variant') }} v
+      ON v.variant_id = SAFE_CAST(JSON_VALUE(s.variant, '$.id') AS INT64) AND v.source = 'bsale_stock'
+    LEFT JOIN {{ ref('raw_dim_office') }} o
+      ON o.office_id = SAFE_CAST(JSON_VALUE(s.office, '$.id') AS INT64) AND o.source = 'bsale_stock'
+    {% endif %}
 )
 
 SELECT * FROM stock
\ No newline at end of file
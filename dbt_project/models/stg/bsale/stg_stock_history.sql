@@ -0,0 +1,41 @@
+{{
+  config(
+    materialized = 'ephemeral',
+    )
+}}
+
+-- Versiones del stock escritas en la ingesta (BSALE_STOCK_MODE=history). Cada fila
+-- vale en [valid_from, valid_to); la vigente tiene valid_to NULL. Para el stock a
+-- una fecha: WHERE valid_from <= fecha AND (valid_to IS NULL OR valid_to > fecha)
+WITH stock_history AS (
+    SELECT
+        id,
+        CAST(quantity AS FLOAT64) AS quantity,
+        CAST(quantityReserved AS FLOAT64) AS quantity_reserved,
+        CAST(quantityAvailable AS FLOAT64) AS quantity_available,
+    {% if var('bsale_interned_dimensions', false) %}
+        -- Interning en la ingesta: la fila trae solo los ids y el resto sale de las dimensiones
+        JSON_VALUE(h.variant, '$.id') AS variant_id,
+        v.variant_code,
+        v.product_id,
+        JSON_VALUE(h.office, '$.id') AS office_id,
+        o.office_name,
+    {% else %}
+        JSON_VALUE(variant, '$.id') AS variant_id,
+        JSON_VALUE(variant, '$.code') AS variant_code,
+        JSON_VALUE(variant, '$.product.id') AS product_id,
+        JSON_VALUE(office, '$.id') AS office_id,
+        JSON_VALUE(office, '$.name') AS office_name,
+    {% endif %}
+        valid_from,
+        valid_to
+    FROM `moss-448416.dataset.bsale_stock_history` h
+    {% if var('bsale_interned_dimensions', false) %}
+    LEFT JOIN {{ ref('raw_dim_variant') }} v
+      ON v.variant_id = SAFE_CAST(JSON_VALUE(h.variant, '$.id') AS INT64) AND v.source = 'bsale_stock'
+    LEFT JOIN {{ ref('raw_dim_office') }} o
+      ON o.office_id = SAFE_CAST(JSON_VALUE(h.office, '$.id') AS INT64) AND o.source = 'bsale_stock'
+    {% endif %}
+)
+
+SELECT * FROM stock_history
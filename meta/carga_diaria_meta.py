@@ -1,6 +1,5 @@
 import os
 import requests
-import json
 import sys
 import logging
 import time
@@ -10,7 +9,10 @@ import pytz
 from ratelimit import limits, sleep_and_retry  # Para el rate limiter
 
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common import bigquery_sink, schemas, fast_json
+from common.pipeline import Pipeline
 
 # -----------------------------------------------------------------------------
 # Configuraciones para Rate Limiting
@@ -61,91 +63,25 @@ def load_to_bigquery_upsert(df):
     """
     Carga un DataFrame a una tabla de staging en BigQuery (creándola si no existe)
     y luego ejecuta un MERGE para insertar o actualizar (upsert) en la tabla final.
+    Se ejecuta en segundo plano y lanza una excepción si la carga falla.
     """
     if df.empty:
         logger.info("No hay datos nuevos para cargar en BigQuery.")
         return
 
     try:
-        client = bigquery.Client.from_service_account_json(
-            BIGQUERY_KEY_PATH,
-            project=BIGQUERY_PROJECT_ID
-        )
-        destination_table = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
-        staging_table = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{STAGING_TABLE}"
-
-        # 1. Cargar los datos a la tabla de staging
-        job_config = bigquery.LoadJobConfig(
-            create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
-            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
-            autodetect=True
+        # Validar contra el esquema declarado, luego staging (WRITE_TRUNCATE) + MERGE por id
+        table = schemas.to_arrow_table(BIGQUERY_TABLE, df)
+        bigquery_sink.upsert(
+            table, BIGQUERY_TABLE, key="id", staging_table=STAGING_TABLE,
+            schema=schemas.bigquery_schema(BIGQUERY_TABLE)
         )
-        load_job = client.load_table_from_dataframe(df, staging_table, job_config=job_config)
-        load_job.result()  # Espera a que termine la carga
-        logger.info(f"Cargados {len(df)} registros en la tabla de staging {staging_table}.")
-
-        # 2. Asegurarnos de que la tabla final exista
-        init_query = f"""
-        CREATE TABLE IF NOT EXISTS `{destination_table}`
-        AS SELECT * FROM `{staging_table}`
-        WHERE 1=0
-        """
-        client.query(init_query).result()
-
-        # 3. Ejecutar MERGE para insertar o actualizar (upsert) en la tabla final
-        merge_query = f"""
-        MERGE `{destination_table}` T
-        USING `{staging_table}` S
-        ON T.id = S.id
-        WHEN MATCHED THEN
-          UPDATE SET
-            ad_id = S.ad_id,
-            ad_name = S.ad_name,
-            adset_id = S.adset_id,
-            adset_name = S.adset_name,
-            campaign_id = S.campaign_id,
-            campaign_name = S.campaign_name,
-            impressions = S.impressions,
-            clicks = S.clicks,
-            ctr = S.ctr,
-            spend = S.spend,
-            date_start = S.date_start,
-            date_stop = S.date_stop,
-            actions = S.actions,
-            action_values = S.action_values,
-            purchases = S.purchases,
-            purchase_value = S.purchase_value,
-            status = S.status,
-            effective_status = S.effective_status,
-            daily_budget_adset = S.daily_budget_adset,
-            lifetime_budget_adset = S.lifetime_budget_adset,
-            budget_remaining_adset = S.budget_remaining_adset,
-            daily_budget_campaign = S.daily_budget_campaign,
-            lifetime_budget_campaign = S.lifetime_budget_campaign,
-            budget_remaining_campaign = S.budget_remaining_campaign
-        WHEN NOT MATCHED THEN
-          INSERT (
-            id, ad_id, ad_name, adset_id, adset_name, campaign_id, campaign_name,
-            impressions, clicks, ctr, spend, date_start, date_stop,
-            actions, action_values, purchases, purchase_value, status, effective_status,
-            daily_budget_adset, lifetime_budget_adset, budget_remaining_adset,
-            daily_budget_campaign, lifetime_budget_campaign, budget_remaining_campaign
-          )
-          VALUES(
-            S.id, S.ad_id, S.ad_name, S.adset_id, S.adset_name, S.campaign_id, S.campaign_name,
-            S.impressions, S.clicks, S.ctr, S.spend, S.date_start, S.date_stop,
-            S.actions, S.action_values, S.purchases, S.purchase_value, S.status, S.effective_status,
-            S.daily_budget_adset, S.lifetime_budget_adset, S.budget_remaining_adset,
-            S.daily_budget_campaign, S.lifetime_budget_campaign, S.budget_remaining_campaign
-          )
-        """
-        merge_job = client.query(merge_query)
-        merge_job.result()
 
         logger.info("Carga y actualización completadas mediante MERGE.")
 
     except Exception as e:
         logger.error(f"Error al cargar datos en BigQuery: {e}")
+        raise
 
 # -----------------------------------------------------------------------------
 # 3) Función para obtener TODOS los anuncios y su status de la cuenta
@@ -343,12 +279,13 @@ def fetch_campaign_budgets():
 # -----------------------------------------------------------------------------
 # 4) Paginación en la API de Insights (nivel=ad) con timeout y reintentos
 # -----------------------------------------------------------------------------
-def fetch_all_insights(base_url):
+def iter_insight_pages(base_url):
     """
     Llama a la API de Insights con paginación y manejo de rate limits.
     Implementa un Exponential Backoff para evitar bloqueos.
+    Entrega los registros de cada página apenas llega, para procesarlos
+    mientras se pide la siguiente.
     """
-    all_data = []
     url = base_url
     retries = 0
     max_retries = 5  # Máximo de intentos antes de abortar
@@ -357,7 +294,7 @@ def fetch_all_insights(base_url):
     while True:
         try:
             response = rate_limited_get(url, timeout=60)
-            data = response.json()
+            data = fast_json.loads(response.content)
 
             if "error" in data:
                 error_data = data["error"]
@@ -375,8 +312,8 @@ def fetch_all_insights(base_url):
                     break
 
             insights = data.get("data", [])
-            all_data.extend(insights)
             logger.info(f"✅ Recibidos {len(insights)} registros en esta página.")
+            yield insights
 
             paging = data.get("paging", {})
             next_page = paging.get("next")
@@ -396,8 +333,9 @@ def fetch_all_insights(base_url):
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ Error en la API de Insights: {e}")
             break
-
-    return all_data
+        except ValueError as e:
+            logger.error(f"❌ Respuesta inválida de la API de Insights: {e}")
+            break
 
 # -----------------------------------------------------------------------------
 # 5) Procesar cada fila de Insights (crear 'id' único) + status + presupuesto ABO
@@ -407,7 +345,11 @@ def process_insight(insight, ads_status_map, adset_budgets, campaign_budgets):
         ad_id = insight.get("ad_id", "unknown")
         adset_id = insight.get("adset_id", "unknown")
         campaign_id = insight.get("campaign_id", "unknown")
-        date_start = insight.get("date_start", "unknown")
+        date_start = insight.get("date_start")
+        if not date_start:
+            # El id depende de la fecha y date_start es DATE en el esquema declarado
+            logger.warning(f"Fila de Insights sin date_start para el anuncio {ad_id}; se omite.")
+            return None
         unique_id = f"{ad_id}_{date_start}"
 
         ad_status_info = ads_status_map.get(ad_id, {})
@@ -440,14 +382,14 @@ def process_insight(insight, ads_status_map, adset_budgets, campaign_budgets):
         }
 
         actions = insight.get("actions", [])
-        actions_json = json.dumps(actions)
+        actions_json = fast_json.dumps(actions)
         purchases = 0
         for action in actions:
             if action.get("action_type") in purchase_types:
                 purchases += int(action.get("value", 0))
 
         action_values = insight.get("action_values", [])
-        action_values_json = json.dumps(action_values)
+        action_values_json = fast_json.dumps(action_values)
         purchase_value = 0.0
         for av in action_values:
             if av.get("action_type") in purchase_types:
@@ -466,7 +408,7 @@ def process_insight(insight, ads_status_map, adset_budgets, campaign_budgets):
             "ctr": insight.get("ctr"),
             "spend": insight.get("spend"),
             "date_start": date_start,
-            "date_stop": insight.get("date_stop", "unknown"),
+            "date_stop": insight.get("date_stop"),
             "actions": actions_json,
             "action_values": action_values_json,
             "purchases": purchases,
@@ -519,41 +461,47 @@ def extract_insights_meta(days_back=150):
         f"&access_token={ACCESS_TOKEN}"
     )
 
-    # 4) Paginar para obtener todos los insights
-    all_insights = fetch_all_insights(base_url)
-
-    # 5) Procesar y cargar con batch interno y global
+    # 4) Pipeline: paginar (fetch), procesar en lotes (transform) y hacer el upsert (load)
     buffer = []
     new_records = 0
     count_total = 0  # Contador global de registros
 
-    for insight in all_insights:
-        record = process_insight(insight, ads_status_map, adset_budgets, campaign_budgets)
-        if not record:
-            continue
-
-        buffer.append(record)
-        new_records += 1
-        count_total += 1
+    def transform(insights):
+        nonlocal buffer, new_records, count_total
+        batches = []
+        for insight in insights:
+            record = process_insight(insight, ads_status_map, adset_budgets, campaign_budgets)
+            if not record:
+                continue
 
-        time.sleep(0.1)  # Pausa breve entre registros
+            buffer.append(record)
+            new_records += 1
+            count_total += 1
 
-        if len(buffer) >= BATCH_SIZE:
-            df = pd.DataFrame(buffer)
-            load_to_bigquery_upsert(df)
-            buffer = []
-
-        if count_total >= MAX_RECORDS:
-            if buffer:
-                df = pd.DataFrame(buffer)
-                load_to_bigquery_upsert(df)
+            if len(buffer) >= BATCH_SIZE:
+                batches.append(pd.DataFrame(buffer))
                 buffer = []
-            logger.info(f"Alcanzado el límite global de {MAX_RECORDS} registros. Reseteando contador.")
-            count_total = 0
 
-    if buffer:
-        df = pd.DataFrame(buffer)
-        load_to_bigquery_upsert(df)
+            if count_total >= MAX_RECORDS:
+                if buffer:
+                    batches.append(pd.DataFrame(buffer))
+                    buffer = []
+                logger.info(f"Alcanzado el límite global de {MAX_RECORDS} registros. Reseteando contador.")
+                count_total = 0
+        return batches
+
+    def flush():
+        return [pd.DataFrame(buffer)] if buffer else []
+
+    pipeline = (
+        Pipeline("meta_insights")
+        .add_stage("fetch", iter_insight_pages, workers=1, fan_out=True)
+        .add_stage("transform", transform, workers=1, flush=flush, fan_out=True)
+        # El upsert usa una tabla de staging compartida, por lo que se permite una sola
+        # carga en curso; aun así la paginación y el procesamiento continúan durante el MERGE
+        .add_stage("load", load_to_bigquery_upsert, workers=1, queue_size=1)
+    )
+    pipeline.run([base_url])
 
     logger.info(f"Finalizado. Se procesaron {new_records} registros nuevos.")
 
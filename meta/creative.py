@@ -1,11 +1,14 @@
 import os
+import sys
 import requests
 import json
 import logging
 import time
 import pandas as pd
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common import bigquery_sink, schemas
 
 # -------------------------------------------------------------------
 # CONFIGURACIONES GENERALES
@@ -131,25 +134,15 @@ def load_to_bigquery(df):
         return
 
     try:
-        client = bigquery.Client.from_service_account_json(
-            BIGQUERY_KEY_PATH,
-            project=BIGQUERY_PROJECT_ID
-        )
-        table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
-
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-            autodetect=True
-        )
-
         df.drop_duplicates(subset=["ad_creative_id"], inplace=True)
 
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()  # Esperar la carga
+        table = schemas.to_arrow_table(BIGQUERY_TABLE, df)
+        bigquery_sink.append(table, BIGQUERY_TABLE, schema=schemas.bigquery_schema(BIGQUERY_TABLE))
 
-        logger.info(f" Cargados {len(df)} registros nuevos a BigQuery en {table_id}.")
+        logger.info(f" Cargados {len(df)} registros nuevos a BigQuery en {BIGQUERY_TABLE}.")
     except Exception as e:
         logger.error(f" Error al cargar datos en BigQuery: {e}")
+        raise
 
 
 # -------------------------------------------------------------------
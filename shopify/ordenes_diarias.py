@@ -7,7 +7,9 @@ import time
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from google.cloud import bigquery
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from common import bigquery_sink, schemas, fast_json
 
 # ---------------------------------------------------------------------
 # 1) Configuración General
@@ -56,7 +58,7 @@ def fetch_orders(days_back):
         response = requests.get(next_page_url, headers=headers, params=params if total_pages == 0 else {})
 
         if response.status_code == 200:
-            data = response.json()
+            data = fast_json.loads(response.content)
             orders = data.get("orders", [])
 
             if not orders:
@@ -110,7 +112,7 @@ def process_orders(orders):
             "current_total_price": order.get("current_total_price"),
             "customer_locale": order.get("customer_locale"),
             "device_id": order.get("device_id"),
-            "discount_codes": json.dumps(order.get("discount_codes", [])),
+            "discount_codes": fast_json.dumps(order.get("discount_codes", [])),
             "email": order.get("email"),
             "financial_status": order.get("financial_status"),
             "fulfillment_status": order.get("fulfillment_status"),
@@ -120,7 +122,7 @@ def process_orders(orders):
             "note": order.get("note"),
             "number": order.get("number"),
             "order_number": order.get("order_number"),
-            "payment_gateway_names": json.dumps(order.get("payment_gateway_names", [])),
+            "payment_gateway_names": fast_json.dumps(order.get("payment_gateway_names", [])),
             "phone": order.get("phone"),
             "processed_at": order.get("processed_at"),
             "referring_site": order.get("referring_site"),
@@ -130,15 +132,15 @@ def process_orders(orders):
             "total_discounts": order.get("total_discounts"),
             "total_line_items_price": order.get("total_line_items_price"),
             "total_price": order.get("total_price"),
-            "total_shipping_price_set": json.dumps(order.get("total_shipping_price_set", {})),
+            "total_shipping_price_set": fast_json.dumps(order.get("total_shipping_price_set", {})),
             "total_tax": order.get("total_tax"),
             "total_weight": order.get("total_weight"),
             "updated_at": order.get("updated_at"),
             "user_id": order.get("user_id"),
-            "billing_address": json.dumps(order.get("billing_address", {})),
-            "customer": json.dumps(order.get("customer", {})),
-            "shipping_address": json.dumps(order.get("shipping_address", {})),
-            "line_items": json.dumps(order.get("line_items", []))
+            "billing_address": fast_json.dumps(order.get("billing_address", {})),
+            "customer": fast_json.dumps(order.get("customer", {})),
+            "shipping_address": fast_json.dumps(order.get("shipping_address", {})),
+            "line_items": fast_json.dumps(order.get("line_items", []))
         })
 
     return pd.DataFrame(processed_orders)
@@ -152,11 +154,8 @@ def load_to_bigquery(df):
         return
 
     try:
-        client = bigquery.Client.from_service_account_json(
-            BIGQUERY_KEY_PATH,
-            project=BIGQUERY_PROJECT_ID
-        )
-        table_id = f"{BIGQUERY_PROJECT_ID}.{BIGQUERY_DATASET}.{BIGQUERY_TABLE}"
+        client = bigquery_sink.get_client()
+        table_id = bigquery_sink.table_ref(BIGQUERY_TABLE)
 
         table_exists = True
         try:
@@ -179,21 +178,15 @@ def load_to_bigquery(df):
             logger.info("No hay datos nuevos para insertar después de eliminar duplicados.")
             return
 
-        df = df.astype(str)
-
-        job_config = bigquery.LoadJobConfig(
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-            create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
-            autodetect=True
-        )
-
-        load_job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        load_job.result()
+        # Tipos declarados en common/schemas.py: números y fechas dejan de cargarse como texto
+        table = schemas.to_arrow_table("shopify_orders", df)
+        bigquery_sink.append(table, BIGQUERY_TABLE, schema=schemas.bigquery_schema("shopify_orders"))
 
         logger.info(f"Cargados {len(df)} registros en BigQuery sin duplicados.")
 
     except Exception as e:
         logger.error(f"Error al cargar datos en BigQuery: {e}")
+        raise
 
 # ---------------------------------------------------------------------
 # 5) Función principal
@@ -0,0 +1,63 @@
+import os
+import sys
+import importlib.util
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def load_script(relative_path):
+    """Importa un script del repo (no son paquetes) a partir de su ruta."""
+    path = os.path.join(ROOT, relative_path)
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def carga_masiva():
+    return load_script(os.path.join("bsale", "components", "documentos", "carga_masiva.py"))
+
+
+@pytest.fixture(scope="session")
+def carga_diaria():
+    return load_script(os.path.join("bsale", "components", "documentos", "carga_diaria.py"))
+
+
+@pytest.fixture(scope="session")
+def stock_masivo_actual():
+    return load_script(os.path.join("bsale", "components", "stock", "stock_masivo_actual.py"))
+
+
+class FakeJob:
+    num_dml_affected_rows = 0
+
+    def result(self):
+        return []
+
+
+class FakeClient:
+    """Cliente de BigQuery que solo registra el SQL que recibe."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql, job_config=None):
+        self.queries.append((sql, job_config))
+        return FakeJob()
+
+
+@pytest.fixture
+def bigquery_client(monkeypatch):
+    """Reemplaza el cliente de common/bigquery_sink y devuelve el SQL ejecutado."""
+    from common import bigquery_sink
+
+    client = FakeClient()
+    monkeypatch.setattr(bigquery_sink, "get_client", lambda: client)
+    monkeypatch.setattr(bigquery_sink, "query", lambda sql: client.query(sql).result())
+    monkeypatch.setattr(bigquery_sink, "table_ref", lambda name, dataset=None: f"proyecto.dataset.{name}")
+    monkeypatch.setattr(bigquery_sink, "drop_table", lambda name: None)
+    return client
@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+from common import bigquery_sink, schemas
+
+
+def run_merge(client, **options):
+    bigquery_sink.merge("bsale_documents_staging", "bsale_documents", ["id", "state", "number"], **options)
+    create_sql, merge_sql = [sql for sql, _ in client.queries]
+    return create_sql, merge_sql
+
+
+def test_merge_sql(bigquery_client):
+    create_sql, merge_sql = run_merge(bigquery_client, target_filter="T.emissionDate BETWEEN 1 AND 2")
+
+    assert "CREATE TABLE IF NOT EXISTS `proyecto.dataset.bsale_documents`" in create_sql
+    assert "WHERE 1=0" in create_sql
+    assert "MERGE `proyecto.dataset.bsale_documents` T" in merge_sql
+    assert "USING `proyecto.dataset.bsale_documents_staging` S" in merge_sql
+    assert "ON T.`id` = S.`id` AND T.emissionDate BETWEEN 1 AND 2" in merge_sql
+    assert "`state` = S.`state`" in merge_sql and "`id` = S.`id`," not in merge_sql
+    assert "INSERT (`id`, `state`, `number`)" in merge_sql
+    assert "NOT MATCHED BY SOURCE" not in merge_sql
+
+
+def test_merge_with_composite_key(bigquery_client):
+    bigquery_sink.merge("dim_staging", "dim", ["id", "source", "data"], key=["id", "source"])
+    merge_sql = bigquery_client.queries[-1][0]
+
+    assert "ON T.`id` = S.`id` AND T.`source` = S.`source`" in merge_sql
+    assert "UPDATE SET\n            `data` = S.`data`\n" in merge_sql
+
+
+def test_merge_creates_the_target_with_its_layout(bigquery_client):
+    create_sql, _ = run_merge(bigquery_client, **schemas.table_layout("bsale_documents"))
+
+    assert "PARTITION BY RANGE_BUCKET(`emissionDate`, GENERATE_ARRAY(1420070400, 2366841600, 2592000))" in create_sql
+    assert "CLUSTER BY `emissionDate`, `id`" in create_sql
+
+
+def test_layout_ddl():
+    assert bigquery_sink.layout_ddl() == ""
+    assert bigquery_sink.layout_ddl(cluster_by=["a", "b"]) == "CLUSTER BY `a`, `b`"
+    assert schemas.table_layout("meta_insights") == {}
+
+
+def test_merge_updates_only_the_profile_columns(bigquery_client):
+    _, merge_sql = run_merge(bigquery_client, update_columns=["id", "state"])
+    update_clause = merge_sql.split("UPDATE SET")[1].split("WHEN NOT MATCHED")[0]
+
+    assert "`state` = S.`state`" in update_clause
+    assert "`number`" not in update_clause
+    # Las filas nuevas se insertan completas
+    assert "INSERT (`id`, `state`, `number`)" in merge_sql
+
+
+def test_merge_without_columns_to_update_only_inserts(bigquery_client):
+    _, merge_sql = run_merge(bigquery_client, update_columns=["id"])
+
+    assert "WHEN MATCHED" not in merge_sql
+    assert "WHEN NOT MATCHED THEN" in merge_sql
+
+
+def test_close_and_append_sql(bigquery_client):
+    valid_from = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    bigquery_sink.close_and_append(
+        "bsale_stock_history_staging", "bsale_stock_history", ["id", "quantity", "valid_from", "valid_to"],
+        valid_from, closed_keys=[7, 9]
+    )
+    (create_sql, _), (script, job_config) = bigquery_client.queries
+
+    assert "CREATE TABLE IF NOT EXISTS `proyecto.dataset.bsale_stock_history`" in create_sql
+    assert "AS SELECT * FROM `proyecto.dataset.bsale_stock_history_staging`" in create_sql
+    # Cierre e inserción en una sola transacción
+    assert script.strip().startswith("BEGIN TRANSACTION;")
+    assert script.strip().endswith("COMMIT TRANSACTION;")
+    assert script.index("UPDATE `proyecto.dataset.bsale_stock_history`") < script.index("INSERT INTO")
+    assert "SET `valid_to` = @valid_from" in script
+    assert "WHERE `valid_to` IS NULL" in script
+    assert "SELECT closed_key FROM UNNEST(@closed_keys) AS closed_key" in script
+    assert "INSERT INTO `proyecto.dataset.bsale_stock_history` (`id`, `quantity`, `valid_from`, `valid_to`)" in script
+
+    parameters = {parameter.name: parameter for parameter in job_config.query_parameters}
+    assert parameters["valid_from"].value == valid_from
+    assert parameters["closed_keys"].array_type == "INT64"
+    assert parameters["closed_keys"].values == [7, 9]
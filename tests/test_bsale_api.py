@@ -0,0 +1,13 @@
+from common.bsale_api import id_ranges
+
+
+def test_id_ranges_contiguous():
+    assert id_ranges({1, 2, 3, 7, 9, 10}) == [(1, 3), (7, 7), (9, 10)]
+
+
+def test_id_ranges_with_gaps_and_span():
+    ids = [100, 105, 110, 300, 2000]
+
+    assert id_ranges(ids, max_gap=20) == [(100, 110), (300, 300), (2000, 2000)]
+    assert id_ranges(ids, max_gap=5000) == [(100, 2000)]
+    assert id_ranges(ids, max_gap=5000, max_span=500) == [(100, 300), (2000, 2000)]
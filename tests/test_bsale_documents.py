@@ -0,0 +1,192 @@
+import copy
+import json
+
+import pytest
+
+from common import bsale_documents
+from common.bsale_documents import JSON_FORMAT, NESTED_FORMAT, process_document
+
+# Documento expandido como lo devuelve documents.json de Bsale
+DOCUMENT = {
+    "href": "https://api.bsale.cl/v1/documents/501.json",
+    "id": 501,
+    "emissionDate": 1709251200,
+    "expirationDate": 1709251200,
+    "generationDate": 1709290000,
+    "number": 1234,
+    "totalAmount": 11900.0,
+    "netAmount": 10000.0,
+    "taxAmount": 1900.0,
+    "state": 0,
+    "document_type": {"href": "https://api/document_types/1.json", "id": 1, "name": "Boleta", "codeSii": "39"},
+    "client": {"href": "https://api/clients/7.json", "id": 7, "firstName": "Ana", "email": "ana@example.com"},
+    "office": {"href": "https://api/offices/2.json", "id": 2, "name": "Tienda", "city": "Santiago"},
+    "user": {"href": "https://api/users/3.json", "id": 3, "firstName": "Luis"},
+    "references": {"href": "https://api/references", "count": 1, "items": [
+        {"id": 90, "number": "77", "referenceDate": 1709000000, "reason": "Anula", "codeSii": "33"},
+    ]},
+    "document_taxes": {"href": "https://api/taxes", "count": 1, "items": [
+        {"id": 5, "totalAmount": 1900.0, "tax": {"id": 1, "href": "https://api/taxes/1.json"}},
+    ]},
+    "details": {"href": "https://api/details", "count": 2, "items": [
+        {"id": 1001, "lineNumber": 1, "quantity": 2.0, "netUnitValue": 2500.0, "totalUnitValue": 2975.0,
+         "netAmount": 5000.0, "taxAmount": 950.0, "totalAmount": 5950.0, "netDiscount": 0.0,
+         "totalDiscount": 0.0, "note": "", "relatedDetailId": 0,
+         "variant": {"id": 40, "code": "SKU-40", "description": "Polera M", "barCode": "", "product": {"id": 4}}},
+        {"id": 1002, "lineNumber": 2, "quantity": 1.0, "netUnitValue": 5000.0, "totalUnitValue": 5950.0,
+         "netAmount": 5000.0, "taxAmount": 950.0, "totalAmount": 5950.0, "netDiscount": 0.0,
+         "totalDiscount": 0.0, "note": "regalo", "relatedDetailId": 0,
+         "variant": {"id": 41, "code": "SKU-41", "description": "Polera L", "barCode": "", "product": {"id": 4}}},
+    ]},
+    "sellers": {"href": "https://api/sellers", "count": 0, "items": []},
+    "payments": [{"id": 8, "amount": 11900.0, "recordDate": 1709251200, "payment_type": {"id": 1, "name": "Efectivo"}}],
+}
+
+
+@pytest.fixture
+def document():
+    return copy.deepcopy(DOCUMENT)
+
+
+def test_process_document_json_format(document):
+    row = process_document(document, JSON_FORMAT)
+
+    assert row["id"] == 501 and row["totalAmount"] == 11900.0
+    assert json.loads(row["client"])["email"] == "ana@example.com"
+    assert json.loads(row["details"])["count"] == 2
+    assert row["expand_profile"] == "full"
+    assert "href" not in row
+
+
+def test_process_document_nested_format(document):
+    row = process_document(document, NESTED_FORMAT)
+
+    # Los STRUCT conservan solo los campos declarados y las colecciones se aplanan a listas
+    assert row["document_type"] == {
+        "id": 1, "name": "Boleta", "code": None, "codeSii": "39",
+        "isElectronicDocument": None, "isCreditNote": None,
+    }
+    assert [detail["id"] for detail in row["details"]] == [1001, 1002]
+    assert row["details"][0]["variant"]["product"] == {"id": 4}
+    assert row["document_taxes"] == [{"id": 5, "totalAmount": 1900.0, "tax": {"id": 1}}]
+    assert row["payments"][0]["payment_type"] == {"id": 1, "name": "Efectivo"}
+    assert row["sellers"] == []
+
+
+def test_process_document_nested_missing_objects(document):
+    del document["client"], document["details"]
+    row = process_document(document, NESTED_FORMAT)
+
+    assert row["client"] is None
+    assert row["details"] == []
+
+
+def test_process_document_nested_invalid_document(document):
+    document["details"] = {"items": [{"id": "no es un id"}]}
+
+    assert process_document(document, NESTED_FORMAT) is None
+
+
+def test_unknown_document_format():
+    with pytest.raises(ValueError):
+        bsale_documents.document_schema("xml")
+
+
+def test_document_lines_one_row_per_detail(document):
+    lines = bsale_documents.document_lines(document)
+
+    assert [line["detail_id"] for line in lines] == [1001, 1002]
+    first = lines[0]
+    assert first["document_id"] == 501 and first["emissionDate"] == 1709251200
+    assert (first["document_type_id"], first["client_id"], first["office_id"], first["user_id"]) == (1, 7, 2, 3)
+    assert (first["variant_id"], first["variant_code"], first["product_id"]) == (40, "SKU-40", 4)
+    assert first["quantity"] == 2.0 and first["totalAmount"] == 5950.0
+    assert lines[1]["note"] == "regalo"
+    # Las filas cumplen el esquema declarado
+    assert set(first) == set(bsale_documents.schemas.column_names("bsale_document_lines"))
+
+
+def test_document_lines_without_details(document):
+    del document["details"]
+    assert bsale_documents.document_lines(document) == []
+
+    document["details"] = [{"id": 1, "variant": None}]
+    (line,) = bsale_documents.document_lines(document)
+    assert line["variant_id"] is None and line["product_id"] is None
+
+
+def test_document_lines_invalid_document(document):
+    document["details"]["items"][0]["quantity"] = "mucho"
+    assert bsale_documents.document_lines(document) == []
+
+
+def test_document_references(document):
+    (reference,) = bsale_documents.document_references(document)
+
+    assert reference == {
+        "document_id": 501, "emissionDate": 1709251200, "reference_id": 90,
+        "number": "77", "referenceDate": 1709000000, "reason": "Anula", "codeSii": "33",
+    }
+    del document["references"]
+    assert bsale_documents.document_references(document) == []
+
+
+@pytest.mark.parametrize("document_format", [JSON_FORMAT, NESTED_FORMAT])
+def test_process_document_keeps_only_profile_objects(document, document_format):
+    row = process_document(document, document_format, profile="sales-lines")
+
+    assert row["expand_profile"] == "sales-lines"
+    for name in ("client", "user", "references", "document_taxes", "sellers", "payments"):
+        assert row[name] is None
+    assert row["document_type"] is not None and row["office"] is not None and row["details"]
+
+
+def test_profile_expand_and_columns():
+    assert bsale_documents.profile_expand("sales-lines") == "document_type,office,details"
+    assert bsale_documents.profile_columns("sales-lines") == list(bsale_documents.HEADER_COLUMNS) + [
+        "document_type", "office", "details", "expand_profile",
+    ]
+    with pytest.raises(ValueError):
+        bsale_documents.profile_objects("minimal")
+
+
+def test_intern_document_full_profile(document):
+    objects = {}
+    row_document = bsale_documents.intern_document(document, objects)
+
+    for name, object_id in (("document_type", 1), ("client", 7), ("office", 2), ("user", 3)):
+        assert row_document[name] == {"id": object_id}
+        assert objects[name][object_id] == DOCUMENT[name]
+    assert [item["variant"] for item in row_document["details"]["items"]] == [{"id": 40}, {"id": 41}]
+    assert set(objects["variant"]) == {40, 41}
+    # El documento original no cambia: las líneas planas se arman con él
+    assert document == DOCUMENT
+
+
+def test_intern_document_sales_lines_skips_unexpanded_objects(document):
+    # Sin expand, Bsale devuelve el cliente y el usuario solo con href e id
+    document["client"] = {"href": "https://api/clients/7.json", "id": 7}
+    document["user"] = {"href": "https://api/users/3.json", "id": 3}
+    objects = {}
+    row_document = bsale_documents.intern_document(document, objects, profile="sales-lines")
+
+    assert set(objects) == {"document_type", "office", "variant"}
+    assert row_document["client"] == document["client"]
+    assert row_document["user"] == document["user"]
+    assert row_document["office"] == {"id": 2}
+
+
+def test_document_batches_interns_by_profile(document):
+    document["client"] = {"href": "https://api/clients/7.json", "id": 7}
+    _, _, _, objects = bsale_documents.document_batches(
+        [document], JSON_FORMAT, profile="sales-lines", intern=True
+    )
+
+    assert "client" not in objects and "user" not in objects
+    assert objects["office"] == {2: DOCUMENT["office"]}
+
+
+def test_document_variant_ids(document):
+    assert bsale_documents.document_variant_ids(document) == [40, 41]
+    del document["details"]
+    assert bsale_documents.document_variant_ids(document) == []
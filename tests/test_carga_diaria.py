@@ -0,0 +1,124 @@
+import re
+
+import pytest
+import requests
+
+
+def merge_statements(client):
+    return [sql for sql, _ in client.queries if "MERGE" in sql]
+
+
+def test_merge_staged_bounds_the_delete_branch_by_emission_date(carga_diaria, bigquery_client, monkeypatch):
+    monkeypatch.setattr(carga_diaria, "BIGQUERY_TABLE", "bsale_documents")
+    staged = {"bsale_documents", carga_diaria.LINES_TABLE, carga_diaria.REFERENCES_TABLE}
+
+    carga_diaria.merge_staged("20240301", staged, [1709251200, 1709164800])
+
+    bound = "T.emissionDate BETWEEN 1709164800 AND 1709251200"
+    lines_merge, references_merge, documents_merge = merge_statements(bigquery_client)
+    for child_merge in (lines_merge, references_merge):
+        on_clause = re.search(r"ON (.*?)\n", child_merge).group(1)
+        delete_clause = re.search(r"WHEN NOT MATCHED BY SOURCE AND (.*?) THEN", child_merge).group(1)
+        assert bound in on_clause
+        assert bound in delete_clause
+        assert "T.document_id IN (SELECT id FROM `proyecto.dataset.bsale_documents_staging_20240301`)" in delete_clause
+    # Los documentos no borran: un documento que no llegó en la ventana sigue existiendo
+    assert "NOT MATCHED BY SOURCE" not in documents_merge
+    assert bound in documents_merge
+
+
+def test_merge_staged_without_documents_does_not_delete(carga_diaria, bigquery_client, monkeypatch):
+    monkeypatch.setattr(carga_diaria, "BIGQUERY_TABLE", "bsale_documents")
+
+    carga_diaria.merge_staged("20240301", {carga_diaria.LINES_TABLE}, [1709251200])
+
+    (lines_merge,) = merge_statements(bigquery_client)
+    assert "NOT MATCHED BY SOURCE" not in lines_merge
+
+
+def fake_pages(count, failing_offsets=()):
+    """fetch_page falso: `count` documentos por ventana; los offsets indicados fallan."""
+    def fetch_page(base_url, offset, headers, session, limiter):
+        if offset in failing_offsets:
+            raise requests.exceptions.ConnectionError(f"offset {offset}")
+        window = int(base_url.split("window=")[1]) if "window=" in base_url else 0
+        ids = range(offset, min(offset + 50, count))
+        return {"count": count, "items": [{"id": window * 1000 + doc_id} for doc_id in ids]}
+    return fetch_page
+
+
+def test_fetch_all_pages_returns_every_window_in_order(carga_diaria, monkeypatch):
+    monkeypatch.setattr(carga_diaria, "fetch_page", fake_pages(120))
+
+    items = carga_diaria.fetch_all_pages(["https://api/documents.json?window=1", "https://api/documents.json?window=2"], {})
+
+    assert [item["id"] for item in items] == [1000 + n for n in range(120)] + [2000 + n for n in range(120)]
+
+
+@pytest.mark.parametrize("failing_offset", [0, 50])
+def test_fetch_all_pages_raises_when_a_page_fails(carga_diaria, monkeypatch, failing_offset):
+    monkeypatch.setattr(carga_diaria, "fetch_page", fake_pages(120, failing_offsets={failing_offset}))
+
+    with pytest.raises(RuntimeError, match="Fallaron 1 de"):
+        carga_diaria.fetch_all_pages(["https://api/documents.json?window=1"], {})
+
+
+def test_extract_data_does_not_load_a_partial_window(carga_diaria, monkeypatch):
+    monkeypatch.setattr(carga_diaria, "fetch_page", fake_pages(120, failing_offsets={100}))
+    loaded = []
+    monkeypatch.setattr(carga_diaria, "load_documents", loaded.append)
+
+    with pytest.raises(RuntimeError):
+        carga_diaria.extract_data()
+    assert loaded == []
+
+
+@pytest.fixture
+def reconcile(carga_diaria, monkeypatch, tmp_path):
+    """reconcile_documents con un listado falso; devuelve (listado, ids que se volvieron a pedir)."""
+    monkeypatch.setattr(carga_diaria, "FINGERPRINTS_PATH", str(tmp_path / "fingerprints.sqlite"))
+    listing = []
+    refetched = []
+    monkeypatch.setattr(carga_diaria, "fetch_all_pages", lambda urls, headers: list(listing))
+    monkeypatch.setattr(
+        carga_diaria, "fetch_documents_by_range",
+        lambda ids: refetched.append(sorted(ids)) or [doc for doc in listing if doc["id"] in ids]
+    )
+    monkeypatch.setattr(carga_diaria, "load_documents", lambda documents: documents)
+    monkeypatch.setattr(carga_diaria, "record_variants", lambda documents: None)
+    return listing, refetched
+
+
+def test_reconcile_seeds_unseen_documents_and_refetches_changed_ones(carga_diaria, reconcile):
+    listing, refetched = reconcile
+    listing.extend([{"id": 1, "state": 0}, {"id": 2, "state": 0}])
+
+    # Primera pasada: sin fingerprints previos no se recarga nada, solo se siembra
+    carga_diaria.reconcile_documents()
+    assert refetched == []
+
+    listing[1] = {"id": 2, "state": 1}
+    listing.append({"id": 3, "state": 0})
+    carga_diaria.reconcile_documents()
+    assert refetched == [[2]]
+
+    # El fingerprint del documento recargado queda al día
+    carga_diaria.reconcile_documents()
+    assert refetched == [[2]]
+
+
+def test_fetch_documents_by_range_groups_ids(carga_diaria, monkeypatch):
+    calls = []
+
+    def fake_range(firstid, lastid, headers, session, limiter):
+        calls.append((firstid, lastid))
+        return [{"id": doc_id} for doc_id in range(firstid, lastid + 1) if doc_id != 105]
+
+    monkeypatch.setattr(carga_diaria, "fetch_range", fake_range)
+    monkeypatch.setattr(carga_diaria, "fetch_documents_by_id", lambda ids, headers: [{"id": doc_id} for doc_id in ids])
+
+    documents = carga_diaria.fetch_documents_by_range([100, 105, 110, 300, 2000])
+
+    assert sorted(calls) == [(100, 110), (300, 300), (2000, 2000)]
+    # Los documentos de más se descartan y el que no vino en su rango se pide individualmente
+    assert sorted(doc["id"] for doc in documents) == [100, 105, 110, 300, 2000]
@@ -0,0 +1,112 @@
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+
+def test_tail_intervals_after_the_last_loaded_id(carga_masiva):
+    intervals = [{"id": 1}, {"id": 501}, {"id": 1001}, {"id": 1501}]
+
+    # El primer intervalo pendiente se recorta y el último queda abierto desde su cursor
+    assert carga_masiva.tail_intervals(intervals, max_id=700) == [(701, 1000), (1001, 1500), (1501, 2000)]
+
+
+def test_tail_intervals_when_everything_is_loaded(carga_masiva):
+    intervals = [{"id": 1}, {"id": 501}, {"id": 1001}]
+
+    # Ya se cargó más allá del último cursor: solo queda el intervalo abierto desde max_id + 1
+    assert carga_masiva.tail_intervals(intervals, max_id=5000) == [(5001, 5500)]
+    assert carga_masiva.tail_intervals(intervals, max_id=1200, cursorlength=100) == [(1201, 1300)]
+
+
+def test_tail_intervals_from_scratch(carga_masiva):
+    intervals = [{"id": 1}, {"id": 501}]
+
+    assert carga_masiva.tail_intervals(intervals, max_id=0) == [(1, 500), (501, 1000)]
+
+
+def offsets(urls):
+    return [parse_qs(urlsplit(url).query) for url in urls]
+
+
+def test_detail_page_urls_from_count_and_limit(carga_masiva):
+    details = {
+        "count": 120,
+        "limit": 25,
+        "items": [{}] * 25,
+        "next": "https://api.bsale.cl/v1/documents/7/details.json?limit=25&offset=25",
+    }
+    urls = carga_masiva.detail_page_urls(details)
+
+    assert [query["offset"] for query in offsets(urls)] == [["25"], ["50"], ["75"], ["100"]]
+    assert all(query["limit"] == ["25"] for query in offsets(urls))
+    assert all(urlsplit(url).path == "/v1/documents/7/details.json" for url in urls)
+
+
+def test_detail_page_urls_uses_the_page_size_without_limit(carga_masiva):
+    details = {
+        "count": 60,
+        "items": [{}] * 25,
+        "next": "https://api.bsale.cl/v1/documents/7/details.json?offset=25",
+    }
+
+    assert [query["offset"] for query in offsets(carga_masiva.detail_page_urls(details))] == [["25"], ["50"]]
+
+
+def test_detail_page_urls_without_count_follows_next(carga_masiva):
+    next_url = "https://api.bsale.cl/v1/documents/7/details.json?offset=25"
+
+    assert carga_masiva.detail_page_urls({"items": [{}] * 25, "next": next_url}) == [next_url]
+    assert carga_masiva.detail_page_urls({"count": 60, "limit": 25, "next": "https://api/cursor"}) == ["https://api/cursor"]
+
+
+def test_detail_page_urls_without_next(carga_masiva):
+    assert carga_masiva.detail_page_urls({"count": 3, "items": [{}] * 3}) == []
+    assert carga_masiva.detail_page_urls({}) == []
+
+
+def test_group_contiguous_ids(carga_masiva):
+    assert carga_masiva.group_contiguous_ids({1, 2, 3, 7, 9, 10}) == [(1, 3), (7, 7), (9, 10)]
+    assert carga_masiva.group_contiguous_ids([5, 4, 4, 6]) == [(4, 6)]
+    assert carga_masiva.group_contiguous_ids([]) == []
+
+
+def test_failed_load_out_of_order_does_not_advance_last_id(carga_masiva, tmp_path, monkeypatch):
+    from common.interval_manifest import IntervalManifest, FETCHED, LOADED
+
+    def fake_load(document_file, line_file, reference_file):
+        if document_file[0] == "lote-2":
+            raise RuntimeError("carga fallida")
+
+    monkeypatch.setattr(carga_masiva, "load_batch_files", fake_load)
+    manifest = IntervalManifest(str(tmp_path / "manifest.sqlite"))
+    last_id_path = str(tmp_path / "last_id.txt")
+    lock = threading.Lock()
+    manifest.reset([(1, 100), (101, 200), (201, 300)])
+    jobs = {
+        name: ([firstid], (name, 10), None, None)
+        for name, firstid in (("lote-1", 1), ("lote-2", 101), ("lote-3", 201))
+    }
+    try:
+        # Las cargas terminan fuera de orden: primero el lote 3, después el 1, y el 2 falla
+        carga_masiva.load_interval_batch(jobs["lote-3"], manifest, lock, last_id_path)
+        assert not os.path.exists(last_id_path)
+
+        carga_masiva.load_interval_batch(jobs["lote-1"], manifest, lock, last_id_path)
+        with pytest.raises(RuntimeError):
+            carga_masiva.load_interval_batch(jobs["lote-2"], manifest, lock, last_id_path)
+
+        with open(last_id_path) as f:
+            assert f.read() == "100"
+        assert manifest.ranges(states=(LOADED,)) == [(1, 100), (201, 300)]
+        assert manifest.unfinished() == [(101, 200)]
+
+        # El reintento cierra el hueco y last_id.txt salta hasta el final del prefijo
+        manifest.mark(101, FETCHED)
+        monkeypatch.setattr(carga_masiva, "load_batch_files", lambda *files: None)
+        carga_masiva.load_interval_batch(jobs["lote-2"], manifest, lock, last_id_path)
+        with open(last_id_path) as f:
+            assert f.read() == "300"
+    finally:
+        manifest.close()
@@ -0,0 +1,41 @@
+import json
+
+from common import bigquery_sink
+from common.dimension_interner import DIMENSION_TABLES, DimensionInterner, intern_object
+
+
+def test_intern_object_keeps_values_without_id():
+    objects = {}
+    assert intern_object(objects, "office", None) is None
+    assert intern_object(objects, "office", {"href": "https://api/offices"}) == {"href": "https://api/offices"}
+    assert objects == {}
+
+
+def test_intern_keeps_last_object_per_id():
+    interner = DimensionInterner("bsale_stock")
+    assert interner.intern("office", {"id": 2, "name": "Tienda"}) == {"id": 2}
+    interner.update({"office": {2: {"id": 2, "name": "Tienda Centro"}}, "variant": {40: {"id": 40}}})
+
+    assert interner.objects["office"] == {2: {"id": 2, "name": "Tienda Centro"}}
+    assert interner.objects["variant"] == {40: {"id": 40}}
+
+
+def test_load_upserts_non_empty_dimensions(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        bigquery_sink, "upsert", lambda table, table_name, **kwargs: calls.append((table, table_name, kwargs))
+    )
+    interner = DimensionInterner("carga_diaria")
+    interner.intern("office", {"id": 2, "name": "Tienda"})
+    interner.intern("office", {"id": 5, "name": "Bodega"})
+    interner.load()
+
+    assert len(calls) == 1
+    table, table_name, kwargs = calls[0]
+    assert table_name == DIMENSION_TABLES["office"]
+    assert kwargs["key"] == ["id", "source"]
+    # Staging propio del extractor
+    assert kwargs["staging_table"] == f"{DIMENSION_TABLES['office']}_staging_carga_diaria"
+    assert sorted(table.column("id").to_pylist()) == [2, 5]
+    assert set(table.column("source").to_pylist()) == {"carga_diaria"}
+    assert json.loads(table.column("data").to_pylist()[0])["id"] in (2, 5)
@@ -0,0 +1,39 @@
+import pytest
+
+from common.fingerprint_store import FingerprintStore, fingerprint
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    yield store
+    store.close()
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_changed_reports_new_and_modified_keys(store):
+    store.update({1: "x", 2: "y"})
+
+    assert store.changed({1: "x", 2: "cambiado", 3: "nuevo"}) == [2, 3]
+    assert store.stored([1, 2, 3]) == {1: "x", 2: "y"}
+
+
+def test_update_replaces_and_delete_removes(store):
+    store.update({1: "x", 2: "y"})
+    store.update({1: "z"})
+    store.delete([2])
+
+    assert store.stored([1, 2]) == {1: "z"}
+    assert store.keys() == [1]
+    assert store.count() == 1
+
+
+def test_many_keys_are_queried_in_chunks(store):
+    store.update({key: str(key) for key in range(1200)})
+
+    assert len(store.stored(range(1500))) == 1200
+    assert store.changed({key: str(key) for key in range(1200)}) == []
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+from common.interval_manifest import IntervalManifest, PENDING, FETCHED, LOADED, FAILED
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    manifest = IntervalManifest(str(tmp_path / "manifest.sqlite"))
+    yield manifest
+    manifest.close()
+
+
+def test_reset_registers_pending_intervals(manifest):
+    manifest.reset([(1, 10), (11, 20)])
+    manifest.reset([(21, 30), (31, 40)])
+
+    assert manifest.ranges() == [(21, 30), (31, 40)]
+    assert manifest.ranges(states=(PENDING,)) == [(21, 30), (31, 40)]
+    assert manifest.summary() == {PENDING: {"intervals": 2, "rows": 0}}
+
+
+def test_state_transitions(manifest):
+    manifest.reset([(1, 10), (11, 20), (21, 30)])
+
+    manifest.mark(1, FETCHED, row_count=10, max_doc_id=10)
+    manifest.mark(11, FAILED, error="timeout")
+    assert manifest.ranges(states=(FETCHED,)) == [(1, 10)]
+    assert manifest.unfinished() == [(1, 10), (11, 20), (21, 30)]
+
+    manifest.mark_many([1], LOADED)
+    assert manifest.unfinished() == [(11, 20), (21, 30)]
+    assert manifest.max_loaded_id() == 10
+
+    # Un reintento exitoso limpia el error y conserva las filas ya registradas
+    manifest.mark(11, FETCHED, row_count=7)
+    manifest.mark_many([11], LOADED)
+    error = manifest.conn.execute("SELECT error FROM intervals WHERE firstid = 11").fetchone()[0]
+    assert error is None
+    assert manifest.summary()[LOADED] == {"intervals": 2, "rows": 17}
+
+
+def test_loaded_through_is_the_contiguous_prefix(manifest):
+    manifest.reset([(1, 10), (11, 20), (21, 30)])
+    assert manifest.loaded_through() is None
+
+    # Confirmado fuera de orden: el prefijo todavía no avanza
+    manifest.mark_many([11], LOADED)
+    assert manifest.loaded_through() is None
+
+    manifest.mark_many([1], LOADED)
+    assert manifest.loaded_through() == 20
+
+    manifest.mark_many([21], LOADED)
+    assert manifest.loaded_through() == 30
+
+
+def test_open_interval_uses_the_max_fetched_id(manifest):
+    manifest.reset([(1, 10)])
+    manifest.mark_many([1], LOADED)
+    manifest.add([(11, 20), (21, 520)], open_last=True)
+
+    assert manifest.open_ended() == {21}
+    assert manifest.ranges() == [(1, 10), (11, 20), (21, 520)]
+
+    manifest.mark(11, FETCHED, max_doc_id=20)
+    manifest.mark(21, FETCHED, max_doc_id=33)
+    manifest.mark_many([11, 21], LOADED)
+    assert manifest.loaded_through() == 33
+    assert manifest.max_loaded_id() == 33
+
+
+def test_add_keeps_loaded_history(manifest):
+    manifest.reset([(1, 10)])
+    manifest.mark_many([1], LOADED)
+    manifest.add([(11, 20)])
+
+    assert manifest.ranges(states=(LOADED,)) == [(1, 10)]
+    assert manifest.unfinished() == [(11, 20)]
+    assert manifest.open_ended() == set()
+
+
+def test_migrates_old_manifests(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE intervals (firstid INTEGER PRIMARY KEY, lastid INTEGER NOT NULL, "
+        "state TEXT NOT NULL, row_count INTEGER, error TEXT, updated_at TEXT NOT NULL)"
+    )
+    conn.execute("INSERT INTO intervals VALUES (1, 10, 'loaded', 10, NULL, '2024-01-01')")
+    conn.commit()
+    conn.close()
+
+    manifest = IntervalManifest(path)
+    try:
+        assert manifest.open_ended() == set()
+        assert manifest.loaded_through() == 10
+        assert manifest.max_loaded_id() is None
+    finally:
+        manifest.close()
@@ -0,0 +1,69 @@
+from common.interval_stats import IntervalObservation, IntervalStats, adapt_ranges
+
+MB = 1024 * 1024
+
+
+def metrics(latency, nbytes=0, detail_pages=0):
+    return {"latency": latency, "nbytes": nbytes, "detail_pages": detail_pages}
+
+
+def test_without_observations_ranges_are_unchanged():
+    ranges = [(1, 100), (101, 200)]
+    assert adapt_ranges(ranges, []) == ranges
+    assert adapt_ranges([], [(1, 100, metrics(1.0))]) == []
+
+
+def test_heavy_ranges_are_split():
+    observations = [(1, 100, metrics(4.0)), (101, 200, metrics(1.0))]
+    adapted = adapt_ranges([(1, 100), (101, 200)], observations, target_seconds=1.0)
+
+    assert adapted == [(1, 25), (26, 50), (51, 75), (76, 100), (101, 200)]
+
+
+def test_light_contiguous_ranges_are_merged():
+    observations = [(1, 400, metrics(1.0))]
+    ranges = [(1, 100), (101, 200), (201, 300), (301, 400)]
+
+    assert adapt_ranges(ranges, observations, target_seconds=0.5) == [(1, 200), (201, 400)]
+
+
+def test_non_contiguous_ranges_are_not_merged():
+    observations = [(1, 400, metrics(1.0))]
+    ranges = [(1, 100), (201, 300)]
+
+    assert adapt_ranges(ranges, observations, target_seconds=10.0) == ranges
+
+
+def test_bytes_and_detail_page_caps_split_ranges():
+    observations = [(1, 100, metrics(1.0, nbytes=10 * MB, detail_pages=3))]
+
+    by_bytes = adapt_ranges([(1, 100)], observations, target_seconds=10.0, max_bytes=5 * MB)
+    assert by_bytes == [(1, 50), (51, 100)]
+
+    by_pages = adapt_ranges([(1, 100)], observations, target_seconds=10.0, max_bytes=64 * MB, max_detail_pages=1)
+    assert by_pages == [(1, 34), (35, 68), (69, 100)]
+
+
+def test_unobserved_ranges_use_the_average_density():
+    observations = [(1, 100, metrics(2.0))]
+    adapted = adapt_ranges([(1, 100), (1001, 1100)], observations, target_seconds=1.0)
+
+    assert adapted == [(1, 50), (51, 100), (1001, 1050), (1051, 1100)]
+
+
+def test_new_observations_replace_overlapping_ones(tmp_path):
+    stats = IntervalStats(str(tmp_path / "stats.sqlite"))
+    try:
+        stats.record(IntervalObservation(1, 100).finish(rows=100))
+        stats.record(IntervalObservation(101, 200).finish(rows=100))
+        replacement = IntervalObservation(50, 150)
+        replacement.record_response(nbytes=2048)
+        replacement.record_detail_pages(3)
+        stats.record(replacement.finish(rows=80))
+
+        observations = stats.observations()
+        assert [(first, last) for first, last, _ in observations] == [(50, 150)]
+        assert observations[0][2]["nbytes"] == 2048
+        assert observations[0][2]["detail_pages"] == 3
+    finally:
+        stats.close()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from common.json_stream import JsonItemStream
+
+ITEMS = [
+    {"id": 1, "name": "Boleta electrónica", "details": {"items": [{"quantity": 1.5}]}},
+    {"id": 2, "note": "texto con \"comillas\", llaves {} y corchetes []"},
+    {"id": 3, "total": 12345678901234, "tags": []},
+]
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 1 << 20])
+def test_items_and_meta_with_any_chunk_size(size):
+    body = json.dumps({"count": 3, "items": ITEMS, "next": "https://api/next"}, ensure_ascii=False).encode("utf-8")
+    stream = JsonItemStream(chunked(body, size))
+
+    assert list(stream) == ITEMS
+    assert stream.meta == {"count": 3, "next": "https://api/next"}
+    assert stream.nbytes == len(body)
+
+
+def test_meta_before_the_array_is_available_while_iterating():
+    body = json.dumps({"count": 3, "limit": 50, "items": ITEMS}).encode("utf-8")
+    stream = JsonItemStream(chunked(body, 16))
+
+    first = next(iter(stream))
+    assert first == ITEMS[0]
+    assert stream.meta == {"count": 3, "limit": 50}
+
+
+def test_empty_responses():
+    assert list(JsonItemStream([b'{"count": 0, "items": []}'])) == []
+    assert list(JsonItemStream([b"{}"])) == []
+
+
+def test_numbers_cut_between_chunks():
+    body = b'{"items": [123456, 7.25], "count": 98765}'
+    stream = JsonItemStream(chunked(body, 3))
+
+    assert list(stream) == [123456, 7.25]
+    assert stream.meta == {"count": 98765}
+
+
+def test_other_arrays_stay_in_meta():
+    body = b'{"other": [1, 2], "items": [{"id": 1}]}'
+    stream = JsonItemStream([body], key="items")
+
+    assert list(stream) == [{"id": 1}]
+    assert stream.meta == {"other": [1, 2]}
+
+
+@pytest.mark.parametrize("body", [
+    b'{"items": [{"id": 1}, {"id"',
+    b'{"items": [{"id": 1}',
+    b'["no es un objeto"]',
+])
+def test_truncated_or_invalid_json_raises_value_error(body):
+    with pytest.raises(ValueError):
+        list(JsonItemStream(chunked(body, 5)))
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from common.pipeline import Pipeline
+
+
+def build(name="test"):
+    return Pipeline(name, report_seconds=3600)
+
+
+def test_items_flow_through_all_stages():
+    loaded = []
+    lock = threading.Lock()
+
+    def load(item):
+        with lock:
+            loaded.append(item)
+
+    pipeline = (
+        build()
+        .add_stage("double", lambda item: item * 2, workers=3)
+        .add_stage("load", load, workers=2)
+    )
+    pipeline.run(range(100))
+
+    assert sorted(loaded) == [item * 2 for item in range(100)]
+    assert pipeline.stages[0].stats.items_in == 100
+    assert pipeline.stages[1].stats.items_in == 100
+
+
+def test_none_results_are_not_emitted():
+    loaded = []
+    pipeline = (
+        build()
+        .add_stage("even", lambda item: item if item % 2 == 0 else None)
+        .add_stage("load", loaded.append)
+    )
+    pipeline.run(range(10))
+
+    assert loaded == [0, 2, 4, 6, 8]
+
+
+def test_fan_out_and_flush():
+    batch = []
+    loaded = []
+
+    def accumulate(item):
+        batch.append(item)
+        if len(batch) == 3:
+            full = list(batch)
+            batch.clear()
+            return full
+        return None
+
+    def flush():
+        return list(batch) or None
+
+    pipeline = (
+        build()
+        .add_stage("split", lambda item: [item, item], fan_out=True)
+        .add_stage("batch", accumulate, flush=flush)
+        .add_stage("load", loaded.append)
+    )
+    pipeline.run([1, 2])
+
+    # Cuatro elementos: un lote lleno de tres y el resto en el flush
+    assert loaded == [[1, 1, 2], [2]]
+
+
+def test_stage_error_stops_the_pipeline():
+    processed = []
+
+    def fail(item):
+        if item == 3:
+            raise ValueError("falla")
+        return item
+
+    pipeline = build().add_stage("fail", fail).add_stage("load", processed.append)
+    with pytest.raises(RuntimeError, match="falla"):
+        pipeline.run(range(1000))
+
+    assert pipeline.errors[0][0] == "fail"
+    assert len(processed) < 1000
+
+
+def test_stage_error_without_stop_discards_the_item():
+    processed = []
+
+    def fail(item):
+        if item == 3:
+            raise ValueError("falla")
+        processed.append(item)
+
+    pipeline = build().add_stage("load", fail, stop_on_error=False)
+    with pytest.raises(RuntimeError):
+        pipeline.run(range(10))
+
+    assert processed == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert pipeline.stages[0].stats.errors == 1
+
+
+def test_source_error_stops_the_pipeline():
+    def source():
+        yield 1
+        raise ConnectionError("paginación cortada")
+
+    pipeline = build().add_stage("load", lambda item: None)
+    with pytest.raises(RuntimeError, match="paginación cortada"):
+        pipeline.run(source())
+    assert pipeline.errors[0][0] == "source"
+
+
+def test_pipeline_without_stages():
+    with pytest.raises(ValueError):
+        build().run([1])
@@ -0,0 +1,104 @@
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+from google.cloud import bigquery
+
+from common import schemas
+from common.schemas import ARRAY, STRUCT
+
+VARIANT = STRUCT(("id", "INT64"), ("code", "STRING"), ("product", STRUCT(("id", "INT64"))))
+
+
+def test_conform_scalars():
+    assert schemas.conform("12", "INT64") == 12
+    assert schemas.conform("1.5", "FLOAT64") == 1.5
+    assert schemas.conform(7, "STRING") == "7"
+    assert schemas.conform(1, "BOOL") is True
+    assert schemas.conform(None, "INT64") is None
+    assert schemas.conform(float("nan"), "FLOAT64") is None
+
+
+def test_conform_struct_keeps_only_declared_fields():
+    value = {"id": "5", "code": "A-1", "href": "https://api", "product": {"id": 9, "name": "x"}}
+
+    assert schemas.conform(value, VARIANT) == {"id": 5, "code": "A-1", "product": {"id": 9}}
+    assert schemas.conform({}, VARIANT) == {"id": None, "code": None, "product": None}
+
+
+def test_conform_array_drops_nulls_and_defaults_to_empty():
+    assert schemas.conform([{"id": 1}, None, {"id": "2"}], ARRAY(STRUCT(("id", "INT64")))) == [{"id": 1}, {"id": 2}]
+    assert schemas.conform(None, ARRAY("INT64")) == []
+
+
+@pytest.mark.parametrize("value, spec", [
+    ("abc", "INT64"),
+    ("no es un objeto", VARIANT),
+    ({"id": 1}, ARRAY("INT64")),
+])
+def test_conform_rejects_wrong_types(value, spec):
+    with pytest.raises(ValueError):
+        schemas.conform(value, spec)
+
+
+def test_to_arrow_table_coerces_to_the_declared_schema():
+    df = pd.DataFrame([
+        {"id": "1", "ad_id": "10", "impressions": "100", "spend": "12.5", "date_start": "2024-03-01"},
+        {"id": "2", "ad_id": "11", "impressions": None, "spend": 3, "date_start": "2024-03-02"},
+    ])
+    table = schemas.to_arrow_table("meta_insights", df)
+
+    assert table.schema == schemas.arrow_schema("meta_insights")
+    assert table.column("impressions").to_pylist() == [100, None]
+    assert table.column("spend").to_pylist() == [12.5, 3.0]
+    assert table.column("date_start").to_pylist() == [datetime.date(2024, 3, 1), datetime.date(2024, 3, 2)]
+    # Las columnas declaradas que no vienen se cargan como NULL
+    assert table.column("date_stop").null_count == 2
+
+
+def test_to_arrow_table_with_nested_columns():
+    df = pd.DataFrame([{"id": 1, "document_type": {"id": "3", "name": "Boleta", "extra": 1}, "details": None}])
+    table = schemas.to_arrow_table("bsale_documents_nested", df)
+
+    assert table.column("document_type").to_pylist()[0]["id"] == 3
+    assert "extra" not in table.schema.field("document_type").type.names
+    assert isinstance(table.schema.field("details").type, pa.ListType)
+    assert table.column("details").to_pylist() == [[]]
+
+
+def test_to_arrow_table_rejects_undeclared_columns():
+    with pytest.raises(ValueError, match="no declaradas"):
+        schemas.to_arrow_table("meta_insights", pd.DataFrame([{"id": "1", "nueva": 1}]))
+
+
+def test_to_arrow_table_rejects_values_that_do_not_convert():
+    with pytest.raises(ValueError, match="no cumplen el esquema"):
+        schemas.to_arrow_table("meta_insights", pd.DataFrame([{"id": "1", "impressions": "muchas"}]))
+
+
+def test_bigquery_schema_matches_the_declaration():
+    fields = {field.name: field for field in schemas.bigquery_schema("bsale_documents_nested")}
+
+    assert fields["id"].field_type == "INTEGER"
+    assert fields["document_type"].field_type == "RECORD"
+    assert fields["details"].mode == "REPEATED"
+    with pytest.raises(KeyError):
+        schemas.bigquery_schema("tabla_sin_esquema")
+
+
+def test_schema_migration_detects_mismatched_columns():
+    from common.schema_migration import mismatched_columns
+
+    table = bigquery.Table("proyecto.dataset.meta_insights", schema=[
+        bigquery.SchemaField("id", "STRING"),
+        bigquery.SchemaField("spend", "FLOAT"),
+        bigquery.SchemaField("impressions", "STRING"),
+        bigquery.SchemaField("date_start", "STRING"),
+        bigquery.SchemaField("columna_vieja", "STRING"),
+    ])
+
+    assert mismatched_columns(table, "meta_insights") == {
+        "impressions": ("STRING", "INT64"),
+        "date_start": ("STRING", "DATE"),
+    }
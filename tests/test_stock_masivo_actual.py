@@ -0,0 +1,139 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from common import bigquery_sink
+from common.fingerprint_store import FingerprintStore
+from common.touched_variants import TouchedVariants
+
+
+@pytest.fixture
+def history(stock_masivo_actual, tmp_path, monkeypatch):
+    """Redirige los fingerprints a `tmp_path` y registra las cargas del historial."""
+    monkeypatch.setattr(stock_masivo_actual, "FINGERPRINTS_PATH", str(tmp_path / "fingerprints.sqlite"))
+    calls = {"staging": [], "close": []}
+
+    def truncate_replace(source, table_name, schema=None):
+        # El Parquet local se elimina al terminar, así que se lee aquí
+        table = pq.read_table(source) if isinstance(source, str) else source
+        calls["staging"].append((table_name, sorted(table.column("id").to_pylist())))
+
+    def close_and_append(staging_table, table_name, columns, valid_from, key="id", closed_keys=()):
+        calls["close"].append((staging_table, table_name, list(closed_keys)))
+
+    monkeypatch.setattr(bigquery_sink, "truncate_replace", truncate_replace)
+    monkeypatch.setattr(bigquery_sink, "close_and_append", close_and_append)
+    return calls
+
+
+def stock(stock_id, quantity):
+    return {
+        "id": stock_id, "quantity": quantity, "quantityReserved": 0.0, "quantityAvailable": quantity,
+        "variant": '{"id": 40}', "office": '{"id": 2}',
+    }
+
+
+def stored_fingerprints(stock_masivo_actual, ids):
+    store = FingerprintStore(stock_masivo_actual.FINGERPRINTS_PATH)
+    try:
+        return store.stored(ids)
+    finally:
+        store.close()
+
+
+def test_history_writes_only_changed_and_closes_removed(stock_masivo_actual, history):
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0), stock(2, 3.0)], [stock(3, 1.0)]])
+    assert history["staging"] == [("bsale_stock_history_staging", [1, 2, 3])]
+    assert history["close"] == [("bsale_stock_history_staging", "bsale_stock_history", [])]
+
+    # El stock 2 cambia y el 3 ya no viene en la foto
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0), stock(2, 4.0)]])
+    assert history["staging"][-1] == ("bsale_stock_history_staging", [2])
+    assert history["close"][-1][2] == [3]
+    assert set(stored_fingerprints(stock_masivo_actual, [1, 2, 3])) == {1, 2}
+
+
+def test_history_without_changes_skips_bigquery(stock_masivo_actual, history):
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0)]])
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0)]])
+
+    assert len(history["staging"]) == 1 and len(history["close"]) == 1
+
+
+def test_history_closes_removed_with_an_empty_staging(stock_masivo_actual, history):
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0), stock(2, 3.0)]])
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0)]])
+
+    assert history["staging"][-1] == ("bsale_stock_history_staging", [])
+    assert history["close"][-1][2] == [2]
+
+
+def test_history_keeps_fingerprints_when_the_load_fails(stock_masivo_actual, history, monkeypatch):
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0)]])
+    before = stored_fingerprints(stock_masivo_actual, [1])
+
+    def failing_close(*args, **kwargs):
+        raise RuntimeError("BigQuery no disponible")
+
+    monkeypatch.setattr(bigquery_sink, "close_and_append", failing_close)
+    with pytest.raises(RuntimeError):
+        stock_masivo_actual.load_stock_history([[stock(1, 8.0), stock(2, 1.0)]])
+
+    assert stored_fingerprints(stock_masivo_actual, [1, 2]) == before
+
+
+@pytest.fixture
+def targeted(stock_masivo_actual, tmp_path, monkeypatch):
+    """Cola de variantes en `tmp_path`, Bsale simulado y registro de los parches aplicados."""
+    path = str(tmp_path / "touched_variants.sqlite")
+    monkeypatch.setattr(stock_masivo_actual, "TouchedVariants", lambda: TouchedVariants(path))
+    monkeypatch.setattr(stock_masivo_actual, "INTERN_DIMENSIONS", False)
+    stocks = {
+        40: [{"id": 1, "quantity": 5.0, "quantityReserved": 0.0, "quantityAvailable": 5.0,
+              "variant": {"id": 40}, "office": {"id": 2}}],
+        41: [{"id": 2, "quantity": 1.0, "quantityReserved": 0.0, "quantityAvailable": 1.0,
+              "variant": {"id": 41}, "office": {"id": 2}}],
+    }
+    monkeypatch.setattr(
+        stock_masivo_actual, "fetch_variant_stocks", lambda variant_id, *args: stocks[variant_id]
+    )
+    patches = []
+    monkeypatch.setattr(stock_masivo_actual, "load_stock_patch", lambda df: patches.append(df))
+    queue = TouchedVariants(path)
+    yield queue, patches
+    queue.close()
+
+
+def test_targeted_refresh_patches_pending_variants(stock_masivo_actual, targeted):
+    queue, patches = targeted
+    queue.record("carga_diaria", [40, 41])
+
+    stock_masivo_actual.refresh_touched_stock(max_workers=2)
+
+    assert len(patches) == 1
+    assert sorted(patches[0]["id"]) == [1, 2]
+    assert queue.pending()[0] == []
+
+
+def test_targeted_refresh_keeps_the_queue_when_the_patch_fails(stock_masivo_actual, targeted, monkeypatch):
+    queue, _ = targeted
+    queue.record("carga_diaria", [40])
+
+    def failing_patch(df):
+        raise RuntimeError("BigQuery no disponible")
+
+    monkeypatch.setattr(stock_masivo_actual, "load_stock_patch", failing_patch)
+    with pytest.raises(RuntimeError):
+        stock_masivo_actual.refresh_touched_stock(max_workers=1)
+
+    assert queue.pending()[0] == [40]
+
+
+def test_stock_patch_in_history_mode_does_not_close_missing_stocks(stock_masivo_actual, history, monkeypatch):
+    monkeypatch.setattr(stock_masivo_actual, "STOCK_MODE", "history")
+    stock_masivo_actual.load_stock_history([[stock(1, 5.0), stock(2, 3.0)]])
+
+    stock_masivo_actual.load_stock_patch(pd.DataFrame([stock(2, 4.0)]))
+
+    assert history["staging"][-1] == ("bsale_stock_history_staging", [2])
+    assert history["close"][-1][2] == []
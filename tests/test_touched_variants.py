@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+import pytest
+
+from common import touched_variants
+from common.touched_variants import TouchedVariants, is_recent
+
+
+@pytest.fixture
+def touched(tmp_path):
+    store = TouchedVariants(str(tmp_path / "touched_variants.sqlite"))
+    yield store
+    store.close()
+
+
+def test_is_recent():
+    now = time.time()
+    assert is_recent(now - 3600, days=2)
+    assert not is_recent(now - 3 * 86400, days=2)
+    assert not is_recent(None)
+
+
+def test_pending_deduplicates_and_ignores_none(touched):
+    touched.record("carga_diaria", [41, 40, None, 41])
+    touched.record("recibos_stock", ["40", 7])
+
+    variant_ids, mark = touched.pending()
+    assert variant_ids == [7, 40, 41]
+    assert mark == 4
+
+
+def test_acknowledge_keeps_variants_recorded_after_the_mark(touched):
+    touched.record("carga_diaria", [40, 41])
+    variant_ids, mark = touched.pending()
+    # Llega una variante mientras corre el refresco
+    touched.record("consumo_stock", [41, 50])
+    touched.acknowledge(mark)
+
+    assert touched.pending()[0] == [41, 50]
+
+
+def test_record_touched_variants_does_not_fail_the_load(monkeypatch):
+    def unavailable():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(touched_variants, "TouchedVariants", unavailable)
+    touched_variants.record_touched_variants("carga_diaria", [40])